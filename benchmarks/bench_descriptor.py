@@ -0,0 +1,154 @@
+"""Benchmark suite of the descriptor stages.
+
+Times the neighbour search, the pair arrays and the Fortran kernel
+separately with pytest-benchmark, sweeping the number of atoms with and
+without periodic boundary conditions, the number of species, nmax and
+lmax. Without compression the kernel writes the output in place, so the
+post-processing, the compression of the kernel output chunk by chunk, is
+only timed with a compression recipe. Two peaks of every stage are stored in the
+extra_info of the benchmark: python_peak_mib from tracemalloc, which only
+sees Python and numpy allocations, and rss_peak_mib, the growth of the
+resident set size, which also includes the Fortran allocations of the
+kernel. rss_peak_mib is only recorded on Linux and is a lower bound when
+the allocator reuses memory freed by earlier stages. Run from this directory:
+
+    pytest                                 #quick sweep, results saved
+    TURBOSOAP_BENCH_FULL=1 pytest          #up to 100k atoms, nmax 12, lmax 25
+    pytest --benchmark-compare             #compare with the last saved run
+    pytest-benchmark compare 0001 0002     #compare two saved runs
+
+The results are saved under .benchmarks, see pytest.ini.
+"""
+import os
+import tracemalloc
+
+import numpy as np
+import pytest
+from ase import Atoms
+from dscribe.descriptors.turbosoap import TurboSOAPSpecie
+
+import turbosoap_dscribe
+from turbosoap_dscribe import (prepare_turbosoap_configuration, build_turbosoap_pairs,
+    compress_turbosoap_descriptor)
+from turbosoap_dscribe.neighbors import get_neighbor_list, get_periodic_neighbor_list
+
+FULL = os.environ.get("TURBOSOAP_BENCH_FULL", "") not in ("", "0")
+DENSITY = 0.08
+SPECIES = [1, 6, 7, 8, 16, 29, 47, 79]
+SIZES = [10, 100, 1000, 10000, 100000] if FULL else [10, 100, 1000]
+SPECIES_COUNTS = [1, 2, 4, 8] if FULL else [1, 4]
+NMAX = [4, 8, 12] if FULL else [4, 8]
+LMAX = [4, 8, 16, 25] if FULL else [4, 8]
+STAGES = ["neighbors", "pairs", "kernel"]
+
+def random_system(n_atoms, n_species, periodic, seed=0):
+    rng = np.random.default_rng(seed)
+    box = (n_atoms/DENSITY)**(1.0/3.0)
+    numbers = rng.choice(SPECIES[:n_species], n_atoms)
+    return Atoms(numbers=numbers, positions=rng.uniform(0.0, box, size=(n_atoms, 3)),
+        cell=np.eye(3)*box, pbc=periodic)
+
+class Stages:
+    """The steps of calculate_turbosoap_descriptor, callable one by one."""
+    def __init__(self, system, periodic, nmax=4, lmax=4, rcut=4.0, compression=None):
+        n_species = len(np.unique(system.numbers))
+        self.config = prepare_turbosoap_configuration(
+            [TurboSOAPSpecie(rcut=rcut, nmax=nmax) for _ in range(n_species)], lmax=lmax,
+            compression=compression)
+        self.system = system
+        self.periodic = periodic
+        self.species = np.searchsorted(np.unique(system.numbers), system.numbers)
+        self.rcuts = np.full(len(system), rcut)
+        #Inputs of the later stages
+        self.neighbors()
+        self.pairs()
+        self.kernel()
+
+    def neighbors(self):
+        if self.periodic:
+            self._neighbors = get_periodic_neighbor_list(self.system.positions, self.system.cell,
+                self.system.pbc, self.rcuts)
+        else:
+            self._neighbors = get_neighbor_list(self.system.positions, self.rcuts) + (None,)
+
+    def pairs(self):
+        n_neigh, neighbors, shifts = self._neighbors
+        self._pairs = build_turbosoap_pairs(self.system.positions, self.species, self.config['num_species'],
+            n_neigh, neighbors, shifts)
+
+    def kernel(self):
+        pairs = self._pairs
+        f_species = np.asfortranarray(pairs['species'][None, :] + 1, dtype=np.intc)
+        self._soap = np.zeros((self.config['num_kernel_components'], pairs['n_sites']), order='F')
+        turbosoap_dscribe._get_soap(self.config, pairs['n_neigh'], f_species, pairs['mask'], pairs['rjs'],
+            pairs['thetas'], pairs['phis'], False, self._soap, np.empty((1, 1, 1), order='F'))
+
+    def post(self):
+        #As calculate_turbosoap_from_pairs: the transposed view of each chunk
+        #of sites of the kernel output is compressed into rows of the output
+        n_soap, n_sites = self._soap.shape
+        max_sites = max(1, turbosoap_dscribe.CHUNK_VALUES // n_soap)
+        soap_m = np.empty((n_sites, self.config['num_components']))
+        for start in range(0, n_sites, max_sites):
+            stop = min(start + max_sites, n_sites)
+            soap_m[start:stop] = compress_turbosoap_descriptor(self.config, self._soap[:, start:stop].T)
+        return soap_m
+
+def proc_status(key):
+    #Value of a /proc/self/status entry in KiB
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(key + ":"):
+                return int(line.split()[1])
+
+def rss_peak(function):
+    #Peak growth of the resident set size while function runs, in MiB.
+    #Writing 5 to clear_refs resets the high-water mark VmHWM (Linux).
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return None
+    before = proc_status("VmRSS")
+    function()
+    return (proc_status("VmHWM") - before)/1024
+
+def run_stage(benchmark, stages, stage, **info):
+    function = getattr(stages, stage)
+    rss_peak_mib = rss_peak(function)
+    tracemalloc.start()
+    function()
+    python_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    benchmark.extra_info.update(info, stage=stage, python_peak_mib=python_peak/2**20,
+        rss_peak_mib=rss_peak_mib, n_atom_pairs=len(stages._pairs['rjs']))
+    benchmark(function)
+
+@pytest.mark.parametrize("stage", STAGES)
+@pytest.mark.parametrize("periodic", [False, True])
+@pytest.mark.parametrize("n_atoms", SIZES)
+def bench_size(benchmark, n_atoms, periodic, stage):
+    benchmark.group = f"size-{stage}"
+    stages = Stages(random_system(n_atoms, 2, periodic), periodic)
+    run_stage(benchmark, stages, stage, n_atoms=n_atoms, periodic=periodic)
+
+@pytest.mark.parametrize("stage", STAGES)
+@pytest.mark.parametrize("n_species", SPECIES_COUNTS)
+def bench_species(benchmark, n_species, stage):
+    benchmark.group = f"species-{stage}"
+    stages = Stages(random_system(1000, n_species, True), True)
+    run_stage(benchmark, stages, stage, n_species=n_species)
+
+@pytest.mark.parametrize("lmax", LMAX)
+@pytest.mark.parametrize("nmax", NMAX)
+def bench_basis(benchmark, nmax, lmax):
+    benchmark.group = "basis-kernel"
+    stages = Stages(random_system(100, 2, True), True, nmax=nmax, lmax=lmax)
+    run_stage(benchmark, stages, "kernel", nmax=nmax, lmax=lmax)
+
+@pytest.mark.parametrize("lmax", LMAX)
+def bench_compressed_post(benchmark, lmax):
+    benchmark.group = "compression-post"
+    stages = Stages(random_system(1000, 2, True), True, nmax=8, lmax=lmax,
+        compression={'lmax': lmax//2, 'nmax': [4, 4]})
+    run_stage(benchmark, stages, "post", lmax=lmax)
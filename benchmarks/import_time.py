@@ -0,0 +1,49 @@
+"""Import time of turbosoap_dscribe.
+
+Starts fresh interpreters which import numpy, turbosoap_dscribe, and
+turbosoap_dscribe followed by warmup, and reports the median wall time of
+each. The cost of a short-lived worker process is roughly the import plus
+warmup. Also lists the slowest modules imported with the package, from
+python -X importtime.
+
+    python benchmarks/import_time.py [n_repeats]
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+STATEMENTS = [
+    ("numpy", "import numpy"),
+    ("turbosoap_dscribe", "import turbosoap_dscribe"),
+    ("+ warmup", "import turbosoap_dscribe; turbosoap_dscribe.warmup()"),
+]
+
+def run(statement):
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", statement], check=True)
+    return time.perf_counter() - t0
+
+def slowest_modules(statement, n=10):
+    #-X importtime writes "import time: self [us] | cumulative | module"
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+        check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines()[1:]:
+        _, cumulative, module = line.split("|")
+        rows.append((int(cumulative), module.rstrip()))
+    return sorted(rows, reverse=True)[:n]
+
+def main(n_repeats):
+    #The first run also warms the file system cache
+    run(STATEMENTS[-1][1])
+    print(f"{'import':>18} {'time [ms]':>10}")
+    for name, statement in STATEMENTS:
+        elapsed = statistics.median(run(statement) for _ in range(n_repeats))
+        print(f"{name:>18} {1000*elapsed:>10.1f}")
+    print("slowest modules of import turbosoap_dscribe, cumulative [ms]:")
+    for cumulative, module in slowest_modules(STATEMENTS[1][1]):
+        print(f"{cumulative/1000:>10.1f} {module}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,70 @@
+"""Recall and speed of the approximate environment index.
+
+Builds an exact and an inverted file EnvironmentIndex over clustered
+random unit vectors, or over the descriptors of a DescriptorStore, and
+queries it with slightly perturbed copies of stored vectors, like new
+snapshots of known environments. Reports for an increasing number of
+probed lists the recall of the k nearest environments against exact
+search and the queries per second.
+
+    python benchmarks/index_recall.py [n_vectors] [n_lists]
+    python benchmarks/index_recall.py --store path [n_lists]
+"""
+import sys
+import time
+
+import numpy as np
+
+from turbosoap_dscribe.index import EnvironmentIndex
+from turbosoap_dscribe.store import DescriptorStore
+
+K = 10
+N_QUERIES = 1000
+N_COMPONENTS = 256
+
+def clustered(rng, n, n_clusters=50):
+    #Unit vectors around random centers, a stand-in for SOAP environments
+    centers = rng.normal(size=(n_clusters, N_COMPONENTS))
+    x = centers[rng.integers(0, n_clusters, n)] + rng.normal(size=(n, N_COMPONENTS))
+    return (x/np.linalg.norm(x, axis=1)[:, None]).astype(np.float32)
+
+def perturbed(rng, x, n):
+    queries = np.asarray(x[np.sort(rng.choice(len(x), n, replace=False))], dtype=float)
+    return queries + 0.01*np.abs(queries).mean()*rng.normal(size=queries.shape)
+
+def timed(function, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+def main(x, queries, n_lists):
+    exact = EnvironmentIndex(x.shape[1])
+    _, build = timed(exact.add, x)
+    (reference, _), elapsed = timed(exact.search, queries, k=K)
+    print(f"{len(x)} vectors, {len(queries)} queries, k={K}")
+    print(f"exact: add {build:.2f} s, {len(queries)/elapsed:.0f} queries/s")
+
+    index = EnvironmentIndex(x.shape[1], n_lists=n_lists)
+    _, train = timed(index.train, x)
+    _, build = timed(index.add, x)
+    print(f"{n_lists} lists: train {train:.2f} s, add {build:.2f} s")
+    print(f"{'n_probe':>8} {'recall':>7} {'queries/s':>10} {'speedup':>8}")
+    n_probe = 1
+    while n_probe <= n_lists:
+        (ids, _), probe_time = timed(index.search, queries, k=K, n_probe=n_probe)
+        recall = np.mean([len(np.intersect1d(a, b))/K for a, b in zip(ids, reference)])
+        print(f"{n_probe:>8} {recall:>7.3f} {len(queries)/probe_time:>10.0f} {elapsed/probe_time:>8.1f}")
+        n_probe *= 2
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    args = sys.argv[1:]
+    if args[:1] == ["--store"]:
+        descriptors = DescriptorStore(args[1]).descriptors
+        n_lists = int(args[2]) if len(args) > 2 else 256
+        main(descriptors, perturbed(rng, descriptors, N_QUERIES), n_lists)
+    else:
+        n_vectors = int(args[0]) if args else 200000
+        n_lists = int(args[1]) if len(args) > 1 else 256
+        x = clustered(rng, n_vectors)
+        main(x, perturbed(rng, x, N_QUERIES), n_lists)
@@ -0,0 +1,58 @@
+"""Benchmark of the neighbour search with per-species cutoffs.
+
+Compares the dscribe adjacency matrix with the largest cutoff followed by
+per-atom filtering against turbosoap_dscribe.neighbors.get_neighbor_list on
+random two-species cells where the minority species has a much larger
+cutoff. Reports wall time and peak traced memory.
+
+    python benchmarks/neighbor_list.py [n_atoms ...]
+"""
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from dscribe.utils.geometry import get_adjacency_matrix
+
+from turbosoap_dscribe import get_adjacency_list_rcut
+from turbosoap_dscribe.neighbors import get_neighbor_list
+
+DENSITY = 0.11
+RCUTS = np.array([3.7, 6.0])
+MINORITY_FRACTION = 0.05
+
+def random_cell(n_atoms, seed=0):
+    rng = np.random.default_rng(seed)
+    box = (n_atoms/DENSITY)**(1.0/3.0)
+    positions = rng.uniform(0.0, box, size=(n_atoms, 3))
+    species = (rng.uniform(size=n_atoms) < MINORITY_FRACTION).astype(int)
+    return positions, RCUTS[species]
+
+def adjacency_neighbor_list(positions, rcuts):
+    adj_m = get_adjacency_matrix(max(rcuts), positions, positions)
+    adj_l = get_adjacency_list_rcut(adj_m, rcuts)
+    return np.array([len(l) for l in adj_l]), np.concatenate(adj_l)
+
+def measure(function, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak/2**20
+
+def main(sizes):
+    print(f"{'n_atoms':>8} {'n_pairs':>10} {'adj [s]':>8} {'adj [MiB]':>10} "
+          f"{'native [s]':>10} {'native [MiB]':>12}")
+    for n_atoms in sizes:
+        positions, rcuts = random_cell(n_atoms)
+        reference, t_adj, m_adj = measure(adjacency_neighbor_list, positions, rcuts)
+        result, t_native, m_native = measure(get_neighbor_list, positions, rcuts)
+        np.testing.assert_array_equal(result[0], reference[0])
+        print(f"{n_atoms:>8} {len(result[1]):>10} {t_adj:>8.3f} {m_adj:>10.1f} "
+              f"{t_native:>10.3f} {m_native:>12.1f}")
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 50000, 100000]
+    main(sizes)
@@ -0,0 +1,81 @@
+"""Benchmark of the neighbour pair array construction.
+
+Compares the original per-pair Python loop of calculate_turbosoap_descriptor
+against get_neighbor_list + get_pair_arrays on random amorphous carbon like
+cells and reports the largest difference of the angles, which numpy and
+libm may round differently in the last bit.
+
+    python benchmarks/pair_arrays.py [n_atoms ...]
+"""
+import sys
+import time
+from math import sqrt, acos, atan2
+
+import numpy as np
+from dscribe.utils.geometry import get_adjacency_matrix
+
+from turbosoap_dscribe import get_adjacency_list_rcut, get_pair_arrays
+from turbosoap_dscribe.neighbors import get_neighbor_list
+
+DENSITY = 0.11 #atoms per cubic angstrom, roughly a-C at 2.2 g/cm^3
+RCUT = 3.7
+
+def random_cell(n_atoms, seed=0):
+    rng = np.random.default_rng(seed)
+    box = (n_atoms/DENSITY)**(1.0/3.0)
+    return rng.uniform(0.0, box, size=(n_atoms, 3))
+
+def loop_pair_arrays(positions, adj_m, rcuts, species, n_species):
+    #get_neighbor_list sorts the neighbours of each central atom
+    adj_l = [l[:1] + sorted(l[1:]) for l in get_adjacency_list_rcut(adj_m, rcuts)]
+    n_atom_pairs = sum(len(l) for l in adj_l)
+    rjs = np.empty(n_atom_pairs, dtype=float)
+    thetas = np.empty(n_atom_pairs, dtype=float)
+    phis = np.empty(n_atom_pairs, dtype=float)
+    mask = np.zeros((n_atom_pairs, n_species), order='F', dtype=np.int8)
+    idx = 0
+    for nl in adj_l:
+        rjs[idx] = 0.0
+        thetas[idx] = 0.0
+        phis[idx] = 0.0
+        mask[idx, species[nl[0]]] = True
+        idx += 1
+        cpos = positions[nl[0]]
+        for n in nl[1:]:
+            p = positions[n] - cpos
+            d = p*p
+            d = sqrt(d[0] + d[1] + d[2])
+            rjs[idx] = d
+            thetas[idx] = acos(p[2]/d)
+            phis[idx] = atan2(p[1], p[0])
+            mask[idx, species[n]] = True
+            idx += 1
+    return rjs, thetas, phis, mask
+
+def vectorized_pair_arrays(positions, rcuts, species, n_species):
+    n_neigh, neighbors = get_neighbor_list(positions, rcuts)
+    centers = np.repeat(np.arange(len(positions)), n_neigh)
+    vectors = positions[neighbors] - positions[centers]
+    return get_pair_arrays(vectors, n_neigh, species[neighbors], n_species)
+
+def main(sizes):
+    print(f"{'n_atoms':>8} {'n_pairs':>10} {'loop [s]':>10} {'vector [s]':>10} {'speedup':>8} {'max diff':>9}")
+    for n_atoms in sizes:
+        positions = random_cell(n_atoms)
+        species = np.zeros(n_atoms, dtype=int)
+        rcuts = np.full(n_atoms, RCUT)
+        adj_m = get_adjacency_matrix(RCUT, positions, positions)
+
+        t0 = time.perf_counter()
+        reference = loop_pair_arrays(positions, adj_m, rcuts, species, 1)
+        t1 = time.perf_counter()
+        result = vectorized_pair_arrays(positions, rcuts, species, 1)
+        t2 = time.perf_counter()
+
+        diff = max(np.abs(a - b).max() for a, b in zip(result, reference))
+        print(f"{n_atoms:>8} {len(result[0]):>10} {t1 - t0:>10.3f} {t2 - t1:>10.3f} "
+              f"{(t1 - t0)/(t2 - t1):>8.1f} {diff:>9.1e}")
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 5000, 20000, 50000]
+    main(sizes)
@@ -0,0 +1,66 @@
+"""Benchmark of periodic descriptors.
+
+Compares the previous approach, where the cell is replicated with
+get_extended_system and SOAP is computed for every replicated atom, against
+calculate_turbosoap_descriptor which only computes the original sites and
+takes the periodic images from lattice shifts. Reports wall time and peak
+traced memory and checks that the descriptors agree.
+
+    python benchmarks/periodic.py
+"""
+import time
+import tracemalloc
+
+import numpy as np
+from ase.build import bulk
+from dscribe.utils.geometry import get_extended_system
+
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor
+
+class Specie:
+    def __init__(self, rcut, nmax=8):
+        self.rcut = rcut
+        self.buffer = 0.5
+        self.nmax = nmax
+        self.atom_sigma_r = 0.5
+        self.atom_sigma_r_scaling = 0.0
+        self.atom_sigma_t = 0.5
+        self.atom_sigma_t_scaling = 0.0
+        self.amplitude_scaling = 1.0
+        self.radial_enhancement = 0
+        self.nf = 4.0
+        self.global_scaling = 1.0
+        self.central_weight = 1.0
+        self.debug_name = "C"
+
+def replicated_descriptor(config, system, atomic_numbers_to_indices, atomic_numbers_to_rcuts):
+    max_rcut = max(atomic_numbers_to_rcuts[n] for n in system.numbers)
+    extended = get_extended_system(system, max_rcut, return_cell_indices=False)
+    soap_m = calculate_turbosoap_descriptor(config, extended, False,
+        atomic_numbers_to_indices, atomic_numbers_to_rcuts)
+    return soap_m[0:len(system)]
+
+def measure(function, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak/2**20
+
+def main():
+    print(f"{'system':>16} {'rcut':>5} {'replicated [s]':>14} {'[MiB]':>8} "
+          f"{'shifts [s]':>10} {'[MiB]':>8} {'max diff':>9}")
+    for repeat in [1, 2, 4]:
+        for rcut in [4.0, 6.0]:
+            system = bulk("C", "diamond", a=3.57, cubic=True).repeat(repeat)
+            config = prepare_turbosoap_configuration([Specie(rcut)], lmax=8)
+            args = (config, system, {6: 0}, {6: rcut})
+            reference, t_old, m_old = measure(replicated_descriptor, *args)
+            result, t_new, m_new = measure(calculate_turbosoap_descriptor, config, system, True, {6: 0}, {6: rcut})
+            print(f"{'C' + str(len(system)):>16} {rcut:>5.1f} {t_old:>14.3f} {m_old:>8.1f} "
+                  f"{t_new:>10.3f} {m_new:>8.1f} {np.abs(result - reference).max():>9.1e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Benchmark of the per-call cost for small molecules.
+
+Compares calculate_turbosoap_descriptor against a reused
+turbosoap_dscribe.compiled.TurboSOAPDescriptor on a stream of rattled
+small organic molecules. Reports the mean time per call. Needs the
+compiled turbosoap_ext.
+
+    python benchmarks/small_molecules.py [n_calls]
+"""
+import sys
+import time
+
+import numpy as np
+from ase.build import molecule
+from dscribe.descriptors.turbosoap import TurboSOAPSpecie
+
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor
+from turbosoap_dscribe.compiled import TurboSOAPDescriptor
+
+NAMES = ["CH4", "H2O", "CH3CH2OH", "CH3COOH", "C6H6", "CH3OCH3"]
+RCUTS = {1: 3.0, 6: 3.5, 8: 3.5}
+
+def molecules(n_calls):
+    systems = []
+    for i in range(n_calls):
+        system = molecule(NAMES[i % len(NAMES)])
+        system.rattle(0.05, seed=i)
+        systems.append(system)
+    return systems
+
+def per_call(function, systems):
+    t0 = time.perf_counter()
+    results = [function(system) for system in systems]
+    return results, (time.perf_counter() - t0)/len(systems)
+
+def main(n_calls):
+    species = [TurboSOAPSpecie(rcut=rcut, nmax=4) for rcut in RCUTS.values()]
+    config = prepare_turbosoap_configuration(species, lmax=4)
+    a2i = {number: i for i, number in enumerate(RCUTS)}
+    systems = molecules(n_calls)
+
+    reference, t_function = per_call(
+        lambda system: calculate_turbosoap_descriptor(config, system, False, a2i, RCUTS), systems)
+    descriptor = TurboSOAPDescriptor(config, a2i, RCUTS)
+    result, t_compiled = per_call(descriptor.calculate, systems)
+    for soap_m, ref in zip(result, reference):
+        np.testing.assert_array_equal(soap_m, ref)
+    print(f"{'function [us]':>14} {'compiled [us]':>14} {'speedup':>8}")
+    print(f"{t_function*1e6:>14.1f} {t_compiled*1e6:>14.1f} {t_function/t_compiled:>8.2f}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,46 @@
+"""Benchmark of the thread-parallel kernel on one large structure.
+
+Times calculate_turbosoap_descriptor on a rattled copper supercell with an
+increasing number of threads, checks that the threads give the serial
+result and reports the speedup over one thread. Needs turbosoap_ext built
+from turbosoap_ext.pyf, which releases the GIL in get_soap. n_threads > 1
+is opt-in, run this and TestCompiledThreads against a build first.
+
+    python benchmarks/threads.py [n_atoms] [n_threads ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from ase.build import bulk
+from dscribe.descriptors.turbosoap import TurboSOAPSpecie
+
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor
+
+def supercell(n_atoms):
+    n = max(1, round((n_atoms/4)**(1.0/3.0)))
+    system = bulk('Cu', 'fcc', a=3.6, cubic=True).repeat(n)
+    system.rattle(0.05, seed=0)
+    return system
+
+def main(n_atoms, thread_counts):
+    config = prepare_turbosoap_configuration([TurboSOAPSpecie(rcut=4.5, nmax=8)], lmax=8)
+    system = supercell(n_atoms)
+    print(f"{len(system)} atoms")
+    print(f"{'n_threads':>9} {'time [s]':>9} {'speedup':>8}")
+    reference = None
+    for n_threads in thread_counts:
+        t0 = time.perf_counter()
+        soap_m = calculate_turbosoap_descriptor(config, system, True, {29: 0}, {29: 4.5},
+            n_threads=n_threads)
+        elapsed = time.perf_counter() - t0
+        if reference is None:
+            reference = (soap_m, elapsed)
+        np.testing.assert_array_equal(soap_m, reference[0])
+        print(f"{n_threads:>9} {elapsed:>9.2f} {reference[1]/elapsed:>8.2f}")
+
+if __name__ == "__main__":
+    n_atoms = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    thread_counts = [int(a) for a in sys.argv[2:]] or sorted({1, 2, 4, os.cpu_count()})
+    main(n_atoms, thread_counts)
@@ -5,6 +5,7 @@ from distutils.core import setup
 try:
     from numpy.distutils.core import Extension
     from numpy.distutils.core import setup
+    from numpy.distutils.command.build_ext import build_ext
 except ImportError:
     raise RuntimeError('Numpy Needs to be installed '
                   'for extensions')
@@ -30,9 +31,27 @@ turbosoap_ext = Extension(name='turbosoap_ext',
             'turbogap/src/soap.f90' ,
         ],
         libraries=libraries,
-        library_dirs=library_dirs
+        library_dirs=library_dirs,
     )
 
+#get_soap is called from several threads with the GIL released
+#(threadsafe in turbosoap_ext.pyf), so local variables must not be static.
+#The flag depends on the Fortran compiler.
+RECURSIVE_FLAGS = {
+    'gnu95': ['-frecursive'],
+    'intel': ['-recursive'],
+    'intelem': ['-recursive'],
+    'pg': ['-Mrecursive'],
+    'flang': ['-Mrecursive'],
+    'nv': ['-Mrecursive'],
+}
+
+class build_ext_recursive(build_ext):
+    def build_extension(self, ext):
+        if self._f90_compiler is not None:
+            ext.extra_f90_compile_args = RECURSIVE_FLAGS.get(self._f90_compiler.compiler_type, [])
+        super().build_extension(ext)
+
 
 if __name__ == "__main__":
     setup(name="turbosoap_dscribe",
@@ -42,6 +61,7 @@ if __name__ == "__main__":
     long_description="An optional dependency of DScribe which provides TurboSOAP machine learning descriptor",
     packages=find_packages(),
     ext_modules=[turbosoap_ext],
+    cmdclass={'build_ext': build_ext_recursive},
     setup_requires=["numpy"],
     install_requires=["dscribe"]
     )
@@ -0,0 +1,67 @@
+import unittest
+
+from dscribe.descriptors.turbosoap import TurboSOAPSpecie
+import numpy as np
+from ase.build import molecule
+
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor
+import turbosoap_dscribe.batch
+from turbosoap_dscribe.batch import calculate_turbosoap_descriptors
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.config = prepare_turbosoap_configuration(
+            [TurboSOAPSpecie(rcut=3.0, nmax=4), TurboSOAPSpecie(rcut=3.5, nmax=4)], lmax=4)
+        self.atomic_numbers_to_indices = {1: 0, 8: 1}
+        self.atomic_numbers_to_rcuts = {1: 3.0, 8: 3.5}
+        self.systems = []
+        for i in range(7):
+            system = molecule("H2O" if i % 2 else "H2O2")
+            system.rattle(0.05, seed=i)
+            self.systems.append(system)
+
+    def reference(self):
+        return [calculate_turbosoap_descriptor(self.config, system, False,
+            self.atomic_numbers_to_indices, self.atomic_numbers_to_rcuts) for system in self.systems]
+
+    def assertMatchesReference(self, soap, offsets):
+        reference = self.reference()
+        self.assertEqual(len(offsets), len(self.systems) + 1)
+        self.assertEqual(soap.shape, (sum(len(s) for s in self.systems), self.config['num_components']))
+        for i, soap_m in enumerate(reference):
+            np.testing.assert_array_equal(soap[offsets[i]:offsets[i+1]], soap_m)
+
+    def testSerial(self):
+        result = calculate_turbosoap_descriptors(self.config, self.systems, False,
+            self.atomic_numbers_to_indices, self.atomic_numbers_to_rcuts, n_jobs=1, chunk_atoms=5)
+        self.assertMatchesReference(*result)
+        #The worker state of the calling process is not touched
+        self.assertIsNone(turbosoap_dscribe.batch._worker_args)
+
+    def testProcessPool(self):
+        result = calculate_turbosoap_descriptors(self.config, iter(self.systems), False,
+            self.atomic_numbers_to_indices, self.atomic_numbers_to_rcuts, n_jobs=2, chunk_atoms=5)
+        self.assertMatchesReference(*result)
+
+    def testEmpty(self):
+        soap, offsets = calculate_turbosoap_descriptors(self.config, [], False,
+            self.atomic_numbers_to_indices, self.atomic_numbers_to_rcuts, n_jobs=2)
+        self.assertEqual(soap.shape, (0, self.config['num_components']))
+        np.testing.assert_array_equal(offsets, [0])
+
+    def testAverage(self):
+        reference = self.reference()
+        soap, offsets = calculate_turbosoap_descriptors(self.config, self.systems, False,
+            self.atomic_numbers_to_indices, self.atomic_numbers_to_rcuts, n_jobs=2, chunk_atoms=5,
+            average='outer', dtype=np.float32)
+        np.testing.assert_array_equal(offsets, np.arange(len(self.systems) + 1))
+        self.assertEqual(soap.dtype, np.float32)
+        np.testing.assert_allclose(soap, [soap_m.mean(axis=0) for soap_m in reference], rtol=1e-6)
+        soap, offsets = calculate_turbosoap_descriptors(self.config, self.systems, False,
+            self.atomic_numbers_to_indices, self.atomic_numbers_to_rcuts, n_jobs=1, average='species')
+        self.assertEqual(soap.shape, (len(self.systems), 2*self.config['num_components']))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from dscribe.descriptors.turbosoap import TurboSOAPSpecie
+import numpy as np
+from ase.build import molecule
+
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor
+from turbosoap_dscribe.cache import DescriptorCache, get_config_hash
+
+
+class TestDescriptorCache(unittest.TestCase):
+    def setUp(self):
+        self.species = [TurboSOAPSpecie(rcut=3.0, nmax=4), TurboSOAPSpecie(rcut=3.5, nmax=4)]
+        self.config = prepare_turbosoap_configuration(self.species, lmax=4)
+        self.maps = ({1: 0, 8: 1}, {1: 3.0, 8: 3.5})
+        self.systems = []
+        for i in range(3):
+            system = molecule("H2O" if i % 2 else "H2O2")
+            system.rattle(0.05, seed=i)
+            self.systems.append(system)
+        #Size of the largest result
+        self.nbytes = 4*self.config['num_components']*8
+
+    def testMemoryTier(self):
+        cache = DescriptorCache(max_bytes=2*self.nbytes)
+        for system in self.systems + self.systems[::-1]:
+            soap_m = cache.calculate(self.config, system, False, *self.maps)
+            np.testing.assert_array_equal(soap_m,
+                calculate_turbosoap_descriptor(self.config, system, False, *self.maps))
+            self.assertFalse(soap_m.flags.writeable)
+        #The last two calculated are still there, the first one was evicted
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+        self.assertLessEqual(cache.memory_bytes, cache.max_bytes)
+        cache.clear()
+        self.assertEqual((cache.hits, cache.misses, cache.memory_bytes), (0, 0, 0))
+
+    def testKeys(self):
+        cache = DescriptorCache()
+        system = self.systems[0]
+        key = cache.get_key(self.config, system, False, *self.maps)
+        self.assertEqual(key, cache.get_key(self.config, system.copy(), False, *self.maps))
+        self.assertNotEqual(key, cache.get_key(self.config, system, True, *self.maps))
+        self.assertNotEqual(key, cache.get_key(self.config, system, False, self.maps[0], {1: 3.0, 8: 3.0}))
+        moved = system.copy()
+        moved.positions[0, 2] += 1e-8
+        self.assertNotEqual(key, cache.get_key(self.config, moved, False, *self.maps))
+        species = [TurboSOAPSpecie(rcut=3.0, nmax=4), TurboSOAPSpecie(rcut=3.5, nmax=4, atom_sigma_r=0.6)]
+        other = prepare_turbosoap_configuration(species, lmax=4)
+        self.assertNotEqual(get_config_hash(self.config), get_config_hash(other))
+        self.assertEqual(get_config_hash(self.config),
+            get_config_hash(prepare_turbosoap_configuration(self.species, lmax=4)))
+
+    def testDiskTier(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = DescriptorCache(max_bytes=0, directory=tmpdir)
+            for system in self.systems:
+                cache.calculate(self.config, system, False, *self.maps)
+            self.assertEqual(len(os.listdir(tmpdir)), 3)
+
+            #A new cache finds the entries of the earlier one
+            cache = DescriptorCache(directory=tmpdir)
+            soap_m = cache.calculate(self.config, self.systems[1], False, *self.maps)
+            np.testing.assert_array_equal(soap_m,
+                calculate_turbosoap_descriptor(self.config, self.systems[1], False, *self.maps))
+            cache.calculate(self.config, self.systems[1], False, *self.maps)
+            self.assertEqual((cache.disk_hits, cache.hits, cache.misses), (1, 1, 0))
+
+            #Shrinking the disk tier removes the least recently used entries
+            cache = DescriptorCache(directory=tmpdir, max_disk_bytes=cache.disk_bytes - 1)
+            self.assertEqual(len(os.listdir(tmpdir)), 2)
+            self.assertLessEqual(cache.disk_bytes, cache.max_disk_bytes)
+            cache.calculate(self.config, self.systems[1], False, *self.maps)
+            self.assertEqual(cache.disk_hits, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from dscribe.descriptors.turbosoap import TurboSOAPSpecie
+import numpy as np
+from ase.build import molecule, bulk
+
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor
+from turbosoap_dscribe.compiled import TurboSOAPDescriptor, Workspace
+
+
+class TestTurboSOAPDescriptor(unittest.TestCase):
+    def setUp(self):
+        self.species = [TurboSOAPSpecie(rcut=3.0, nmax=4), TurboSOAPSpecie(rcut=3.5, nmax=4)]
+        self.config = prepare_turbosoap_configuration(self.species, lmax=4)
+        self.maps = ({1: 0, 8: 1}, {1: 3.0, 8: 3.5})
+
+    def testMatchesFunction(self):
+        descriptor = TurboSOAPDescriptor(self.config, *self.maps)
+        #Growing and shrinking systems reuse the same workspace
+        for i, name in enumerate(["H2O2", "H2O", "H2O2", "H2"]):
+            system = molecule(name)
+            system.rattle(0.05, seed=i)
+            soap_m = descriptor.calculate(system)
+            np.testing.assert_array_equal(soap_m,
+                calculate_turbosoap_descriptor(self.config, system, False, *self.maps))
+        #Earlier results are not overwritten by later calls
+        first = descriptor.calculate(molecule("H2O"))
+        descriptor.calculate(molecule("H2O2"))
+        np.testing.assert_array_equal(first,
+            calculate_turbosoap_descriptor(self.config, molecule("H2O"), False, *self.maps))
+
+    def testCompressionAndDerivatives(self):
+        config = prepare_turbosoap_configuration(self.species, lmax=4, compression={'lmax': 2})
+        descriptor = TurboSOAPDescriptor(config, *self.maps)
+        system = molecule("H2O2")
+        soap_m, der = descriptor.calculate(system, derivatives=True)
+        ref_soap_m, ref_der = calculate_turbosoap_descriptor(config, system, False, *self.maps,
+            derivatives=True)
+        np.testing.assert_array_equal(soap_m, ref_soap_m)
+        np.testing.assert_array_equal(der['soap_cart_der'], ref_der['soap_cart_der'])
+
+    def testPeriodic(self):
+        config = prepare_turbosoap_configuration([TurboSOAPSpecie(rcut=3.0, nmax=4)], lmax=4)
+        system = bulk('Cu', 'fcc', a=3.6, cubic=True)
+        system.rattle(0.05, seed=2)
+        descriptor = TurboSOAPDescriptor(config, {29: 0}, {29: 3.0}, periodic=True)
+        np.testing.assert_array_equal(descriptor.calculate(system),
+            calculate_turbosoap_descriptor(config, system, True, {29: 0}, {29: 3.0}))
+
+    def testUnknownSpecies(self):
+        descriptor = TurboSOAPDescriptor(self.config, *self.maps)
+        for name in ["CO", "NH3"]:
+            with self.assertRaises(ValueError):
+                descriptor.calculate(molecule(name))
+        with self.assertRaises(ValueError):
+            TurboSOAPDescriptor(self.config, {1: 0}, {1: 3.0})
+
+    def testWorkspace(self):
+        workspace = Workspace()
+        a = workspace.empty('a', (3, 4))
+        self.assertTrue(a.flags.f_contiguous)
+        nbytes = workspace.nbytes
+        b = workspace.empty('a', (2, 5))
+        self.assertEqual(workspace.nbytes, nbytes)
+        self.assertTrue(np.shares_memory(a, b))
+        workspace.empty('a', (5, 5))
+        self.assertGreater(workspace.nbytes, nbytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,301 @@
+import importlib.machinery
+import importlib.util
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from dscribe.descriptors.turbosoap import TurboSOAPSpecie
+import numpy as np
+from ase.build import molecule, bulk
+
+import turbosoap_dscribe
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor, get_num_features
+from turbosoap_dscribe.compression import get_component_labels
+
+from systems import CuAgTestCase
+
+
+class TestDerivatives(unittest.TestCase):
+    def setUp(self):
+        self.config = prepare_turbosoap_configuration(
+            [TurboSOAPSpecie(rcut=3.0, nmax=4), TurboSOAPSpecie(rcut=3.5, nmax=4)], lmax=4)
+        self.maps = ({1: 0, 8: 1}, {1: 3.0, 8: 3.5})
+        self.water = molecule("H2O")
+        self.water.rattle(0.05, seed=1)
+
+    def testLayout(self):
+        soap_m, der = calculate_turbosoap_descriptor(self.config, self.water, False, *self.maps,
+            derivatives=True)
+        n_atom_pairs = len(der['centers'])
+        self.assertEqual(der['soap_cart_der'].shape, (n_atom_pairs, self.config['num_components'], 3))
+        self.assertEqual(len(der['neighbors']), n_atom_pairs)
+        #Three atoms all within each others cutoffs
+        self.assertEqual(n_atom_pairs, 9)
+        np.testing.assert_array_equal(
+            calculate_turbosoap_descriptor(self.config, self.water, False, *self.maps), soap_m)
+
+    def testFiniteDifferences(self):
+        soap_m, der = calculate_turbosoap_descriptor(self.config, self.water, False, *self.maps,
+            derivatives=True)
+        h = 1e-5
+        for k, (i, j) in enumerate(zip(der['centers'], der['neighbors'])):
+            for c in range(3):
+                plus = self.water.copy()
+                plus.positions[j, c] += h
+                minus = self.water.copy()
+                minus.positions[j, c] -= h
+                numerical = (calculate_turbosoap_descriptor(self.config, plus, False, *self.maps)[i]
+                    - calculate_turbosoap_descriptor(self.config, minus, False, *self.maps)[i])/(2*h)
+                np.testing.assert_allclose(der['soap_cart_der'][k, :, c], numerical, atol=1e-6)
+
+    def testTranslationInvariance(self):
+        config = prepare_turbosoap_configuration([TurboSOAPSpecie(rcut=3.0, nmax=4)], lmax=4)
+        cu_fcc = bulk('Cu', 'fcc', a=3.6, cubic=True)
+        cu_fcc.rattle(0.05, seed=2)
+        soap_m, der = calculate_turbosoap_descriptor(config, cu_fcc, True, {29: 0}, {29: 3.0},
+            derivatives=True)
+        #Moving all atoms together does not change any descriptor
+        total = np.zeros(soap_m.shape + (3,))
+        np.add.at(total, der['centers'], der['soap_cart_der'])
+        np.testing.assert_allclose(total, 0.0, atol=1e-10)
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.species = [TurboSOAPSpecie(rcut=3.0, nmax=3), TurboSOAPSpecie(rcut=3.5, nmax=4)]
+        self.maps = ({1: 0, 8: 1}, {1: 3.0, 8: 3.5})
+        self.system = molecule("H2O2")
+        full_config = prepare_turbosoap_configuration(self.species, lmax=4)
+        self.full = calculate_turbosoap_descriptor(full_config, self.system, False, *self.maps)
+        self.n1, self.n2, self.l = get_component_labels([3, 4], 4)
+
+    def compressed(self, compression):
+        config = prepare_turbosoap_configuration(self.species, lmax=4, compression=compression)
+        soap_m = calculate_turbosoap_descriptor(config, self.system, False, *self.maps)
+        self.assertEqual(soap_m.shape, (len(self.system), config['num_components']))
+        self.assertEqual(config['num_kernel_components'], self.full.shape[1])
+        return soap_m
+
+    def testTruncation(self):
+        soap_m = self.compressed({'lmax': 2, 'nmax': [2, 4]})
+        keep = (self.l <= 2) & (self.n1 != 2) & (self.n2 != 2)
+        np.testing.assert_array_equal(soap_m, self.full[:, keep])
+
+    def testSpeciesPairs(self):
+        soap_m = self.compressed({'species_pairs': [(1, 0)]})
+        keep = (self.n1 < 3) & (self.n2 >= 3)
+        np.testing.assert_array_equal(soap_m, self.full[:, keep])
+
+    def testProjectionInChunks(self):
+        rng = np.random.default_rng(0)
+        keep = self.l <= 3
+        projection = rng.normal(size=(keep.sum(), 10))
+        chunk_values = turbosoap_dscribe.CHUNK_VALUES
+        turbosoap_dscribe.CHUNK_VALUES = 1
+        try:
+            soap_m = self.compressed({'lmax': 3, 'projection': projection})
+        finally:
+            turbosoap_dscribe.CHUNK_VALUES = chunk_values
+        np.testing.assert_allclose(soap_m, self.full[:, keep] @ projection, atol=1e-12)
+
+    def testInvalid(self):
+        with self.assertRaises(ValueError):
+            prepare_turbosoap_configuration(self.species, lmax=4, compression={'lmax': 5})
+        with self.assertRaises(ValueError):
+            prepare_turbosoap_configuration(self.species, lmax=4, compression={'nmax': [4, 4]})
+        with self.assertRaises(ValueError):
+            prepare_turbosoap_configuration(self.species, lmax=4, compression={'species_pairs': [(0, 2)]})
+        with self.assertRaises(ValueError):
+            prepare_turbosoap_configuration(self.species, lmax=4, compression={'projection': np.eye(3)})
+
+
+class TestThreads(CuAgTestCase):
+    REPEAT = 3
+    SEED = 3
+
+    def assertSameWithThreads(self, config):
+        reference = calculate_turbosoap_descriptor(config, self.system, True, *self.maps, derivatives=True)
+        for n_threads in [2, 5, None]:
+            soap_m, der = calculate_turbosoap_descriptor(config, self.system, True, *self.maps,
+                derivatives=True, n_threads=n_threads)
+            np.testing.assert_array_equal(soap_m, reference[0])
+            np.testing.assert_array_equal(der['soap_cart_der'], reference[1]['soap_cart_der'])
+
+    def testChunks(self):
+        self.assertSameWithThreads(prepare_turbosoap_configuration(self.species, lmax=3))
+
+    def testCompressedChunks(self):
+        config = prepare_turbosoap_configuration(self.species, lmax=3, compression={'lmax': 2})
+        chunk_values = turbosoap_dscribe.CHUNK_VALUES
+        turbosoap_dscribe.CHUNK_VALUES = 5*config['num_kernel_components']
+        try:
+            self.assertSameWithThreads(config)
+        finally:
+            turbosoap_dscribe.CHUNK_VALUES = chunk_values
+
+    def testInvalid(self):
+        config = prepare_turbosoap_configuration(self.species, lmax=3)
+        with self.assertRaises(ValueError):
+            calculate_turbosoap_descriptor(config, self.system, True, *self.maps, n_threads=0)
+
+
+def compiled_extension():
+    #Whether turbosoap_ext is the f2py extension, not a Python stand-in
+    spec = importlib.util.find_spec("turbosoap_ext")
+    return spec is not None and spec.origin.endswith(tuple(importlib.machinery.EXTENSION_SUFFIXES))
+
+
+@unittest.skipUnless(compiled_extension(), "needs the compiled turbosoap_ext")
+class TestCompiledThreads(CuAgTestCase):
+    """Concurrent get_soap calls of the compiled kernel give the serial result."""
+    REPEAT = 4
+    SEED = 3
+
+    def testThreads(self):
+        config = prepare_turbosoap_configuration(self.species, lmax=4)
+        reference = calculate_turbosoap_descriptor(config, self.system, True, *self.maps, derivatives=True)
+        for _ in range(3):
+            soap_m, der = calculate_turbosoap_descriptor(config, self.system, True, *self.maps,
+                derivatives=True, n_threads=8)
+            np.testing.assert_array_equal(soap_m, reference[0])
+            np.testing.assert_array_equal(der['soap_cart_der'], reference[1]['soap_cart_der'])
+
+    def testConfigurations(self):
+        #Threaded calls with different configurations at the same time
+        configs = [prepare_turbosoap_configuration(self.species, lmax=lmax) for lmax in [3, 5]]
+        references = [calculate_turbosoap_descriptor(config, self.system, True, *self.maps)
+            for config in configs]
+        def calculate(config):
+            return calculate_turbosoap_descriptor(config, self.system, True, *self.maps, n_threads=4)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(calculate, configs*4))
+        for i, soap_m in enumerate(results):
+            np.testing.assert_array_equal(soap_m, references[i % 2])
+
+
+class TestOutput(CuAgTestCase):
+    REPEAT = 2
+    SEED = 4
+
+    def testInPlace(self):
+        config = prepare_turbosoap_configuration(self.species, lmax=3)
+        reference = calculate_turbosoap_descriptor(config, self.system, True, *self.maps)
+        self.assertTrue(reference.flags.c_contiguous)
+        self.assertTrue(reference.flags.owndata)
+        #Rows of a larger array, written by the kernel directly
+        out = np.full((len(self.system) + 2, config['num_components']), np.nan)
+        soap_m = calculate_turbosoap_descriptor(config, self.system, True, *self.maps, out=out[1:-1])
+        self.assertIs(soap_m.base, out)
+        np.testing.assert_array_equal(out[1:-1], reference)
+        self.assertTrue(np.isnan(out[[0, -1]]).all())
+        #Strided output is filled through the chunked path
+        out = np.empty((config['num_components'], len(self.system))).T
+        calculate_turbosoap_descriptor(config, self.system, True, *self.maps, out=out)
+        np.testing.assert_array_equal(out, reference)
+
+    def testFloat32(self):
+        for compression in [None, {'lmax': 2}]:
+            config = prepare_turbosoap_configuration(self.species, lmax=3, compression=compression)
+            reference, reference_der = calculate_turbosoap_descriptor(config, self.system, True, *self.maps,
+                derivatives=True)
+            soap_m, der = calculate_turbosoap_descriptor(config, self.system, True, *self.maps,
+                derivatives=True, dtype=np.float32, n_threads=2)
+            self.assertEqual(soap_m.dtype, np.float32)
+            self.assertEqual(der['soap_cart_der'].dtype, np.float32)
+            np.testing.assert_array_equal(soap_m, reference.astype(np.float32))
+            np.testing.assert_array_equal(der['soap_cart_der'], reference_der['soap_cart_der'].astype(np.float32))
+            out = np.empty_like(soap_m)
+            calculate_turbosoap_descriptor(config, self.system, True, *self.maps, out=out)
+            np.testing.assert_array_equal(out, soap_m)
+
+    def testInvalid(self):
+        config = prepare_turbosoap_configuration(self.species, lmax=3)
+        with self.assertRaises(ValueError):
+            calculate_turbosoap_descriptor(config, self.system, True, *self.maps, dtype=np.float16)
+        with self.assertRaises(ValueError):
+            calculate_turbosoap_descriptor(config, self.system, True, *self.maps,
+                out=np.empty((len(self.system), config['num_components'] + 1)))
+
+
+class TestCenters(CuAgTestCase):
+    REPEAT = 3
+    SEED = 5
+
+    def setUp(self):
+        super().setUp()
+        self.config = prepare_turbosoap_configuration(self.species, lmax=3)
+
+    def testSubset(self):
+        for periodic in [True, False]:
+            reference, reference_der = calculate_turbosoap_descriptor(self.config, self.system, periodic,
+                *self.maps, derivatives=True)
+            centers = [17, 3, 17, 100]
+            soap_m, der = calculate_turbosoap_descriptor(self.config, self.system, periodic, *self.maps,
+                derivatives=True, centers=centers)
+            np.testing.assert_array_equal(soap_m, reference[centers])
+            #The derivative entries of a center are its block of the full pairs
+            blocks = [reference_der['centers'] == i for i in centers]
+            np.testing.assert_array_equal(der['soap_cart_der'],
+                np.concatenate([reference_der['soap_cart_der'][block] for block in blocks]))
+            np.testing.assert_array_equal(der['neighbors'],
+                np.concatenate([reference_der['neighbors'][block] for block in blocks]))
+            #A single index as in the which_atom of TurboGAP
+            np.testing.assert_array_equal(
+                calculate_turbosoap_descriptor(self.config, self.system, periodic, *self.maps, centers=5),
+                reference[[5]])
+        empty = calculate_turbosoap_descriptor(self.config, self.system, True, *self.maps, centers=[])
+        self.assertEqual(empty.shape, (0, self.config['num_components']))
+
+    def testInvalid(self):
+        for centers in [[len(self.system)], [-1], [0.5], [[0, 1]]]:
+            with self.assertRaises(ValueError):
+                calculate_turbosoap_descriptor(self.config, self.system, True, *self.maps, centers=centers)
+
+
+class TestAverage(CuAgTestCase):
+    REPEAT = 3
+    SEED = 6
+
+    def assertAverages(self, config, **kwargs):
+        soap_m = calculate_turbosoap_descriptor(config, self.system, True, *self.maps)
+        species = np.array([self.maps[0][n] for n in self.system.numbers])
+        np.testing.assert_allclose(calculate_turbosoap_descriptor(config, self.system, True, *self.maps,
+            average='outer', **kwargs), soap_m.mean(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(calculate_turbosoap_descriptor(config, self.system, True, *self.maps,
+            average='sum', **kwargs), soap_m.sum(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(calculate_turbosoap_descriptor(config, self.system, True, *self.maps,
+            average='species', **kwargs), np.concatenate([soap_m[species == 0].mean(axis=0),
+            soap_m[species == 1].mean(axis=0)]), rtol=1e-12)
+
+    def testChunks(self):
+        config = prepare_turbosoap_configuration(self.species, lmax=3)
+        chunk_values = turbosoap_dscribe.CHUNK_VALUES
+        turbosoap_dscribe.CHUNK_VALUES = 5*config['num_kernel_components']
+        try:
+            self.assertAverages(config)
+            self.assertAverages(config, n_threads=3)
+        finally:
+            turbosoap_dscribe.CHUNK_VALUES = chunk_values
+        self.assertAverages(prepare_turbosoap_configuration(self.species, lmax=3, compression={'lmax': 2}))
+
+    def testOutput(self):
+        config = prepare_turbosoap_configuration(self.species, lmax=3)
+        out = np.empty((2, get_num_features(config, 'species')), dtype=np.float32)
+        calculate_turbosoap_descriptor(config, self.system, True, *self.maps, average='species', out=out[1])
+        np.testing.assert_array_equal(out[1], calculate_turbosoap_descriptor(config, self.system, True,
+            *self.maps, average='species', dtype=np.float32))
+        #Species without sites average to zero
+        centers = np.flatnonzero(self.system.numbers == 29)
+        soap = calculate_turbosoap_descriptor(config, self.system, True, *self.maps, average='species',
+            centers=centers)
+        self.assertTrue(np.all(soap[config['num_components']:] == 0.0))
+
+    def testInvalid(self):
+        config = prepare_turbosoap_configuration(self.species, lmax=3)
+        for kwargs in [{'average': 'inner'}, {'average': 'max'}, {'average': 'outer', 'derivatives': True},
+            {'average': 'outer', 'out': np.empty((1, config['num_components']))}]:
+            with self.assertRaises(ValueError):
+                calculate_turbosoap_descriptor(config, self.system, True, *self.maps, **kwargs)
+
+
+if __name__ == "__main__":
+    unittest.main()
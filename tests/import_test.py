@@ -0,0 +1,38 @@
+import subprocess
+import sys
+import unittest
+
+import turbosoap_dscribe
+
+#Prints the heavy modules loaded by a statement
+LOADED = """
+import sys
+{}
+print(' '.join(m for m in ('turbosoap_ext', 'scipy.sparse', 'scipy.spatial', 'ase.io') if m in sys.modules))
+"""
+
+
+def loaded_modules(statement):
+    output = subprocess.run([sys.executable, "-c", LOADED.format(statement)],
+        check=True, capture_output=True, text=True).stdout
+    return output.split()
+
+
+class TestLazyImport(unittest.TestCase):
+    def testImport(self):
+        self.assertEqual(loaded_modules("import turbosoap_dscribe"), [])
+        self.assertEqual(loaded_modules("import turbosoap_dscribe.turbogap, turbosoap_dscribe.stream"), [])
+        self.assertEqual(loaded_modules("import turbosoap_dscribe; turbosoap_dscribe.warmup()"),
+            ['turbosoap_ext', 'scipy.sparse', 'scipy.spatial'])
+
+    def testAttributes(self):
+        import scipy.sparse
+        import turbosoap_ext
+        self.assertIs(turbosoap_dscribe.turbosoap_ext, turbosoap_ext)
+        self.assertIs(turbosoap_dscribe.scipy.sparse, scipy.sparse)
+        with self.assertRaises(AttributeError):
+            turbosoap_dscribe.missing
+
+
+if __name__ == "__main__":
+    unittest.main()
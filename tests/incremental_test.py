@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+from ase import Atoms
+from ase.build import bulk
+
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor
+from turbosoap_dscribe.incremental import IncrementalTurboSOAP
+
+from systems import CU_AG_MAPS, cu_ag_species
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.config = prepare_turbosoap_configuration(cu_ag_species(), lmax=3)
+        self.maps = CU_AG_MAPS
+
+    def assertMatchesFull(self, calculator, system, periodic, moved=None):
+        soap_m = calculator.calculate(system, moved)
+        reference = calculate_turbosoap_descriptor(self.config, system, periodic, *self.maps)
+        np.testing.assert_allclose(soap_m, reference, atol=1e-12)
+
+    def testMonteCarloMoves(self):
+        rng = np.random.default_rng(0)
+        system = bulk('Cu', 'fcc', a=3.6, cubic=True).repeat(3)
+        system.numbers[::5] = 47
+        calculator = IncrementalTurboSOAP(self.config, True, *self.maps, skin=0.6)
+        self.assertMatchesFull(calculator, system, True)
+        self.assertEqual(len(calculator.updated), len(system))
+        for step in range(6):
+            i = rng.integers(len(system))
+            system.positions[i] += rng.normal(scale=0.1, size=3)
+            #Odd steps name the moved atom, and one which did not move
+            moved = [i, (i + 1) % len(system)] if step % 2 else None
+            self.assertMatchesFull(calculator, system, True, moved)
+            self.assertIn(i, calculator.updated)
+            self.assertLess(len(calculator.updated), len(system)//2)
+        self.assertEqual(calculator.n_builds, 1)
+        #A move beyond half of the skin rebuilds the list
+        system.positions[0] += [0.5, 0.0, 0.0]
+        self.assertMatchesFull(calculator, system, True, [0])
+        self.assertEqual(calculator.n_builds, 2)
+
+    def testSwapAndRebuild(self):
+        rng = np.random.default_rng(1)
+        system = Atoms(numbers=rng.choice([29, 47], 60), positions=rng.uniform(0.0, 9.0, size=(60, 3)))
+        calculator = IncrementalTurboSOAP(self.config, False, *self.maps, skin=0.3)
+        self.assertMatchesFull(calculator, system, False)
+        #Species swap
+        system.numbers[3] = 29 if system.numbers[3] == 47 else 47
+        self.assertMatchesFull(calculator, system, False)
+        #Large move, beyond the skin
+        system.positions[7] += [1.5, -1.0, 0.5]
+        self.assertMatchesFull(calculator, system, False)
+        self.assertEqual(calculator.n_builds, 3)
+        #Nothing moved
+        self.assertMatchesFull(calculator, system, False)
+        self.assertEqual(len(calculator.updated), 0)
+
+    def testMolecularDynamics(self):
+        rng = np.random.default_rng(2)
+        system = bulk('Cu', 'fcc', a=3.6, cubic=True).repeat(2)
+        calculator = IncrementalTurboSOAP(self.config, True, *self.maps, skin=0.5)
+        for step in range(6):
+            system.positions += rng.normal(scale=0.05, size=system.positions.shape)
+            self.assertMatchesFull(calculator, system, True)
+        self.assertLess(calculator.n_builds, 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
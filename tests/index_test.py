@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import turbosoap_dscribe.index
+from turbosoap_dscribe.index import EnvironmentIndex
+
+
+def clustered(rng, n, n_clusters=20, dim=16):
+    centers = rng.normal(size=(n_clusters, dim))
+    x = centers[rng.integers(0, n_clusters, n)] + 0.3*rng.normal(size=(n, dim))
+    return x/np.linalg.norm(x, axis=1)[:, None]
+
+
+class TestEnvironmentIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = clustered(rng, 2000)
+        self.queries = clustered(rng, 50)
+        similarities = self.queries @ self.x.T
+        self.reference = np.argsort(-similarities, axis=1, kind='stable')[:, :5]
+
+    def testExact(self):
+        block_rows = turbosoap_dscribe.index.BLOCK_ROWS
+        turbosoap_dscribe.index.BLOCK_ROWS = 300
+        try:
+            index = EnvironmentIndex(16, dtype=float)
+            index.add(self.x[:1200])
+            index.add(self.x[1200:])
+            ids, similarities = index.search(self.queries, k=5)
+        finally:
+            turbosoap_dscribe.index.BLOCK_ROWS = block_rows
+        np.testing.assert_array_equal(ids, self.reference)
+        np.testing.assert_allclose(similarities, np.take_along_axis(self.queries @ self.x.T, ids, axis=1))
+        #Fewer vectors than neighbours
+        index = EnvironmentIndex(16)
+        index.add(self.x[:2], ids=[7, 3])
+        ids, similarities = index.search(self.queries[:1], k=3)
+        self.assertEqual(sorted(ids[0, :2]), [3, 7])
+        self.assertEqual(ids[0, 2], -1)
+        self.assertEqual(similarities[0, 2], -np.inf)
+
+    def testApproximate(self):
+        index = EnvironmentIndex(16, n_lists=16, dtype=float)
+        with self.assertRaises(ValueError):
+            index.add(self.x)
+        index.train(self.x)
+        index.add(self.x)
+        self.assertEqual(len(index), len(self.x))
+        #Probing every list is exact
+        ids, _ = index.search(self.queries, k=5, n_probe=16)
+        np.testing.assert_array_equal(ids, self.reference)
+        ids, _ = index.search(self.queries, k=5, n_probe=4)
+        recall = np.mean([len(set(a) & set(b))/5 for a, b in zip(ids, self.reference)])
+        self.assertGreater(recall, 0.8)
+
+    def testPersistence(self):
+        index = EnvironmentIndex(16, n_lists=8)
+        index.train(self.x)
+        index.add(self.x[:1500])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "index")
+            index.save(path)
+            loaded = EnvironmentIndex.load(path)
+            np.testing.assert_array_equal(loaded.search(self.queries, k=5, n_probe=3)[0],
+                index.search(self.queries, k=5, n_probe=3)[0])
+            #Adding to a memory-mapped index
+            loaded.add(self.x[1500:])
+            index.add(self.x[1500:])
+            np.testing.assert_array_equal(loaded.search(self.queries, k=5, n_probe=8)[0], self.reference)
+            np.testing.assert_array_equal(index.search(self.queries, k=5, n_probe=8)[0], self.reference)
+            path = os.path.join(tmpdir, "empty")
+            EnvironmentIndex(16).save(path)
+            self.assertEqual(len(EnvironmentIndex.load(path)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
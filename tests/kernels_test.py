@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from turbosoap_dscribe.kernels import (polynomial_kernel, kernel_row_sums, kernel_top_k,
+    farthest_point_sampling, cur_selection, average_kernel, rematch_kernel)
+from turbosoap_dscribe.store import DescriptorStore
+
+
+def normalized(x):
+    return x/np.linalg.norm(x, axis=1)[:, None]
+
+
+class TestEnvironmentKernels(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.a = rng.uniform(size=(103, 20))
+        self.b = rng.uniform(size=(17, 20))
+        self.reference = (normalized(self.a) @ normalized(self.b).T)**3
+
+    def testBlocks(self):
+        for n_threads in [1, 3]:
+            np.testing.assert_allclose(polynomial_kernel(self.a, self.b, zeta=3, block_rows=10,
+                n_threads=n_threads), self.reference, rtol=1e-12)
+        kernel = polynomial_kernel(self.a, self.b, zeta=3, dtype=np.float32, block_rows=10)
+        self.assertEqual(kernel.dtype, np.float32)
+        np.testing.assert_allclose(kernel, self.reference, rtol=1e-5)
+        np.testing.assert_allclose(polynomial_kernel(self.a, self.b, zeta=1, normalize=False),
+            self.a @ self.b.T, rtol=1e-12)
+
+    def testReductions(self):
+        np.testing.assert_allclose(kernel_row_sums(self.a, self.b, zeta=3, block_rows=10, n_threads=2),
+            self.reference.sum(axis=1), rtol=1e-12)
+        indices, values = kernel_top_k(self.a, self.b, 4, zeta=3, block_rows=10)
+        np.testing.assert_array_equal(indices, np.argsort(-self.reference, axis=1, kind='stable')[:, :4])
+        np.testing.assert_allclose(values, -np.sort(-self.reference, axis=1)[:, :4], rtol=1e-12)
+        with self.assertRaises(ValueError):
+            kernel_top_k(self.a, self.b, 18)
+
+    def testStore(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "store")
+            config = {'num_components': 20}
+            with DescriptorStore(path, 'w', config=config) as store:
+                store.append(self.a, key='a')
+            store = DescriptorStore(path)
+            out = np.lib.format.open_memmap(os.path.join(tmpdir, "kernel.npy"), mode='w+',
+                shape=(len(self.a), len(self.b)))
+            polynomial_kernel(store, self.b, zeta=3, block_rows=10, out=out)
+            np.testing.assert_allclose(out, self.reference, rtol=1e-12)
+            del out, store
+
+    def testSelection(self):
+        selected = farthest_point_sampling(self.a, 10, zeta=2, start=5)
+        self.assertEqual(selected[0], 5)
+        self.assertEqual(len(set(selected)), 10)
+        #Each point is the farthest from the ones selected before
+        x = normalized(self.a)
+        distances = 2.0 - 2.0*(x @ x.T)**2
+        for i in range(1, 10):
+            nearest = distances[:, selected[:i]].min(axis=1)
+            self.assertAlmostEqual(nearest[selected[i]], nearest.max())
+
+        u = np.linalg.svd(self.a, full_matrices=False)[0]
+        scores = (u[:, :8]**2).sum(axis=1)
+        np.testing.assert_array_equal(cur_selection(self.a, 8, block_rows=10), np.argsort(-scores)[:8])
+
+
+class TestStructureKernels(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.a = rng.uniform(size=(30, 10))
+        self.offsets_a = np.array([0, 4, 4, 15, 30])
+        self.b = rng.uniform(size=(12, 10))
+        self.offsets_b = np.array([0, 5, 12])
+
+    def reference(self, zeta):
+        def mean_kernel(x, y):
+            return ((normalized(x) @ normalized(y).T)**zeta).mean() if len(x) and len(y) else 0.0
+        a = [self.a[i:j] for i, j in zip(self.offsets_a[:-1], self.offsets_a[1:])]
+        b = [self.b[i:j] for i, j in zip(self.offsets_b[:-1], self.offsets_b[1:])]
+        kernel = np.array([[mean_kernel(x, y) for y in b] for x in a])
+        norms = np.sqrt(np.outer([mean_kernel(x, x) for x in a], [mean_kernel(y, y) for y in b]))
+        return np.divide(kernel, norms, out=np.zeros_like(kernel), where=norms > 0.0)
+
+    def testAverage(self):
+        for zeta in [1, 2]:
+            np.testing.assert_allclose(average_kernel(self.a, self.b, self.offsets_a, self.offsets_b,
+                zeta=zeta, block_rows=7, n_threads=2), self.reference(zeta), rtol=1e-12)
+        kernel = average_kernel(self.a, self.a, self.offsets_a, self.offsets_a)
+        np.testing.assert_allclose(np.diag(kernel), [1.0, 0.0, 1.0, 1.0])
+
+    def testRematch(self):
+        #Large gamma gives the average kernel
+        np.testing.assert_allclose(rematch_kernel(self.a, self.b, self.offsets_a, self.offsets_b, zeta=2,
+            gamma=1e6, n_threads=2), self.reference(2), rtol=1e-6)
+        #Permuted environments match perfectly
+        permuted = self.a[np.r_[3, 2, 1, 0, 4:30]]
+        kernel = rematch_kernel(self.a, permuted, self.offsets_a, self.offsets_a, gamma=0.01)
+        np.testing.assert_allclose(np.diag(kernel)[[0, 2, 3]], 1.0, rtol=1e-6)
+        self.assertTrue(np.all(kernel <= 1.0 + 1e-9))
+        with self.assertRaises(ValueError):
+            rematch_kernel(self.a, self.b, self.offsets_a, self.offsets_b, gamma=0.0)
+        with self.assertRaises(ValueError):
+            rematch_kernel(self.a, self.b, self.offsets_a, self.offsets_b, max_iterations=0)
+        #One iteration is enough to have a plan
+        self.assertEqual(rematch_kernel(self.a, self.b, self.offsets_a, self.offsets_b,
+            max_iterations=1).shape, (len(self.offsets_a) - 1, len(self.offsets_b) - 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
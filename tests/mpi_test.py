@@ -0,0 +1,99 @@
+"""Runs with a single process or with e.g. mpirun -n 4 python -m pytest tests/mpi_test.py"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from dscribe.descriptors.turbosoap import TurboSOAPSpecie
+import numpy as np
+from ase.build import molecule, bulk
+
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor
+from turbosoap_dscribe.store import DescriptorStore
+from turbosoap_dscribe.mpi import (calculate_turbosoap_descriptors_mpi, calculate_turbosoap_descriptor_mpi,
+    balance_by_atoms)
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+
+class TestBalance(unittest.TestCase):
+    def testLargestFirst(self):
+        assignment = balance_by_atoms([5, 1, 8, 3, 3, 2], 2)
+        self.assertEqual(sorted(sum(assignment, [])), list(range(6)))
+        loads = [sum([5, 1, 8, 3, 3, 2][i] for i in indices) for indices in assignment]
+        self.assertEqual(sorted(loads), [11, 11])
+        self.assertEqual(balance_by_atoms([4], 3), [[0], [], []])
+
+
+@unittest.skipIf(MPI is None, "mpi4py is not installed")
+class TestMPI(unittest.TestCase):
+    def setUp(self):
+        self.comm = MPI.COMM_WORLD
+        self.rank = self.comm.Get_rank()
+        self.config = prepare_turbosoap_configuration(
+            [TurboSOAPSpecie(rcut=3.0, nmax=3), TurboSOAPSpecie(rcut=3.5, nmax=3)], lmax=3)
+        self.maps = ({1: 0, 8: 1}, {1: 3.0, 8: 3.5})
+        self.systems = []
+        for i in range(7):
+            system = molecule("H2O" if i % 3 else "H2O2")
+            system.rattle(0.05, seed=i)
+            self.systems.append(system)
+        self.reference = np.concatenate([calculate_turbosoap_descriptor(self.config, system, False,
+            *self.maps) for system in self.systems])
+
+    def shared_directory(self):
+        #Created on the root rank, the same path on all ranks
+        path = tempfile.mkdtemp() if self.rank == 0 else None
+        path = self.comm.bcast(path, root=0)
+        if self.rank == 0:
+            self.addCleanup(shutil.rmtree, path)
+        return os.path.join(path, "store")
+
+    def testGather(self):
+        for scatter in [True, False]:
+            systems = self.systems if scatter is False or self.rank == 0 else None
+            soap, offsets, report = calculate_turbosoap_descriptors_mpi(self.config, systems, False,
+                *self.maps, scatter=scatter)
+            np.testing.assert_array_equal(offsets[-1], len(self.reference))
+            self.assertEqual(len(report['times']), self.comm.Get_size())
+            self.assertEqual(report['atoms'].sum(), len(self.reference))
+            self.assertGreaterEqual(report['imbalance'], 0.0)
+            if self.rank == 0:
+                np.testing.assert_array_equal(soap, self.reference)
+            else:
+                self.assertIsNone(soap)
+
+    def testStore(self):
+        path = self.shared_directory()
+        _, offsets, _ = calculate_turbosoap_descriptors_mpi(self.config,
+            self.systems if self.rank == 0 else None, False, *self.maps, out=path)
+        store = DescriptorStore(path)
+        np.testing.assert_array_equal(store.offsets, offsets)
+        np.testing.assert_array_equal(store.descriptors, self.reference)
+        for system in self.systems:
+            np.testing.assert_array_equal(store.get(system),
+                calculate_turbosoap_descriptor(self.config, system, False, *self.maps))
+        self.comm.Barrier()
+
+    def testLargeStructure(self):
+        config = prepare_turbosoap_configuration([TurboSOAPSpecie(rcut=3.0, nmax=3)], lmax=3)
+        system = bulk('Cu', 'fcc', a=3.6, cubic=True).repeat(2)
+        system.rattle(0.05, seed=1)
+        reference = calculate_turbosoap_descriptor(config, system, True, {29: 0}, {29: 3.0})
+        soap_m, report = calculate_turbosoap_descriptor_mpi(config, system if self.rank == 0 else None,
+            True, {29: 0}, {29: 3.0})
+        self.assertEqual(report['atoms'].sum(), len(system))
+        if self.rank == 0:
+            np.testing.assert_array_equal(soap_m, reference)
+
+        path = self.shared_directory()
+        calculate_turbosoap_descriptor_mpi(config, system, True, {29: 0}, {29: 3.0}, out=path)
+        np.testing.assert_array_equal(DescriptorStore(path).get(system), reference)
+        self.comm.Barrier()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import unittest
+from math import sqrt, acos, atan2
+
+import numpy as np
+from ase import Atoms
+from ase.build import molecule
+from dscribe.utils.geometry import get_adjacency_matrix, get_extended_system
+
+import turbosoap_dscribe.neighbors
+from turbosoap_dscribe import get_adjacency_list_rcut, get_pair_arrays
+from turbosoap_dscribe.neighbors import get_neighbor_list, get_periodic_neighbor_list
+
+
+def reference_pair_arrays(positions, adj_l, species, n_species):
+    #Per-pair loop which calculate_turbosoap_descriptor used originally
+    n_atom_pairs = sum(len(l) for l in adj_l)
+    rjs = np.empty(n_atom_pairs, dtype=float)
+    thetas = np.empty(n_atom_pairs, dtype=float)
+    phis = np.empty(n_atom_pairs, dtype=float)
+    mask = np.zeros((n_atom_pairs, n_species), order='F', dtype=np.int8)
+    idx = 0
+    for nl in adj_l:
+        rjs[idx] = 0.0
+        thetas[idx] = 0.0
+        phis[idx] = 0.0
+        mask[idx, species[nl[0]]] = True
+        idx += 1
+        cpos = positions[nl[0]]
+        for n in nl[1:]:
+            p = positions[n] - cpos
+            d = p*p
+            d = sqrt(d[0] + d[1] + d[2])
+            rjs[idx] = d
+            thetas[idx] = acos(p[2]/d)
+            phis[idx] = atan2(p[1], p[0])
+            mask[idx, species[n]] = True
+            idx += 1
+    return rjs, thetas, phis, mask
+
+
+class TestNeighborList(unittest.TestCase):
+    def assertSamePairArrays(self, positions, species, rcuts, n_species):
+        adj_m = get_adjacency_matrix(max(rcuts), positions, positions)
+        adj_l = get_adjacency_list_rcut(adj_m, rcuts)
+        n_neigh = np.array([len(l) for l in adj_l])
+        neighbors = np.concatenate(adj_l)
+
+        centers = np.repeat(np.arange(len(positions)), n_neigh)
+        vectors = positions[neighbors] - positions[centers]
+        result = get_pair_arrays(vectors, n_neigh, species[neighbors], n_species)
+        reference = reference_pair_arrays(positions, adj_l, species, n_species)
+        np.testing.assert_array_equal(result[0], reference[0])
+        #numpy and libm angles can differ in the last bit
+        np.testing.assert_allclose(result[1], reference[1], rtol=1e-15, atol=1e-15)
+        np.testing.assert_allclose(result[2], reference[2], rtol=1e-15, atol=1e-15)
+        np.testing.assert_array_equal(result[3], reference[3])
+        self.assertTrue(result[3].flags.f_contiguous)
+
+    def testWaterMolecule(self):
+        water = molecule("H2O")
+        species = np.array([1, 0, 0])
+        self.assertSamePairArrays(water.positions, species, [3.0, 3.0, 3.0], 2)
+
+    def testRandomCluster(self):
+        rng = np.random.default_rng(42)
+        positions = rng.uniform(0.0, 12.0, size=(300, 3))
+        species = rng.integers(0, 3, size=300)
+        rcuts = np.array([2.5, 4.0, 3.0])[species]
+        self.assertSamePairArrays(positions, species, rcuts, 3)
+
+    def testIsolatedAtoms(self):
+        positions = np.array([[0.0, 0.0, 0.0], [10.0, 0.0, 0.0]])
+        n_neigh, neighbors = get_neighbor_list(positions, [3.0, 3.0])
+        np.testing.assert_array_equal(n_neigh, [1, 1])
+        np.testing.assert_array_equal(neighbors, [0, 1])
+
+
+class TestNeighborSearch(unittest.TestCase):
+    def assertSameNeighbors(self, positions, rcuts, **kwargs):
+        adj_m = get_adjacency_matrix(max(rcuts), positions, positions)
+        adj_l = get_adjacency_list_rcut(adj_m, rcuts)
+        n_neigh, neighbors = get_neighbor_list(positions, rcuts, **kwargs)
+        np.testing.assert_array_equal(n_neigh, [len(l) for l in adj_l])
+        start = 0
+        for i, l in enumerate(adj_l):
+            block = neighbors[start:start + n_neigh[i]]
+            self.assertEqual(block[0], i)
+            np.testing.assert_array_equal(block[1:], sorted(l[1:]))
+            start += n_neigh[i]
+
+    def testPerSpeciesCutoffs(self):
+        rng = np.random.default_rng(7)
+        positions = rng.uniform(0.0, 15.0, size=(400, 3))
+        species = rng.integers(0, 3, size=400)
+        rcuts = np.array([2.0, 5.5, 3.0])[species]
+        self.assertSameNeighbors(positions, rcuts)
+
+    def testChunks(self):
+        rng = np.random.default_rng(8)
+        positions = rng.uniform(0.0, 10.0, size=(200, 3))
+        rcuts = np.where(rng.uniform(size=200) < 0.5, 2.5, 3.5)
+        self.assertSameNeighbors(positions, rcuts, chunk_size=7)
+
+    def testSmallMolecule(self):
+        rng = np.random.default_rng(9)
+        positions = rng.uniform(0.0, 6.0, size=(40, 3))
+        rcuts = np.where(rng.uniform(size=40) < 0.5, 2.5, 3.5)
+        self.assertLessEqual(40*40, turbosoap_dscribe.neighbors.DENSE_PAIRS)
+        self.assertSameNeighbors(positions, rcuts)
+
+
+class TestPeriodicNeighborSearch(unittest.TestCase):
+    def assertSameAsExtendedSystem(self, system, rcut):
+        #Reference: neighbours of the original atoms in the replicated system
+        extended = get_extended_system(system, rcut, return_cell_indices=False)
+        n_atoms = len(system)
+        n_neigh, neighbors, shifts = get_periodic_neighbor_list(
+            system.positions, system.cell, system.pbc, np.full(n_atoms, rcut))
+        ref_n_neigh, ref_neighbors = get_neighbor_list(extended.positions, np.full(len(extended), rcut))
+        np.testing.assert_array_equal(n_neigh, ref_n_neigh[:n_atoms])
+
+        start = ref_start = 0
+        for i in range(n_atoms):
+            block = slice(start, start + n_neigh[i])
+            ref_block = ref_neighbors[ref_start:ref_start + n_neigh[i]]
+            vectors = system.positions[neighbors[block]] + shifts[block] - system.positions[i]
+            ref_vectors = extended.positions[ref_block] - extended.positions[i]
+            np.testing.assert_allclose(sorted(map(tuple, vectors)), sorted(map(tuple, ref_vectors)), atol=1e-10)
+            np.testing.assert_array_equal(np.sort(neighbors[block]), np.sort(ref_block % n_atoms))
+            start += n_neigh[i]
+            ref_start += ref_n_neigh[i]
+
+    def testTriclinic(self):
+        rng = np.random.default_rng(3)
+        cell = [[5.0, 0.0, 0.0], [1.5, 4.5, 0.0], [0.7, 1.1, 4.8]]
+        system = Atoms("C12", scaled_positions=rng.uniform(size=(12, 3)), cell=cell, pbc=True)
+        self.assertSameAsExtendedSystem(system, 3.0)
+
+    def testCutoffLargerThanCell(self):
+        rng = np.random.default_rng(4)
+        cell = [[3.0, 0.0, 0.0], [0.5, 3.2, 0.0], [0.0, 0.0, 2.9]]
+        system = Atoms("C3", scaled_positions=rng.uniform(size=(3, 3)), cell=cell, pbc=True)
+        self.assertSameAsExtendedSystem(system, 4.5)
+
+    def testSlab(self):
+        rng = np.random.default_rng(5)
+        cell = [[4.0, 0.0, 0.0], [0.0, 4.0, 0.0], [0.0, 0.0, 0.0]]
+        system = Atoms("C6", positions=rng.uniform(0.0, 4.0, size=(6, 3)), cell=cell, pbc=[True, True, False])
+        n_neigh, neighbors, shifts = get_periodic_neighbor_list(
+            system.positions, system.cell, system.pbc, np.full(6, 3.0))
+        self.assertTrue(np.all(shifts[:, 2] == 0.0))
+        self.assertTrue(np.all(n_neigh > 1))
+
+
+class TestCenters(unittest.TestCase):
+    def assertSameBlocks(self, full, subset, centers):
+        #The lists of the centers are the corresponding blocks of the full lists
+        first = np.cumsum(full[0]) - full[0]
+        np.testing.assert_array_equal(subset[0], full[0][centers])
+        start = 0
+        for i in centers:
+            block = slice(start, start + full[0][i])
+            full_block = slice(first[i], first[i] + full[0][i])
+            for array, full_array in zip(subset[1:], full[1:]):
+                np.testing.assert_array_equal(array[block], full_array[full_block])
+            start += full[0][i]
+
+    def testNonPeriodic(self):
+        rng = np.random.default_rng(10)
+        positions = rng.uniform(0.0, 15.0, size=(300, 3))
+        rcuts = np.where(rng.uniform(size=300) < 0.5, 2.5, 3.5)
+        full = get_neighbor_list(positions, rcuts)
+        for centers in [[5], [299, 3, 3, 120], np.arange(0, 300, 7)]:
+            self.assertSameBlocks(full, get_neighbor_list(positions, rcuts, centers=np.array(centers)), centers)
+        n_neigh, neighbors = get_neighbor_list(positions, rcuts, centers=np.zeros(0, dtype=int))
+        self.assertEqual(len(n_neigh), 0)
+        self.assertEqual(len(neighbors), 0)
+
+    def testPeriodic(self):
+        rng = np.random.default_rng(11)
+        cell = [[9.0, 0.0, 0.0], [1.5, 8.5, 0.0], [0.7, 1.1, 8.8]]
+        positions = rng.uniform(size=(80, 3)) @ np.array(cell)
+        rcuts = np.where(rng.uniform(size=80) < 0.5, 3.0, 4.0)
+        full = get_periodic_neighbor_list(positions, cell, [True, True, True], rcuts)
+        for centers in [[0], [79, 12, 40]]:
+            subset = get_periodic_neighbor_list(positions, cell, [True, True, True], rcuts,
+                centers=np.array(centers))
+            self.assertSameBlocks(full, subset, centers)
+        #Positions not wrapped into the cell, as in MD output
+        unwrapped = positions + rng.integers(-3, 4, size=(80, 3)) @ np.array(cell)
+        full = get_periodic_neighbor_list(unwrapped, cell, [True, True, True], rcuts)
+        np.testing.assert_array_equal(full[0],
+            get_periodic_neighbor_list(positions, cell, [True, True, True], rcuts)[0])
+        for centers in [[0], [79, 12, 40]]:
+            subset = get_periodic_neighbor_list(unwrapped, cell, [True, True, True], rcuts,
+                centers=np.array(centers))
+            self.assertSameBlocks(full, subset, centers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+
+from dscribe.descriptors.turbosoap import TurboSOAPSpecie
+import numpy as np
+import ase.io
+from ase.build import molecule
+
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor
+from turbosoap_dscribe.batch import calculate_turbosoap_descriptors
+from turbosoap_dscribe.store import DescriptorStore, get_structure_hash
+from turbosoap_dscribe.stream import featurize_trajectory
+
+
+class TestDescriptorStore(unittest.TestCase):
+    def setUp(self):
+        self.config = prepare_turbosoap_configuration(
+            [TurboSOAPSpecie(rcut=3.0, nmax=4), TurboSOAPSpecie(rcut=3.5, nmax=4)], lmax=4,
+            compression={'lmax': 3})
+        self.maps = ({1: 0, 8: 1}, {1: 3.0, 8: 3.5})
+        self.systems = []
+        for i in range(5):
+            system = molecule("H2O" if i % 2 else "H2O2")
+            system.rattle(0.05, seed=i)
+            self.systems.append(system)
+        self.reference = [calculate_turbosoap_descriptor(self.config, system, False, *self.maps)
+            for system in self.systems]
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "store")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assertStoreMatches(self, store):
+        self.assertEqual(len(store), len(self.systems))
+        self.assertIsInstance(store.descriptors, np.memmap)
+        for i, (system, reference) in enumerate(zip(self.systems, self.reference)):
+            np.testing.assert_array_equal(store[i], reference)
+            np.testing.assert_array_equal(store.get(system), reference)
+            self.assertIn(get_structure_hash(system), store)
+
+    def testWriteAndAppend(self):
+        with DescriptorStore(self.path, 'w', config=self.config, metadata={'source': 'test'}) as store:
+            for system, soap_m in zip(self.systems[:3], self.reference[:3]):
+                store.append(soap_m, system=system)
+        with DescriptorStore(self.path, 'a') as store:
+            for system, soap_m in zip(self.systems[3:], self.reference[3:]):
+                store.append(soap_m, system=system)
+
+        store = DescriptorStore(self.path)
+        self.assertStoreMatches(store)
+        self.assertEqual(store.metadata, {'source': 'test'})
+        for key, value in self.config.items():
+            if isinstance(value, np.ndarray):
+                np.testing.assert_array_equal(store.config[key], value)
+                self.assertEqual(store.config[key].dtype, value.dtype)
+            else:
+                self.assertEqual(store.config[key], value)
+        moved = self.systems[0].copy()
+        moved.positions[0, 0] += 1e-3
+        self.assertNotIn(get_structure_hash(moved), store)
+        with self.assertRaises(KeyError):
+            store.get(moved)
+
+    def testInvalid(self):
+        with self.assertRaises(ValueError):
+            DescriptorStore(self.path, 'w')
+        with DescriptorStore(self.path, 'w', config=self.config) as store:
+            with self.assertRaises(ValueError):
+                store.append(np.zeros((3, 2)), key='a')
+            with self.assertRaises(ValueError):
+                store.get(key='a')
+        self.assertEqual(len(DescriptorStore(self.path)), 0)
+
+    def testReserve(self):
+        with DescriptorStore(self.path, 'w', config=self.config) as store:
+            store.append(self.reference[0], system=self.systems[0])
+            offsets = store.reserve([len(s) for s in self.systems[1:]],
+                [get_structure_hash(s) for s in self.systems[1:]])
+        #Filled in place as another process would
+        descriptors = np.load(os.path.join(self.path, "descriptors.npy"), mmap_mode='r+')
+        for i, soap_m in enumerate(self.reference[1:]):
+            descriptors[offsets[i]:offsets[i+1]] = soap_m
+        descriptors.flush()
+        del descriptors
+        self.assertStoreMatches(DescriptorStore(self.path))
+
+    def testBatchOutput(self):
+        with DescriptorStore(self.path, 'w', config=self.config) as store:
+            offsets = calculate_turbosoap_descriptors(self.config, self.systems, False,
+                *self.maps, n_jobs=1, chunk_atoms=5, out=store)
+        store = DescriptorStore(self.path)
+        np.testing.assert_array_equal(offsets, store.offsets)
+        self.assertStoreMatches(store)
+        #Rejected before any structure is calculated
+        with DescriptorStore(self.path, 'w', config=self.config) as store:
+            with self.assertRaises(ValueError):
+                calculate_turbosoap_descriptors(self.config, iter(self.systems), False,
+                    *self.maps, n_jobs=1, out=store, average='species')
+            self.assertEqual(len(store), 0)
+
+    def testTrajectoryOutput(self):
+        filename = os.path.join(self.tmpdir.name, "traj.traj")
+        ase.io.write(filename, self.systems)
+        with DescriptorStore(self.path, 'w', config=self.config) as store:
+            offsets = featurize_trajectory(filename, self.config, False, *self.maps, out=store)
+        store = DescriptorStore(self.path)
+        np.testing.assert_array_equal(offsets, store.offsets)
+        self.assertStoreMatches(store)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import io
+import os
+import tempfile
+import unittest
+
+from dscribe.descriptors.turbosoap import TurboSOAPSpecie
+import numpy as np
+import ase.io
+from ase.build import molecule
+
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor
+from turbosoap_dscribe.stream import iter_turbosoap_descriptors, featurize_trajectory
+
+
+class TestStream(unittest.TestCase):
+    def setUp(self):
+        self.config = prepare_turbosoap_configuration(
+            [TurboSOAPSpecie(rcut=3.0, nmax=4), TurboSOAPSpecie(rcut=3.5, nmax=4)], lmax=4)
+        self.maps = ({1: 0, 8: 1}, {1: 3.0, 8: 3.5})
+        self.frames = []
+        for i in range(5):
+            system = molecule("H2O" if i % 2 else "H2O2")
+            system.rattle(0.05, seed=i)
+            self.frames.append(system)
+        self.reference = [calculate_turbosoap_descriptor(self.config, system, False, *self.maps)
+            for system in self.frames]
+
+    def testIterate(self):
+        for prefetch in [True, False]:
+            blocks = list(iter_turbosoap_descriptors(self.config, iter(self.frames), False,
+                *self.maps, prefetch=prefetch))
+            self.assertEqual(len(blocks), len(self.frames))
+            for soap_m, reference in zip(blocks, self.reference):
+                np.testing.assert_array_equal(soap_m, reference)
+
+    def testTrajectoryToFile(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "traj.xyz")
+            ase.io.write(filename, self.frames)
+            out = io.BytesIO()
+            offsets = featurize_trajectory(filename, self.config, False, *self.maps, out=out)
+            #The file holds rounded positions
+            frames = ase.io.read(filename, ':')
+        soap = np.frombuffer(out.getvalue()).reshape(-1, self.config['num_components'])
+        self.assertEqual(len(offsets), len(self.frames) + 1)
+        for i, system in enumerate(frames):
+            reference = calculate_turbosoap_descriptor(self.config, system, False, *self.maps)
+            np.testing.assert_array_equal(soap[offsets[i]:offsets[i+1]], reference)
+
+
+if __name__ == "__main__":
+    unittest.main()
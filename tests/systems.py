@@ -0,0 +1,32 @@
+"""Copper-silver structures and settings shared by the tests."""
+import unittest
+
+from dscribe.descriptors.turbosoap import TurboSOAPSpecie
+from ase.build import bulk
+
+#atomic_numbers_to_indices and atomic_numbers_to_rcuts of copper and silver
+CU_AG_MAPS = ({29: 0, 47: 1}, {29: 3.0, 47: 3.5})
+
+
+def cu_ag_species(**kwargs):
+    #kwargs are extra parameters of the copper species
+    return [TurboSOAPSpecie(rcut=3.0, nmax=3, **kwargs), TurboSOAPSpecie(rcut=3.5, nmax=3)]
+
+
+def cu_ag_fcc(repeat, seed, first=0):
+    #Rattled fcc copper supercell with every fourth atom from first replaced by silver
+    system = bulk('Cu', 'fcc', a=3.6, cubic=True).repeat(repeat)
+    system.numbers[first::4] = 47
+    system.rattle(0.1, seed=seed)
+    return system
+
+
+class CuAgTestCase(unittest.TestCase):
+    """Sets up species, maps and system, a cu_ag_fcc of REPEAT and SEED."""
+    REPEAT = 3
+    SEED = 0
+
+    def setUp(self):
+        self.species = cu_ag_species()
+        self.maps = CU_AG_MAPS
+        self.system = cu_ag_fcc(self.REPEAT, self.SEED)
@@ -0,0 +1,63 @@
+import unittest
+
+from dscribe.descriptors.turbosoap import TurboSOAPSpecie
+import numpy as np
+from ase.build import molecule
+
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor
+from turbosoap_dscribe.compiled import TurboSOAPDescriptor
+from turbosoap_dscribe.timing import Timings, collect_timings, timed_stage
+import turbosoap_dscribe.timing
+
+
+class TestTimings(unittest.TestCase):
+    def setUp(self):
+        self.species = [TurboSOAPSpecie(rcut=3.0, nmax=4), TurboSOAPSpecie(rcut=3.5, nmax=4)]
+        self.maps = ({1: 0, 8: 1}, {1: 3.0, 8: 3.5})
+
+    def testStages(self):
+        config = prepare_turbosoap_configuration(self.species, lmax=4)
+        system = molecule("H2O2")
+        with collect_timings() as timings:
+            calculate_turbosoap_descriptor(config, system, False, *self.maps)
+            calculate_turbosoap_descriptor(config, system, False, *self.maps, dtype=np.float32)
+        self.assertEqual(list(timings.stages), ["neighbors", "pairs", "kernel", "post"])
+        n_atom_pairs = timings.stages['pairs']['n_atom_pairs']//2
+        for name in ["neighbors", "pairs", "kernel"]:
+            self.assertEqual(timings.stages[name]['calls'], 2)
+            self.assertGreaterEqual(timings.stages[name]['time'], 0.0)
+            self.assertEqual(timings.stages[name]['n_sites'], 2*len(system))
+        self.assertEqual(timings.stages['kernel']['n_atom_pairs'], 2*n_atom_pairs)
+        #Only the float32 output is converted after the kernel
+        self.assertEqual(timings.stages['post']['n_sites'], len(system))
+        self.assertIn("kernel", timings.summary())
+
+    def testAggregation(self):
+        config = prepare_turbosoap_configuration(self.species, lmax=4, compression={'lmax': 3})
+        descriptor = TurboSOAPDescriptor(config, *self.maps)
+        timings = Timings()
+        with collect_timings(timings):
+            descriptor.calculate(molecule("H2O"))
+        with collect_timings(timings) as inner:
+            self.assertIs(inner, timings)
+            descriptor.calculate(molecule("H2O2"))
+        self.assertEqual(timings.stages['neighbors']['calls'], 2)
+        self.assertEqual(timings.stages['kernel']['n_sites'], 7)
+        self.assertEqual(timings.stages['post']['n_sites'], 7)
+        timings.reset()
+        self.assertEqual(timings.stages, {})
+
+    def testDisabled(self):
+        self.assertEqual(turbosoap_dscribe.timing._collectors, [])
+        with timed_stage('kernel') as stage:
+            stage.update(n_sites=1)
+        with collect_timings() as timings:
+            pass
+        config = prepare_turbosoap_configuration(self.species, lmax=4)
+        calculate_turbosoap_descriptor(config, molecule("H2O"), False, *self.maps)
+        self.assertEqual(timings.stages, {})
+        self.assertEqual(turbosoap_dscribe.timing._collectors, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import sys
+import unittest
+
+import numpy as np
+
+from turbosoap_dscribe import prepare_turbosoap_configuration, calculate_turbosoap_descriptor
+from turbosoap_dscribe.turbogap import TURBOGAP_CMD, compare_with_turbogap, read_soap_dat, run_turbogap
+
+from systems import CU_AG_MAPS, cu_ag_fcc, cu_ag_species
+
+#soap.dat of one site, nmax 3 and lmax 3 with two species
+SOAP_DAT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "soap.dat")
+
+#Stand-in for the TurboGAP binary: checks that the input files were written
+#to the working directory and copies the fixture to soap.dat
+STAND_IN = '''
+import os, shutil, sys
+assert os.path.exists("input") and os.path.exists("input.xyz")
+shutil.copy(sys.argv[1], "soap.dat")
+'''
+
+
+class TestTurboGAP(unittest.TestCase):
+    def setUp(self):
+        self.config = prepare_turbosoap_configuration(cu_ag_species(radial_enhancement=1), lmax=3)
+        self.maps = CU_AG_MAPS
+        self.systems = [cu_ag_fcc(2, seed=i, first=i) for i in range(2)]
+        self.cmd = [sys.executable, "-c", STAND_IN, SOAP_DAT]
+        self.fixture = read_soap_dat(SOAP_DAT, 1)
+
+    def testRun(self):
+        self.assertEqual(self.fixture.shape, (1, self.config['num_kernel_components']))
+        np.testing.assert_array_equal(run_turbogap(self.systems[0], self.config, 3, self.cmd), self.fixture)
+        np.testing.assert_array_equal(run_turbogap(self.systems[0], self.config, idx=3, turbogap_cmd=self.cmd,
+            atomic_numbers_to_indices=self.maps[0]), self.fixture)
+
+    def testCompare(self):
+        cwd = os.listdir(os.getcwd())
+        errors = compare_with_turbogap(self.config, self.systems, True, *self.maps, idx=3,
+            turbogap_cmd=self.cmd, n_jobs=2)
+        #The positions written to input.xyz are rounded
+        for system, error in zip(self.systems, errors):
+            soap_m = calculate_turbosoap_descriptor(self.config, system, True, *self.maps, centers=3)
+            self.assertAlmostEqual(error, np.abs(self.fixture - soap_m).max(), delta=1e-6)
+        #Nothing is left in the working directory
+        self.assertEqual(os.listdir(os.getcwd()), cwd)
+
+    def testFailure(self):
+        with self.assertRaises(RuntimeError):
+            run_turbogap(self.systems[0], self.config, turbogap_cmd=[sys.executable, "-c", "exit(1)"])
+        #More components than the fixture
+        config = prepare_turbosoap_configuration(cu_ag_species(radial_enhancement=1), lmax=4)
+        with self.assertRaises(ValueError):
+            compare_with_turbogap(config, self.systems, True, *self.maps, idx=3, turbogap_cmd=self.cmd)
+        config = prepare_turbosoap_configuration(cu_ag_species(), lmax=3, compression={'lmax': 2})
+        with self.assertRaises(ValueError):
+            compare_with_turbogap(config, self.systems, True, *self.maps, idx=3, turbogap_cmd=self.cmd)
+
+    @unittest.skipUnless(shutil.which(TURBOGAP_CMD), "needs the TurboGAP binary")
+    def testBinary(self):
+        errors = compare_with_turbogap(self.config, self.systems, True, *self.maps)
+        self.assertLess(errors.max(), 1e-10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,11 +14,46 @@ the code author(s). If you want to use the TurboGAP code or parts thereof for co
 copyright holder, Miguel A. Caro (mcaroba@gmail.com).
 """
 
-from dscribe.utils.geometry import get_adjacency_matrix, get_extended_system
+import importlib
+import os
 import numpy as np
-import scipy.sparse
-from math import sqrt, acos, atan2
-import turbosoap_ext
+from .neighbors import get_neighbor_list, get_periodic_neighbor_list
+from .compression import prepare_compression, compress_turbosoap_descriptor
+from .timing import timed_stage
+
+#Number of kernel output values (sites times components) computed at once
+#when the output is compressed. Bounds the uncompressed scratch buffer.
+CHUNK_VALUES = 2**22
+
+#Chunks per thread when the kernel runs in several threads. More chunks
+#than threads even out differences in the cost per pair.
+THREAD_CHUNKS = 4
+
+#Global descriptors of a structure, reduced over the atoms
+AVERAGES = ('outer', 'sum', 'species')
+
+#Heavy modules which are only imported on first use, see warmup
+LAZY_MODULES = ('turbosoap_ext', 'scipy.sparse', 'scipy.spatial', 'concurrent.futures')
+
+def __getattr__(name):
+    #turbosoap_ext and scipy.sparse used to be imported eagerly and stay
+    #available as turbosoap_dscribe.turbosoap_ext and turbosoap_dscribe.scipy
+    if name == 'turbosoap_ext':
+        return importlib.import_module('turbosoap_ext')
+    if name == 'scipy':
+        importlib.import_module('scipy.sparse')
+        return importlib.import_module('scipy')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warmup():
+    """Imports the modules which are otherwise imported on first use.
+
+    Importing turbosoap_dscribe does not load the compiled kernel nor scipy.
+    Worker processes can call warmup once at startup so that the first
+    structure does not pay for the imports.
+    """
+    for module in LAZY_MODULES:
+        importlib.import_module(module)
 
 #TurboSOAPSpecie is used to define per-species parameters
 #prepare_turbosoap_configuration will then compile TurboSOAPSpecie
@@ -26,13 +61,15 @@ import turbosoap_ext
 #For consistency all the error checking is done in prepare_turbosoap_configuration
 #where all the information is available.
 
-def prepare_turbosoap_configuration(species, lmax = 8):
+def prepare_turbosoap_configuration(species, lmax = 8, compression = None):
     """Checks configuration parameters of each species and prepares them for fortran interface
     Order is significant. Same species given in different order correspond
     to different descriptor.
     Args:
         lmax (int): The maximum degree of spherical harmonics.
         species (iterable): List of TurboSOAPSpecie 
+        compression (dict): Optional compression recipe applied while the
+            descriptors are calculated, see turbosoap_dscribe.compression.
     Returns:
         Configuration values and np.ndarray which are in correct format 
         for turbosoap fortran interface
@@ -99,100 +136,372 @@ def prepare_turbosoap_configuration(species, lmax = 8):
 
 
     n = sum(config['nmax'])
-    config['num_components'] = n*(n+1)//2 * (config['lmax']+1)
+    #Size of the power spectrum computed by the kernel
+    config['num_kernel_components'] = n*(n+1)//2 * (config['lmax']+1)
+    if compression is None:
+        config['compression_indices'] = None
+        config['projection'] = None
+        config['num_components'] = config['num_kernel_components']
+    else:
+        indices, projection = prepare_compression(compression, config['nmax'], config['lmax'])
+        config['compression_indices'] = indices
+        config['projection'] = projection
+        config['num_components'] = len(indices) if projection is None else projection.shape[1]
 
     return config
 
 def calculate_turbosoap_descriptor(config, system, periodic, 
-    atomic_numbers_to_indices, atomic_numbers_to_rcuts):
-    rcuts = [atomic_numbers_to_rcuts[ n ] for n in system.numbers]
-    max_rcut = max(rcuts)
-    if periodic:
-        original_system = system
-        system = get_extended_system(system, max_rcut, return_cell_indices=False)
-        rcuts = [atomic_numbers_to_rcuts[ n ] for n in system.numbers]
-    n_sites = len(system)
-    species = [atomic_numbers_to_indices[ n ] for n in system.numbers]
-    f_species = np.empty((1,n_sites), dtype=int, order='F')
-    f_species[0,:] = np.array(species, dtype=int) + 1 #fortran indexing from 1
+    atomic_numbers_to_indices, atomic_numbers_to_rcuts, derivatives=False, n_threads=1, out=None, dtype=float,
+    centers=None, average=None):
+    """Calculates the TurboSOAP descriptor of every atom of a structure.
+    Args:
+        config (dict): Output of prepare_turbosoap_configuration.
+        system (ase.Atoms): The structure.
+        periodic (bool): Whether to use periodic boundary conditions.
+        atomic_numbers_to_indices (dict): Species index of each atomic number.
+        atomic_numbers_to_rcuts (dict): Cutoff of each atomic number.
+        derivatives (bool): Whether to also calculate the Cartesian
+            derivatives, see calculate_turbosoap_from_pairs.
+        n_threads (int): Number of threads running the kernel over chunks
+            of sites, see calculate_turbosoap_from_pairs.
+        out (np.ndarray): Array of shape (n_sites, num_components) to write
+            the descriptors into, see calculate_turbosoap_from_pairs.
+        dtype (np.dtype): Data type of the output, float64 or float32.
+        centers (int or iterable): Indices of the atoms whose descriptors
+            are calculated, counted from 0, see get_turbosoap_pairs.
+        average (str): Reduce the descriptors of the atoms to one global
+            descriptor, see calculate_turbosoap_from_pairs.
+    Returns:
+        np.ndarray: Descriptors, shape (n_sites, num_components). With
+        derivatives, a tuple of the descriptors and the derivatives. With
+        average, the global descriptor.
+    """
     assert len(atomic_numbers_to_indices) == len(config['rcut_hard'])
+    pairs = get_turbosoap_pairs(system, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts,
+        centers=centers)
+    return calculate_turbosoap_from_pairs(config, pairs, derivatives=derivatives, n_threads=n_threads,
+        out=out, dtype=dtype, average=average)
+
+def get_turbosoap_pairs(system, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts, centers=None):
+    """Builds the neighbour lists and per-pair arrays of a structure.
+
+    This is everything calculate_turbosoap_descriptor does before calling
+    the Fortran kernel, so it can be done ahead of time, e.g. for the next
+    frame while the kernel runs on the current one.
+    Args:
+        system (ase.Atoms): The structure.
+        periodic (bool): Whether to use periodic boundary conditions.
+        atomic_numbers_to_indices (dict): Species index of each atomic number.
+        atomic_numbers_to_rcuts (dict): Cutoff of each atomic number.
+        centers (int or iterable): Indices of the central atoms, counted
+            from 0 like the which_atom of TurboGAP minus one. The sites
+            follow this order. Defaults to all atoms in order.
+    Returns:
+        dict: Input arrays of get_soap, see build_turbosoap_pairs.
+    """
+    rcuts = np.array([atomic_numbers_to_rcuts[ n ] for n in system.numbers], dtype=float)
+    species = np.array([atomic_numbers_to_indices[ n ] for n in system.numbers], dtype=int)
     n_species = len(atomic_numbers_to_indices)
-    species_multiplicity = np.ones(n_sites, dtype=int)
     positions = system.positions
-    adj_m = get_adjacency_matrix(max_rcut, positions, system.positions)
-    adj_l = get_adjacency_list_rcut(adj_m, rcuts)
-
-    n_neigh = np.empty(n_sites, dtype=int)
-    n_atom_pairs = 0
-    for i,l in enumerate(adj_l):
-        num_neigh = len(l)
-        n_neigh[i] = num_neigh
-        n_atom_pairs += num_neigh
-
-    rjs = np.empty(n_atom_pairs, dtype=float)
-    thetas = np.empty(n_atom_pairs, dtype=float)
-    phis = np.empty(n_atom_pairs, dtype=float)
-    mask = np.zeros((n_atom_pairs, n_species), order='F', dtype=np.int8)
-    idx = 0
-    for nl in adj_l:
-        rjs[idx] = 0.0
-        thetas[idx] = 0.0
-        phis[idx] = 0.0
-        mask[idx, species[nl[0]]] = True
-        idx += 1
-        cpos = positions[nl[0]]
-        for n in nl[1:]:
-            p = system.positions[n] - cpos
-            d = p*p
-            d = sqrt(d[0] + d[1] + d[2])
-            rjs[idx] = d
-            thetas[idx] = acos(p[2]/d)
-            phis[idx] = atan2(p[1], p[0])
-            mask[idx, species[n]] = True
-            idx += 1
-    assert idx == n_atom_pairs
+    if centers is not None:
+        centers = _get_centers(centers, len(system))
+    with timed_stage('neighbors') as stage:
+        if periodic:
+            #Only the original atoms are central atoms, their periodic images
+            #enter as shifted neighbours
+            n_neigh, neighbors, shifts = get_periodic_neighbor_list(positions, system.cell, system.pbc, rcuts,
+                centers=centers)
+        else:
+            n_neigh, neighbors = get_neighbor_list(positions, rcuts, centers=centers)
+            shifts = None
+        stage.update(n_sites=len(n_neigh), n_atom_pairs=len(neighbors),
+            nbytes=n_neigh.nbytes + neighbors.nbytes + (0 if shifts is None else shifts.nbytes))
+    return build_turbosoap_pairs(positions, species, n_species, n_neigh, neighbors, shifts, sites=centers)
 
-    do_timing = False
-    do_derivatives = False 
-    n_soap = config['num_components']
-    soap_m = np.zeros((n_soap, n_sites), order='F')
-    soap_cart_der = np.empty((3, n_soap, n_atom_pairs), order='F')
-    #soap_cart_der = np.empty((1,1,1))
-    if False:
-        print(soap_m.shape)
-        print(n_neigh)
-        print(n_species)
-        print(f_species)
-        print(species_multiplicity)
-        print(n_atom_pairs)
-        print(mask)
-        print(rjs)
-        print(thetas)
-        print(phis)
-        print("Dictionary info:")
-        for k,v in config.items():
-            print(f"{k}: {v}")
-            
-    turbosoap_ext.soap_desc.get_soap(n_sites, n_neigh, n_species, f_species, 
-            species_multiplicity, n_atom_pairs,
-            mask, rjs, thetas, phis, config['nmax'], config['lmax'], 
-            config['rcut_hard'], config['rcut_soft'], config['nf'], config['global_scaling'], 
-            config['atom_sigma_r'], config['atom_sigma_r_scaling'], 
-            config['atom_sigma_t'], config['atom_sigma_t_scaling'],
-            config['amplitude_scaling'], config['radial_enhancement'], config['central_weight'], 
-            config['basis'], config['scaling_mode'], do_timing,
-            do_derivatives, soap_m, soap_cart_der)
-    soap_m = np.ascontiguousarray(soap_m.T)
-    if periodic:
-        #We "map" results back to original systems. We assume that the order of the atoms is unchanged i.e. the original unit cells atoms are first
-        num_original_sites = len(original_system)
-        soap_m = soap_m[0:num_original_sites]
+def _get_centers(centers, n_atoms):
+    #Central atom indices as an integer array, checked against the system
+    centers = np.atleast_1d(np.asarray(centers))
+    if centers.ndim != 1 or (len(centers) and centers.dtype.kind not in 'iu'):
+        raise ValueError(f"centers must be atom indices. centers={centers}")
+    centers = centers.astype(int)
+    if len(centers) and (centers.min() < 0 or centers.max() >= n_atoms):
+        raise ValueError(f"centers must be between 0 and {n_atoms - 1}. centers={centers}")
+    return centers
+
+def build_turbosoap_pairs(positions, species, n_species, n_neigh, neighbors, shifts=None, sites=None,
+    workspace=None):
+    """Computes the input arrays of get_soap from neighbour lists.
+    Args:
+        positions (np.ndarray): Cartesian positions of all atoms.
+        species (np.ndarray): Species index of all atoms.
+        n_species (int): Number of species in the configuration.
+        n_neigh (np.ndarray): Number of entries for each central atom,
+            the central atom included.
+        neighbors (np.ndarray): Flat neighbour indices, each block starting
+            with the central atom.
+        shifts (np.ndarray): Lattice translations of the neighbours under
+            periodic boundary conditions.
+        sites (np.ndarray): Atom index of each central atom. Defaults to
+            all atoms in order.
+        workspace (Workspace): Buffers for the pair arrays, see
+            turbosoap_dscribe.compiled. The arrays are overwritten by the
+            next call with the same workspace.
+    Returns:
+        dict: 'n_sites', 'sites', 'species' of the central atoms,
+        'n_neigh', 'neighbors', 'rjs', 'thetas', 'phis' and 'mask'.
+    """
+    with timed_stage('pairs') as stage:
+        if sites is None:
+            sites = np.arange(len(n_neigh))
+        centers = np.repeat(sites, n_neigh)
+        if shifts is None:
+            vectors = positions[neighbors] - positions[centers]
+        else:
+            vectors = positions[neighbors] + shifts - positions[centers]
+        rjs, thetas, phis, mask = get_pair_arrays(vectors, n_neigh, species[neighbors], n_species, workspace)
+        stage.update(n_sites=len(sites), n_atom_pairs=len(rjs),
+            nbytes=0 if workspace is not None else rjs.nbytes + thetas.nbytes + phis.nbytes + mask.nbytes)
+    return {'n_sites': len(sites), 'sites': sites, 'species': species[sites], 'n_neigh': n_neigh,
+        'neighbors': neighbors, 'rjs': rjs, 'thetas': thetas, 'phis': phis, 'mask': mask}
+
+def calculate_turbosoap_from_pairs(config, pairs, derivatives=False, workspace=None, n_threads=1,
+    out=None, dtype=float, average=None):
+    """Runs the TurboSOAP kernel on the output of get_turbosoap_pairs.
+
+    The derivatives are given per neighbour pair, following the neighbour
+    lists: entry k is the derivative of the descriptor of atom centers[k]
+    with respect to the position of atom neighbors[k]. The entries where
+    the two are the same atom are the derivatives with respect to the
+    central atom itself. Under periodic boundary conditions neighbors[k]
+    is the original atom of the image.
+
+    The kernel fills a Fortran ordered (num_components, n_sites) array,
+    which is the transposed view of a C ordered (n_sites, num_components)
+    array, so double precision output without compression is written in
+    place, into out if it is given. Otherwise, with a compression recipe
+    or a different dtype, the kernel runs over chunks of sites and every
+    chunk is compressed and converted right away, so the full double
+    precision power spectrum of all sites is never stored. With several
+    threads the sites are split into chunks of about equal numbers of
+    pairs which are calculated concurrently.
+
+    With average the chunks are summed as they are done, so only the
+    global descriptor is stored:
+        'outer': mean of the descriptors of the sites,
+        'sum': sum of the descriptors of the sites,
+        'species': mean over the sites of each species, zero for species
+            without sites, concatenated in species order.
+    Averaging the expansion coefficients before the power spectrum, the
+    'inner' average of dscribe, needs coefficients the kernel does not
+    return.
+    Args:
+        config (dict): Output of prepare_turbosoap_configuration.
+        pairs (dict): Output of get_turbosoap_pairs.
+        derivatives (bool): Whether to also calculate the derivatives.
+        workspace (Workspace): Reused buffers for the kernel scratch
+            arrays, see turbosoap_dscribe.compiled. The returned arrays
+            are never part of the workspace.
+        n_threads (int): Number of threads running the kernel over chunks
+            of sites. None for the number of CPUs. Opt-in: the threads
+            call get_soap concurrently, which is only correct if the
+            compiled kernel keeps no mutable state between calls. This
+            has not been verified against soap.f90, check a build with
+            TestCompiledThreads in tests/descriptor_test.py first.
+        out (np.ndarray): Array of shape (n_sites, num_components) to write
+            the descriptors into, e.g. rows of a larger array or memmap.
+            Its dtype is the output dtype.
+        dtype (np.dtype): Data type of the output, float64 or float32.
+        average (str): 'outer', 'sum' or 'species', see above.
+    Returns:
+        np.ndarray: Descriptors, shape (n_sites, num_components). With
+        derivatives, a tuple of the descriptors and a dict with
+        'soap_cart_der' of shape (n_atom_pairs, num_components, 3) and the
+        'centers' and 'neighbors' atom indices of the pairs. With average,
+        the global descriptor of shape (get_num_features(config, average),).
+    """
+    n_sites = pairs['n_sites']
+    n_neigh = pairs['n_neigh']
+    n_atom_pairs = len(pairs['rjs'])
+    #Integers and logicals are C ints on the Fortran side
+    f_species = _empty(workspace, 'f_species', (1,n_sites), np.intc)
+    f_species[0,:] = pairs['species'] + 1 #fortran indexing from 1
+    n_soap = config['num_kernel_components']
+    n_out = config['num_components']
+
+    compressed = config['compression_indices'] is not None
+    if n_threads is None:
+        n_threads = os.cpu_count()
+    if n_threads < 1:
+        raise ValueError(f"n_threads must be positive. n_threads={n_threads}")
+    if average == 'inner':
+        raise ValueError("Inner averaging needs the expansion coefficients, which the kernel does not return")
+    if average is not None and average not in AVERAGES:
+        raise ValueError(f"average must be one of {AVERAGES}. average={average}")
+    if average is not None and derivatives:
+        raise ValueError("Derivatives of averaged descriptors are not supported")
+    if average is None:
+        shape = (n_sites, n_out)
+    else:
+        shape = (get_num_features(config, average),)
+    if out is not None:
+        if out.shape != shape:
+            raise ValueError(f"out must have shape {shape}. out.shape={out.shape}")
+        dtype = out.dtype
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float64, np.float32):
+        raise ValueError(f"dtype must be float64 or float32. dtype={dtype}")
+    #In place the kernel writes straight into the columns of the
+    #transposed output. Otherwise the power spectrum only exists for one
+    #chunk of sites at a time.
+    in_place = (average is None and not compressed and dtype == np.float64
+        and (out is None or out.flags.c_contiguous))
+    if in_place:
+        if out is None:
+            soap_m = np.zeros((n_sites, n_soap))
+        else:
+            soap_m = out
+            soap_m.fill(0.0)
+        soap_f = soap_m.T
+        if derivatives:
+            #Transposing the Fortran ordered array gives a C ordered
+            #(n_atom_pairs, n_soap, 3) view without copying
+            soap_cart_der = np.zeros((3, n_soap, n_atom_pairs), order='F')
+        max_sites = max(1, n_sites)
+    else:
+        #With average only the chunk sums are kept
+        if average is None:
+            soap_m = np.empty((n_sites, n_out), dtype=dtype) if out is None else out
+        if derivatives:
+            soap_cart_der = np.empty((n_atom_pairs, n_out, 3), dtype=dtype)
+        max_sites = max(1, CHUNK_VALUES // n_soap)
+    first = np.cumsum(n_neigh) - n_neigh
+    #Each thread needs its own scratch arrays
+    chunk_workspace = workspace if n_threads == 1 else None
+
+    def calculate_chunk(start, stop):
+        pair_slice = slice(first[start], first[stop - 1] + n_neigh[stop - 1])
+        if in_place:
+            soap_chunk = soap_f[:, start:stop]
+        else:
+            soap_chunk = _empty(chunk_workspace, 'soap_m', (n_soap, stop - start))
+            soap_chunk.fill(0.0)
+        if derivatives and in_place:
+            der_chunk = soap_cart_der[:, :, pair_slice]
+        elif derivatives:
+            der_chunk = _empty(chunk_workspace, 'soap_cart_der', (3, n_soap, pair_slice.stop - pair_slice.start))
+            der_chunk.fill(0.0)
+        else:
+            #Not touched by the kernel without derivatives
+            der_chunk = _empty(chunk_workspace, 'soap_cart_der', (1,1,1))
+        _get_soap(config, n_neigh[start:stop], f_species[:, start:stop], pairs['mask'][pair_slice],
+            pairs['rjs'][pair_slice], pairs['thetas'][pair_slice], pairs['phis'][pair_slice],
+            derivatives, soap_chunk, der_chunk)
+        if not in_place:
+            with timed_stage('post') as stage:
+                if compressed:
+                    rows = compress_turbosoap_descriptor(config, soap_chunk.T)
+                else:
+                    rows = soap_chunk.T
+                stage.update(n_sites=stop - start)
+                if average == 'species':
+                    #Sums of the rows of each species
+                    weights = pairs['species'][start:stop] == np.arange(config['num_species'])[:, None]
+                    return weights.astype(float) @ rows
+                elif average is not None:
+                    return rows.sum(axis=0)
+                soap_m[start:stop] = rows
+                if derivatives and compressed:
+                    soap_cart_der[pair_slice] = compress_turbosoap_descriptor(config, der_chunk.T, axis=1)
+                elif derivatives:
+                    soap_cart_der[pair_slice] = der_chunk.T
+
+    bounds = _get_site_chunks(n_neigh, 1 if n_threads == 1 else THREAD_CHUNKS*n_threads, max_sites)
+    if n_threads == 1 or len(bounds) <= 2:
+        sums = [calculate_chunk(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+    else:
+        #The kernel releases the GIL, so the chunks run in parallel
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            sums = list(executor.map(calculate_chunk, bounds[:-1], bounds[1:]))
+
+    if average is not None:
+        #Summed in chunk order, so the result does not depend on n_threads
+        total = np.zeros((config['num_species'], n_out) if average == 'species' else n_out)
+        for chunk_sum in sums:
+            total += chunk_sum
+        if average == 'outer':
+            total /= max(n_sites, 1)
+        elif average == 'species':
+            total /= np.maximum(np.bincount(pairs['species'], minlength=config['num_species']), 1)[:, None]
+        if out is None:
+            return total.ravel().astype(dtype)
+        out[:] = total.ravel()
+        return out
+
+    if derivatives:
+        if in_place:
+            soap_cart_der = soap_cart_der.T
+        return soap_m, {'soap_cart_der': soap_cart_der,
+            'centers': np.repeat(pairs['sites'], n_neigh),
+            'neighbors': pairs['neighbors']}
     return soap_m
 
+def get_num_features(config, average=None):
+    """Length of the descriptor of a site, or of the global descriptor.
+    Args:
+        config (dict): Output of prepare_turbosoap_configuration.
+        average (str): Global descriptor, see calculate_turbosoap_from_pairs.
+    Returns:
+        int: Number of features.
+    """
+    if average == 'species':
+        return config['num_species']*config['num_components']
+    return config['num_components']
+
+def _get_site_chunks(n_neigh, n_chunks, max_sites):
+    #Boundaries of contiguous site ranges of about equal numbers of pairs
+    #and at most max_sites sites
+    n_sites = len(n_neigh)
+    if n_sites == 0:
+        return np.zeros(1, dtype=int)
+    ends = np.cumsum(n_neigh)
+    targets = np.linspace(0, ends[-1], n_chunks + 1)[1:-1]
+    bounds = np.concatenate([np.searchsorted(ends, targets, side='right'),
+        np.arange(0, n_sites, max_sites), [n_sites]])
+    return np.unique(bounds)
+
+def _empty(workspace, name, shape, dtype=float):
+    #Fortran ordered scratch array, from the workspace if there is one
+    if workspace is None:
+        return np.empty(shape, dtype=dtype, order='F')
+    return workspace.empty(name, shape, dtype)
+
+def _get_soap(config, n_neigh, f_species, mask, rjs, thetas, phis, do_derivatives, soap_m, soap_cart_der):
+    #Calls the Fortran kernel, which fills soap_m and soap_cart_der in place
+    n_sites = len(n_neigh)
+    n_atom_pairs = len(rjs)
+    n_species = mask.shape[1]
+    species_multiplicity = np.ones(n_sites, dtype=int)
+    #The Fortran timings are only printed, use turbosoap_dscribe.timing
+    do_timing = False
+    import turbosoap_ext
+    with timed_stage('kernel') as stage:
+        turbosoap_ext.soap_desc.get_soap(n_sites, n_neigh, n_species, f_species, 
+                species_multiplicity, n_atom_pairs,
+                mask, rjs, thetas, phis, config['nmax'], config['lmax'], 
+                config['rcut_hard'], config['rcut_soft'], config['nf'], config['global_scaling'], 
+                config['atom_sigma_r'], config['atom_sigma_r_scaling'], 
+                config['atom_sigma_t'], config['atom_sigma_t_scaling'],
+                config['amplitude_scaling'], config['radial_enhancement'], config['central_weight'], 
+                config['basis'], config['scaling_mode'], do_timing,
+                do_derivatives, soap_m, soap_cart_der)
+        stage.update(n_sites=n_sites, n_atom_pairs=n_atom_pairs)
+
 #Multiple rcut aware version of adjacency list construction.
 #Also aware of soap.f90 convention where central atom is at the center 
 #Original in dscribe/utils/geometry.py
 def get_adjacency_list_rcut(adjacency_matrix, rcuts):
+    import scipy.sparse
     if type(adjacency_matrix) != scipy.sparse.coo_matrix:
         adjacency_matrix = adjacency_matrix.tocoo()
     assert adjacency_matrix.shape[0] == len(rcuts)
@@ -201,3 +510,42 @@ def get_adjacency_list_rcut(adjacency_matrix, rcuts):
         if d <= rcuts[i] and i != j:
             adjacency_list[i].append(j)
     return adjacency_list
+
+def get_pair_arrays(vectors, n_neigh, neighbor_species, n_species, workspace=None):
+    """Computes the per-pair input arrays of get_soap.
+
+    rjs and mask equal those of the original per-pair loop exactly. The
+    angles come from the numpy arccos/arctan2 loops, which can differ from
+    the scalar libm functions of that loop in the last bit.
+    Args:
+        vectors (np.ndarray): Displacement from the central atom to the
+            neighbour for every pair. Zero for the central atom entries.
+        n_neigh (np.ndarray): Number of entries for each central atom.
+        neighbor_species (np.ndarray): Species index of every neighbour.
+        n_species (int): Number of species in the configuration.
+        workspace (Workspace): Buffers to use for the returned arrays.
+    Returns:
+        rjs, thetas, phis (np.ndarray): Spherical coordinates of the pairs.
+        mask (np.ndarray): Fortran ordered species mask of the pairs.
+    """
+    n_atom_pairs = len(vectors)
+    first = np.cumsum(n_neigh) - n_neigh
+    is_neighbor = np.ones(n_atom_pairs, dtype=bool)
+    is_neighbor[first] = False
+    p = vectors[is_neighbor]
+    d = p*p
+    d = np.sqrt(d[:,0] + d[:,1] + d[:,2])
+
+    rjs = _empty(workspace, 'rjs', n_atom_pairs)
+    thetas = _empty(workspace, 'thetas', n_atom_pairs)
+    phis = _empty(workspace, 'phis', n_atom_pairs)
+    rjs[first] = 0.0
+    thetas[first] = 0.0
+    phis[first] = 0.0
+    rjs[is_neighbor] = d
+    thetas[is_neighbor] = np.arccos(p[:,2]/d)
+    phis[is_neighbor] = np.arctan2(p[:,1], p[:,0])
+    mask = _empty(workspace, 'mask', (n_atom_pairs, n_species), np.intc)
+    mask.fill(0)
+    mask[np.arange(n_atom_pairs), neighbor_species] = 1
+    return rjs, thetas, phis, mask
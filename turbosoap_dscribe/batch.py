@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Descriptors for many structures in one call.
+
+The structures are split into tasks of roughly equal atom count which are
+handed to a process pool. The configuration is sent to each worker once
+when the worker starts, not with every task, and the worker imports the
+compiled kernel before its first task.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+
+from turbosoap_dscribe import calculate_turbosoap_descriptor, get_num_features, warmup
+
+#Target number of atoms per task. Small enough to balance the load between
+#workers, large enough to amortize the inter-process communication.
+CHUNK_ATOMS = 2000
+
+#Per-worker arguments set by _init_worker
+_worker_args = None
+
+def calculate_turbosoap_descriptors(config, systems, periodic,
+    atomic_numbers_to_indices, atomic_numbers_to_rcuts, n_jobs=None, chunk_atoms=CHUNK_ATOMS, out=None,
+    dtype=float, average=None):
+    """Calculates the TurboSOAP descriptors of many structures.
+    Args:
+        config (dict): Output of prepare_turbosoap_configuration.
+        systems (iterable): ase.Atoms structures. Can be a generator, it is
+            consumed as the tasks are submitted.
+        periodic (bool): Whether to use periodic boundary conditions.
+        atomic_numbers_to_indices (dict): Species index of each atomic number.
+        atomic_numbers_to_rcuts (dict): Cutoff of each atomic number.
+        n_jobs (int): Number of worker processes. Defaults to the number of
+            CPUs. With n_jobs=1 everything runs in the calling process.
+        chunk_atoms (int): Approximate number of atoms per task.
+        out (DescriptorStore): If given, the descriptors of each structure
+            are appended to this store, keyed by the structure hash, as soon
+            as its task is done instead of being stacked in memory. Its rows
+            must have get_num_features(config, average) components, which
+            rules out average='species' with a store created for config.
+        dtype (np.dtype): Data type of the descriptors, float64 or float32.
+        average (str): One global descriptor per structure instead of the
+            descriptors of the atoms, reduced while they are calculated,
+            see calculate_turbosoap_from_pairs.
+    Returns:
+        soap (np.ndarray): Descriptors of all atoms stacked in input order,
+            shape (n_total_sites, num_components). With average, one row
+            per structure. Not returned with out.
+        offsets (np.ndarray): Rows offsets[i]:offsets[i+1] of soap belong
+            to the i:th structure.
+    """
+    if n_jobs is None:
+        n_jobs = os.cpu_count()
+    if n_jobs < 1:
+        raise ValueError(f"n_jobs must be positive. n_jobs={n_jobs}")
+    n_soap = get_num_features(config, average)
+    if out is not None and out.num_components != n_soap:
+        raise ValueError(f"The descriptor store holds {out.num_components} components per row, "
+            f"average={average} gives {n_soap}")
+    args = (config, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts, np.dtype(dtype), average)
+
+    blocks = []
+    def collect(chunk, block):
+        #Results arrive in input order
+        if out is None:
+            blocks.append(block)
+            return
+        soap_m, block_counts = block
+        for system, start, stop in zip(chunk, np.cumsum(block_counts) - block_counts, np.cumsum(block_counts)):
+            out.append(soap_m[start:stop], system=system)
+        blocks.append((None, block_counts))
+
+    if n_jobs == 1:
+        for chunk in _chunks(systems, chunk_atoms):
+            collect(chunk, _calculate_chunk(chunk, args))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=args) as pool:
+            #Idle workers pick up the next pending task. Tasks are submitted
+            #lazily so that long generators are not loaded all at once.
+            futures = []
+            for chunk in _chunks(systems, chunk_atoms):
+                futures.append((chunk, pool.submit(_calculate_chunk, chunk)))
+                if len(futures) >= 4*n_jobs:
+                    chunk, future = futures.pop(0)
+                    collect(chunk, future.result())
+            for chunk, future in futures:
+                collect(chunk, future.result())
+
+    counts = [c for _, block_counts in blocks for c in block_counts]
+    offsets = np.zeros(len(counts) + 1, dtype=int)
+    np.cumsum(counts, out=offsets[1:])
+    if out is not None:
+        return offsets
+    if blocks:
+        soap = np.concatenate([soap_m for soap_m, _ in blocks])
+    else:
+        soap = np.empty((0, n_soap), dtype=dtype)
+    return soap, offsets
+
+def _chunks(systems, chunk_atoms):
+    #Groups consecutive structures into lists of about chunk_atoms atoms
+    chunk = []
+    n_atoms = 0
+    for system in systems:
+        chunk.append(system)
+        n_atoms += len(system)
+        if n_atoms >= chunk_atoms:
+            yield chunk
+            chunk = []
+            n_atoms = 0
+    if chunk:
+        yield chunk
+
+def _init_worker(config, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts, dtype, average):
+    global _worker_args
+    _worker_args = (config, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts, dtype, average)
+    warmup()
+
+def _calculate_chunk(systems, args=None):
+    #args defaults to those of the worker process, see _init_worker
+    config, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts, dtype, average = args or _worker_args
+    if average is None:
+        counts = [len(system) for system in systems]
+    else:
+        counts = [1]*len(systems)
+    #Every structure is written straight into its rows of the block
+    soap_m = np.empty((sum(counts), get_num_features(config, average)), dtype=dtype)
+    start = 0
+    for system, count in zip(systems, counts):
+        calculate_turbosoap_descriptor(config, system, periodic, atomic_numbers_to_indices,
+            atomic_numbers_to_rcuts, out=soap_m[start] if average is not None else soap_m[start:start + count],
+            average=average)
+        start += count
+    return soap_m, counts
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of TurboSOAP descriptors.
+
+Descriptors are keyed by a hash of the structure (see
+turbosoap_dscribe.store.get_structure_hash), of every value of the
+configuration and of the species maps, so the same structure with the
+same parameters is only calculated once. Recently used results are kept
+in memory, and optionally in a directory of .npy files which can be
+shared between runs. Both tiers are bounded in bytes and evict the least
+recently used entries first.
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from turbosoap_dscribe import calculate_turbosoap_descriptor
+from turbosoap_dscribe.store import get_structure_hash
+
+def get_config_hash(config):
+    """Hashes all values of a configuration.
+    Args:
+        config (dict): Output of prepare_turbosoap_configuration.
+    Returns:
+        str: Hexadecimal SHA-1 digest.
+    """
+    h = hashlib.sha1()
+    for key in sorted(config):
+        value = config[key]
+        h.update(key.encode())
+        if isinstance(value, np.ndarray):
+            h.update(f"{value.dtype.str}{value.shape}".encode())
+            h.update(np.ascontiguousarray(value).tobytes())
+        else:
+            h.update(repr(value).encode())
+    return h.hexdigest()
+
+class DescriptorCache:
+    """Calculates descriptors through an LRU cache.
+
+    Returned arrays are shared with the cache and therefore read-only.
+    The statistics hits, disk_hits and misses count the calls served from
+    memory, from disk and by calculating.
+    """
+    def __init__(self, max_bytes=2**30, directory=None, max_disk_bytes=2**34):
+        """
+        Args:
+            max_bytes (int): Size limit of the in-memory tier.
+            directory (str): Directory of the on-disk tier. No disk tier
+                if None.
+            max_disk_bytes (int): Size limit of the on-disk tier.
+        """
+        if max_bytes < 0 or max_disk_bytes < 0:
+            raise ValueError(f"Cache sizes cannot be negative. max_bytes={max_bytes}, max_disk_bytes={max_disk_bytes}")
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self.memory_bytes = 0
+        self._disk = OrderedDict()
+        self.disk_bytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            #Entries left by earlier runs, least recently used first
+            entries = []
+            for entry in os.scandir(directory):
+                if entry.name.endswith('.npy'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+            for _, key, size in sorted(entries):
+                self._disk[key] = size
+                self.disk_bytes += size
+            self._evict_disk()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def calculate(self, config, system, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts):
+        """Cached calculate_turbosoap_descriptor.
+        Args:
+            config (dict): Output of prepare_turbosoap_configuration.
+            system (ase.Atoms): The structure.
+            periodic (bool): Whether to use periodic boundary conditions.
+            atomic_numbers_to_indices (dict): Species index of each atomic number.
+            atomic_numbers_to_rcuts (dict): Cutoff of each atomic number.
+        Returns:
+            np.ndarray: Read-only descriptors, shape (n_sites, num_components).
+        """
+        key = self.get_key(config, system, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts)
+        soap_m = self._memory.get(key)
+        if soap_m is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return soap_m
+        soap_m = self._load(key)
+        if soap_m is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            soap_m = calculate_turbosoap_descriptor(config, system, periodic,
+                atomic_numbers_to_indices, atomic_numbers_to_rcuts)
+            self._save(key, soap_m)
+        soap_m.setflags(write=False)
+        self._remember(key, soap_m)
+        return soap_m
+
+    def get_key(self, config, system, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts):
+        """Cache key of a calculation."""
+        h = hashlib.sha1()
+        h.update(get_structure_hash(system).encode())
+        h.update(get_config_hash(config).encode())
+        h.update(repr((bool(periodic), sorted(atomic_numbers_to_indices.items()),
+            sorted(atomic_numbers_to_rcuts.items()))).encode())
+        return h.hexdigest()
+
+    def clear(self):
+        """Empties the in-memory tier and resets the statistics."""
+        self._memory.clear()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key, soap_m):
+        if soap_m.nbytes > self.max_bytes:
+            return
+        self._memory[key] = soap_m
+        self.memory_bytes += soap_m.nbytes
+        while self.memory_bytes > self.max_bytes:
+            _, old = self._memory.popitem(last=False)
+            self.memory_bytes -= old.nbytes
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def _load(self, key):
+        if key not in self._disk:
+            return None
+        try:
+            soap_m = np.load(self._filename(key))
+            os.utime(self._filename(key))
+        except (OSError, ValueError):
+            #Removed or truncated by another process
+            self.disk_bytes -= self._disk.pop(key)
+            return None
+        self._disk.move_to_end(key)
+        return soap_m
+
+    def _save(self, key, soap_m):
+        if self.directory is None:
+            return
+        #Write to a temporary file first so that readers never see a
+        #partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, soap_m)
+        size = os.path.getsize(tmp)
+        if size > self.max_disk_bytes:
+            os.remove(tmp)
+            return
+        os.replace(tmp, self._filename(key))
+        self.disk_bytes += size - self._disk.pop(key, 0)
+        self._disk[key] = size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        while self.disk_bytes > self.max_disk_bytes:
+            key, size = self._disk.popitem(last=False)
+            self.disk_bytes -= size
+            try:
+                os.remove(self._filename(key))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Descriptor object with everything configuration dependent done once.
+
+calculate_turbosoap_descriptor looks up the species and cutoff of every
+atom in dicts and allocates all kernel arrays on every call, which
+dominates the run time for small molecules. TurboSOAPDescriptor turns the
+species maps into lookup tables indexed by atomic number, converts the
+configuration to the types of the Fortran interface once and keeps the
+kernel input and scratch arrays in a workspace which only grows.
+"""
+
+from math import prod
+
+import numpy as np
+
+from turbosoap_dscribe import build_turbosoap_pairs, calculate_turbosoap_from_pairs, _get_centers
+from turbosoap_dscribe.neighbors import get_neighbor_list, get_periodic_neighbor_list
+from turbosoap_dscribe.timing import timed_stage
+
+class Workspace:
+    """Named scratch buffers reused between calls.
+
+    A buffer is reallocated only when a call needs more memory than it
+    has, with some headroom, so a sequence of similar calls settles on a
+    fixed set of buffers.
+    """
+    def __init__(self):
+        self._buffers = {}
+
+    def empty(self, name, shape, dtype=float):
+        """Uninitialized Fortran ordered array backed by the named buffer."""
+        size = prod(shape) if isinstance(shape, tuple) else shape
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or len(buffer) < size:
+            if buffer is not None and buffer.dtype == dtype:
+                size = max(size, len(buffer) + len(buffer)//2)
+            buffer = np.empty(size, dtype=dtype)
+            self._buffers[name] = buffer
+            size = prod(shape) if isinstance(shape, tuple) else shape
+        return buffer[:size].reshape(shape, order='F')
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+class TurboSOAPDescriptor:
+    """TurboSOAP descriptor calculator for a fixed configuration.
+
+    Not thread-safe, every thread should have its own object.
+    """
+    def __init__(self, config, atomic_numbers_to_indices, atomic_numbers_to_rcuts, periodic=False, n_threads=1,
+        dtype=float):
+        """
+        Args:
+            config (dict): Output of prepare_turbosoap_configuration.
+            atomic_numbers_to_indices (dict): Species index of each atomic number.
+            atomic_numbers_to_rcuts (dict): Cutoff of each atomic number.
+            periodic (bool): Whether to use periodic boundary conditions.
+            n_threads (int): Number of threads running the kernel, see
+                calculate_turbosoap_from_pairs.
+            dtype (np.dtype): Data type of the output, float64 or float32.
+        """
+        if len(atomic_numbers_to_indices) != config['num_species']:
+            raise ValueError(
+                f"Expected {config['num_species']} species, got atomic numbers {sorted(atomic_numbers_to_indices)}"
+            )
+        self.periodic = periodic
+        self.n_threads = n_threads
+        self.dtype = np.dtype(dtype)
+        self.n_species = config['num_species']
+        #Kernel input types, so that f2py does not convert them on every call
+        self.config = dict(config)
+        for key, value in config.items():
+            if isinstance(value, np.ndarray) and value.dtype.kind == 'i':
+                self.config[key] = np.ascontiguousarray(value, dtype=np.intc)
+            elif isinstance(value, np.ndarray):
+                self.config[key] = np.ascontiguousarray(value)
+        #Lookup tables indexed by atomic number, -1 for unknown elements
+        size = max(atomic_numbers_to_indices) + 1
+        self.species_table = np.full(size, -1, dtype=int)
+        self.rcut_table = np.zeros(size)
+        for number, index in atomic_numbers_to_indices.items():
+            self.species_table[number] = index
+            self.rcut_table[number] = atomic_numbers_to_rcuts[number]
+        self.workspace = Workspace()
+
+    def calculate(self, system, derivatives=False, out=None, centers=None, average=None):
+        """Calculates the descriptor of every atom of a structure.
+        Args:
+            system (ase.Atoms): The structure.
+            derivatives (bool): Whether to also calculate the Cartesian
+                derivatives, see calculate_turbosoap_from_pairs.
+            out (np.ndarray): Array of shape (n_sites, num_components) to
+                write the descriptors into.
+            centers (int or iterable): Indices of the central atoms,
+                see get_turbosoap_pairs.
+            average (str): Global descriptor instead of the sites, see
+                calculate_turbosoap_from_pairs.
+        Returns:
+            np.ndarray: Descriptors, shape (n_sites, num_components). With
+            derivatives, a tuple of the descriptors and the derivatives.
+            With average, the global descriptor.
+        """
+        numbers = system.numbers
+        if len(numbers) and numbers.max() >= len(self.species_table):
+            self._raise_unknown(numbers)
+        species = self.species_table[numbers]
+        if np.any(species < 0):
+            self._raise_unknown(numbers)
+        rcuts = self.rcut_table[numbers]
+        positions = system.positions
+        if centers is not None:
+            centers = _get_centers(centers, len(numbers))
+        with timed_stage('neighbors') as stage:
+            if self.periodic:
+                n_neigh, neighbors, shifts = get_periodic_neighbor_list(positions, system.cell, system.pbc, rcuts,
+                    centers=centers)
+            else:
+                n_neigh, neighbors = get_neighbor_list(positions, rcuts, centers=centers)
+                shifts = None
+            stage.update(n_sites=len(n_neigh), n_atom_pairs=len(neighbors),
+                nbytes=n_neigh.nbytes + neighbors.nbytes + (0 if shifts is None else shifts.nbytes))
+        pairs = build_turbosoap_pairs(positions, species, self.n_species, n_neigh, neighbors, shifts,
+            sites=centers, workspace=self.workspace)
+        return calculate_turbosoap_from_pairs(self.config, pairs, derivatives=derivatives,
+            workspace=self.workspace, n_threads=self.n_threads, out=out, dtype=self.dtype,
+            average=average)
+
+    def _raise_unknown(self, numbers):
+        numbers = np.unique(numbers)
+        known = numbers < len(self.species_table)
+        known[known] = self.species_table[numbers[known]] >= 0
+        raise ValueError(f"No species defined for atomic numbers {numbers[~known].tolist()}")
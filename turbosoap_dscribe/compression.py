@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Compression of the TurboSOAP power spectrum at compute time.
+
+The kernel orders the components by the pair of radial indices (n, n')
+with n <= n' and then by l, l running fastest. The radial indices run
+over all species, species after species in configuration order, so every
+component belongs to a pair of species.
+
+A compression recipe is a dict with any of the keys
+    'species_pairs': pairs of species indices (i, j) to keep,
+    'nmax': number of radial functions to keep for each species,
+    'lmax': largest angular degree to keep,
+    'projection': matrix of shape (n_selected, n_out) applied after the
+        selection above, e.g. from a PCA of a reference set.
+The kernel normalizes the full power spectrum, so the compressed vectors
+are in general not of unit length.
+"""
+
+import numpy as np
+
+def get_component_labels(nmax, lmax):
+    """Labels the components of the uncompressed power spectrum.
+    Args:
+        nmax (iterable): Number of radial functions of each species.
+        lmax (int): The maximum degree of spherical harmonics.
+    Returns:
+        n1, n2, l (np.ndarray): Global radial indices and the angular
+            degree of each component.
+    """
+    n1, n2 = np.triu_indices(int(np.sum(nmax)))
+    n_l = lmax + 1
+    return np.repeat(n1, n_l), np.repeat(n2, n_l), np.tile(np.arange(n_l), len(n1))
+
+def prepare_compression(compression, nmax, lmax):
+    """Checks a compression recipe and turns it into component indices.
+    Args:
+        compression (dict): The recipe, see the module documentation.
+        nmax (np.ndarray): Number of radial functions of each species.
+        lmax (int): The maximum degree of spherical harmonics.
+    Returns:
+        indices (np.ndarray): Indices of the kept components.
+        projection (np.ndarray): Projection matrix or None.
+    """
+    unknown = set(compression) - {'species_pairs', 'nmax', 'lmax', 'projection'}
+    if unknown:
+        raise ValueError(f"Unknown compression options: {sorted(unknown)}")
+    num_species = len(nmax)
+    n1, n2, l = get_component_labels(nmax, lmax)
+    radial_species = np.repeat(np.arange(num_species), nmax)
+    radial_order = np.concatenate([np.arange(n) for n in nmax])
+    keep = np.ones(len(l), dtype=bool)
+
+    if 'species_pairs' in compression:
+        pairs = np.zeros((num_species, num_species), dtype=bool)
+        for i, j in compression['species_pairs']:
+            if not (0 <= i < num_species and 0 <= j < num_species):
+                raise ValueError(f"Species pair ({i}, {j}) out of range for {num_species} species")
+            pairs[i, j] = pairs[j, i] = True
+        keep &= pairs[radial_species[n1], radial_species[n2]]
+    if 'nmax' in compression:
+        nmax_kept = np.asarray(compression['nmax'], dtype=int)
+        if nmax_kept.shape != (num_species,) or np.any(nmax_kept < 1) or np.any(nmax_kept > nmax):
+            raise ValueError(f"Compression nmax must be between 1 and nmax for each species. nmax={nmax_kept}")
+        kept = radial_order < nmax_kept[radial_species]
+        keep &= kept[n1] & kept[n2]
+    if 'lmax' in compression:
+        if compression['lmax'] < 0 or compression['lmax'] > lmax:
+            raise ValueError(f"Compression lmax must be between 0 and {lmax}. lmax={compression['lmax']}")
+        keep &= l <= compression['lmax']
+    indices = np.flatnonzero(keep)
+    if len(indices) == 0:
+        raise ValueError("Compression does not keep any components")
+
+    projection = compression.get('projection')
+    if projection is not None:
+        projection = np.array(projection, dtype=float, order='C')
+        if projection.ndim != 2 or projection.shape[0] != len(indices):
+            raise ValueError(
+                f"Projection must have shape ({len(indices)}, n_out). Shape: {projection.shape}"
+            )
+    return indices, projection
+
+def compress_turbosoap_descriptor(config, soap, axis=-1):
+    """Applies the compression of a configuration to kernel output.
+    Args:
+        config (dict): Output of prepare_turbosoap_configuration.
+        soap (np.ndarray): Uncompressed descriptors or derivatives.
+        axis (int): Axis of the components.
+    Returns:
+        np.ndarray: The compressed array, or soap itself without compression.
+    """
+    if config['compression_indices'] is None:
+        return soap
+    soap = np.take(soap, config['compression_indices'], axis=axis)
+    if config['projection'] is not None:
+        soap = np.moveaxis(np.tensordot(soap, config['projection'], axes=([axis], [0])), -1, axis)
+    return soap
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental descriptor updates for Monte Carlo and molecular dynamics.
+
+When only a few atoms move between calls, only the descriptors of the moved
+atoms and of the atoms that have them within their cutoff change. The
+calculator keeps a Verlet neighbour list built with the cutoffs plus a skin,
+and its reverse, and recomputes just those sites, so a local move costs
+O(neighbours) kernel work instead of O(N). Callers which know the moved
+atoms can pass them to skip the O(N) comparison of the positions.
+"""
+
+import numpy as np
+
+from turbosoap_dscribe import build_turbosoap_pairs, calculate_turbosoap_from_pairs
+from turbosoap_dscribe.neighbors import get_neighbor_list, get_periodic_neighbor_list
+
+class IncrementalTurboSOAP:
+    """Keeps the TurboSOAP descriptors of a structure up to date.
+
+    The neighbour list includes all pairs within rcut + skin and is reused
+    until some atom has moved more than skin/2 since it was built. The
+    structure may change positions and atomic numbers between calls. Any
+    change of the number of atoms, the cell or the periodicity triggers a
+    full recalculation.
+    """
+    def __init__(self, config, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts, skin=0.5):
+        """
+        Args:
+            config (dict): Output of prepare_turbosoap_configuration.
+            periodic (bool): Whether to use periodic boundary conditions.
+            atomic_numbers_to_indices (dict): Species index of each atomic number.
+            atomic_numbers_to_rcuts (dict): Cutoff of each atomic number.
+            skin (float): Verlet skin of the neighbour list in angstroms.
+        """
+        if skin < 0.0:
+            raise ValueError(f"Skin cannot be negative. skin={skin}")
+        self.config = config
+        self.periodic = periodic
+        self.atomic_numbers_to_indices = atomic_numbers_to_indices
+        self.atomic_numbers_to_rcuts = atomic_numbers_to_rcuts
+        self.skin = skin
+        self.soap = None
+        #Sites recomputed by the latest call
+        self.updated = None
+        self.n_builds = 0
+
+    def calculate(self, system, moved=None):
+        """Calculates the descriptors, recomputing only the changed sites.
+        Args:
+            system (ase.Atoms): The structure.
+            moved (iterable): Indices of the only atoms whose positions or
+                atomic numbers may have changed since the previous call,
+                e.g. the atoms of a Monte Carlo move. Skips comparing all
+                the positions, changes of other atoms are not seen.
+        Returns:
+            np.ndarray: Descriptors, shape (n_sites, num_components). The
+            array is updated in place by later calls, copy it to keep it.
+        """
+        if self.soap is None or not self._same_cell(system):
+            self._build(system)
+            self.soap = np.empty((len(system), self.config['num_components']))
+            changed = np.arange(len(system))
+            affected = changed
+        else:
+            if moved is None:
+                candidates = np.arange(len(system))
+            else:
+                candidates = np.unique(np.asarray(moved, dtype=int))
+            positions = system.positions[candidates]
+            numbers = system.numbers[candidates]
+            is_changed = np.any(positions != self._positions[candidates], axis=1) | (numbers != self._numbers[candidates])
+            changed = candidates[is_changed]
+            affected = self._affected(changed)
+            self._positions[changed] = positions[is_changed]
+            #After every call all atoms are within skin/2 of where the list
+            #was built, so only the changed atoms need to be checked
+            displacement = np.linalg.norm(self._positions[changed] - self._built_positions[changed], axis=1)
+            if (numbers[is_changed] != self._numbers[changed]).any() or (displacement > 0.5*self.skin).any():
+                #An atom may have crossed the skin. Sites which lost a
+                #neighbour were found from the old list above.
+                self._build(system)
+                affected = np.union1d(affected, self._affected(changed))
+
+        if len(affected):
+            self._calculate_sites(system.positions, affected)
+        self.updated = affected
+        return self.soap
+
+    def _same_cell(self, system):
+        return (len(system) == len(self._numbers)
+            and np.array_equal(np.asarray(system.cell), self._cell)
+            and np.array_equal(system.pbc, self._pbc))
+
+    def _build(self, system):
+        self._species = np.array([self.atomic_numbers_to_indices[n] for n in system.numbers], dtype=int)
+        self._rcuts = np.array([self.atomic_numbers_to_rcuts[n] for n in system.numbers], dtype=float)
+        positions = np.array(system.positions)
+        if self.periodic:
+            n_neigh, neighbors, shifts = get_periodic_neighbor_list(
+                positions, system.cell, system.pbc, self._rcuts + self.skin)
+        else:
+            n_neigh, neighbors = get_neighbor_list(positions, self._rcuts + self.skin)
+            shifts = None
+        self._n_neigh = n_neigh
+        self._first = np.cumsum(n_neigh) - n_neigh
+        self._neighbors = neighbors
+        self._shifts = shifts
+        #Reverse lists: the sites having each atom in their list
+        centers = np.repeat(np.arange(len(n_neigh)), n_neigh)
+        self._reverse_centers = centers[np.argsort(neighbors, kind='stable')]
+        self._reverse_counts = np.bincount(neighbors, minlength=len(n_neigh))
+        self._reverse_first = np.cumsum(self._reverse_counts) - self._reverse_counts
+        self._built_positions = positions
+        self._positions = positions.copy()
+        self._numbers = np.array(system.numbers)
+        self._cell = np.array(system.cell)
+        self._pbc = np.array(system.pbc)
+        self.n_builds += 1
+
+    def _affected(self, changed):
+        #Changed atoms and every site which has one of them in its list
+        if len(changed) == 0:
+            return changed
+        counts = self._reverse_counts[changed]
+        block_starts = np.cumsum(counts) - counts
+        entries = np.repeat(self._reverse_first[changed] - block_starts, counts) + np.arange(counts.sum())
+        return np.union1d(changed, self._reverse_centers[entries])
+
+    def _calculate_sites(self, positions, sites):
+        counts = self._n_neigh[sites]
+        #Indices of the list entries of the sites, block by block
+        block_starts = np.cumsum(counts) - counts
+        entries = np.repeat(self._first[sites] - block_starts, counts) + np.arange(counts.sum())
+        centers = np.repeat(sites, counts)
+        neighbors = self._neighbors[entries]
+        vectors = positions[neighbors] - positions[centers]
+        if self._shifts is not None:
+            shifts = self._shifts[entries]
+            vectors += shifts
+        #Drop the skin. The central atom entries have zero length.
+        rcuts = self._rcuts[centers]
+        keep = np.einsum('ij,ij->i', vectors, vectors) <= rcuts*rcuts
+        n_neigh = np.bincount(np.repeat(np.arange(len(sites)), counts)[keep], minlength=len(sites))
+
+        pairs = build_turbosoap_pairs(positions, self._species, len(self.atomic_numbers_to_indices),
+            n_neigh, neighbors[keep], None if self._shifts is None else shifts[keep], sites=sites)
+        self.soap[sites] = calculate_turbosoap_from_pairs(self.config, pairs)
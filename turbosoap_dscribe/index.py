@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Nearest environment search over stored descriptors.
+
+The similarity is the dot product of the normalised descriptors, the
+zeta=1 polynomial kernel, so the nearest environments of a query are
+also the nearest for any zeta. Without lists every search is exact and
+runs over blocks of the stored vectors. With n_lists the vectors are
+clustered around n_lists centroids (an inverted file index) and a search
+only scans the lists of the n_probe centroids closest to each query.
+This is approximate, more probes give a better recall.
+
+    index = EnvironmentIndex(num_components, n_lists=1024)
+    index.train(sample)
+    index.add(soap)
+    ids, similarities = index.search(queries, k=10, n_probe=16)
+    index.save(path)
+    index = EnvironmentIndex.load(path)
+
+Loaded indices are memory-mapped, a list is only read into memory when
+vectors are added to it.
+"""
+
+import json
+import os
+
+import numpy as np
+
+#Stored vectors compared with the queries at once
+BLOCK_ROWS = 65536
+
+#Training vectors per centroid used by train
+TRAINING_POINTS = 256
+
+class EnvironmentIndex:
+    """Index of normalised descriptors with integer ids."""
+    def __init__(self, num_components, n_lists=None, dtype=np.float32):
+        """
+        Args:
+            num_components (int): Length of the descriptors.
+            n_lists (int): Number of clusters of the approximate search.
+                None for exact search.
+            dtype (np.dtype): Data type of the stored vectors.
+        """
+        if n_lists is not None and n_lists < 1:
+            raise ValueError(f"n_lists must be positive. n_lists={n_lists}")
+        self.num_components = num_components
+        self.n_lists = n_lists
+        self.dtype = np.dtype(dtype)
+        self.centroids = None
+        #Vectors and ids of each list, the first counts rows are in use
+        self._vectors = [np.empty((0, num_components), dtype=self.dtype) for _ in range(n_lists or 1)]
+        self._ids = [np.empty(0, dtype=np.int64) for _ in range(n_lists or 1)]
+        self._counts = np.zeros(n_lists or 1, dtype=np.int64)
+        self._next_id = 0
+
+    def __len__(self):
+        return int(self._counts.sum())
+
+    @property
+    def is_trained(self):
+        return self.n_lists is None or self.centroids is not None
+
+    def train(self, x, n_iterations=20, seed=0):
+        """Finds the centroids of the lists with spherical k-means.
+        Args:
+            x (np.ndarray): Training descriptors, at least n_lists of them.
+                At most TRAINING_POINTS per list are used.
+            n_iterations (int): Number of k-means iterations.
+            seed (int): Seed of the sampling and initialisation.
+        """
+        if self.n_lists is None:
+            return
+        if len(self):
+            raise ValueError("The index can only be trained before vectors are added")
+        if len(x) < self.n_lists:
+            raise ValueError(f"At least {self.n_lists} training vectors are needed, got {len(x)}")
+        rng = np.random.default_rng(seed)
+        if len(x) > TRAINING_POINTS*self.n_lists:
+            x = x[np.sort(rng.choice(len(x), TRAINING_POINTS*self.n_lists, replace=False))]
+        x = self._normalized(x)
+        centroids = x[rng.choice(len(x), self.n_lists, replace=False)]
+        for _ in range(n_iterations):
+            assignment = self._nearest_lists(x, centroids, 1)[:, 0]
+            order = np.argsort(assignment, kind='stable')
+            counts = np.bincount(assignment, minlength=self.n_lists)
+            sums = np.zeros(centroids.shape)
+            starts = np.cumsum(counts) - counts
+            sums[counts > 0] = np.add.reduceat(x[order], starts[counts > 0], axis=0)
+            #Empty clusters restart from random training vectors
+            empty = counts == 0
+            sums[empty] = x[rng.choice(len(x), empty.sum())]
+            centroids = self._normalized(sums)
+        self.centroids = centroids
+
+    def add(self, x, ids=None):
+        """Adds descriptors to the index.
+        Args:
+            x (np.ndarray): Descriptors, shape (n, num_components).
+            ids (np.ndarray): Ids of the descriptors. Defaults to
+                consecutive integers after the largest id so far.
+        Returns:
+            np.ndarray: Ids of the added descriptors.
+        """
+        if not self.is_trained:
+            raise ValueError("The index must be trained before vectors are added")
+        if x.ndim != 2 or x.shape[1] != self.num_components:
+            raise ValueError(f"Descriptors must have shape (n, {self.num_components}). Shape: {x.shape}")
+        if ids is None:
+            ids = np.arange(self._next_id, self._next_id + len(x), dtype=np.int64)
+        else:
+            ids = np.asarray(ids, dtype=np.int64)
+            if ids.shape != (len(x),):
+                raise ValueError(f"Expected {len(x)} ids, got shape {ids.shape}")
+        if len(ids):
+            self._next_id = max(self._next_id, int(ids.max()) + 1)
+        for start in range(0, len(x), BLOCK_ROWS):
+            block = self._normalized(x[start:start + BLOCK_ROWS])
+            block_ids = ids[start:start + BLOCK_ROWS]
+            if self.n_lists is None:
+                self._append(0, block, block_ids)
+                continue
+            assignment = self._nearest_lists(block, self.centroids, 1)[:, 0]
+            order = np.argsort(assignment, kind='stable')
+            bounds = np.searchsorted(assignment[order], np.arange(self.n_lists + 1))
+            for l in np.flatnonzero(np.diff(bounds)):
+                rows = order[bounds[l]:bounds[l + 1]]
+                self._append(l, block[rows], block_ids[rows])
+        return ids
+
+    def search(self, queries, k=1, n_probe=1):
+        """Finds the most similar stored descriptors of every query.
+        Args:
+            queries (np.ndarray): Descriptors, shape (n, num_components).
+            k (int): Number of neighbours.
+            n_probe (int): Number of lists scanned per query. Ignored
+                for exact search.
+        Returns:
+            ids (np.ndarray): Ids of the neighbours, shape (n, k), most
+                similar first. -1 if fewer than k vectors were scanned.
+            similarities (np.ndarray): Dot products of the normalised
+                descriptors, shape (n, k). -inf for missing neighbours.
+        """
+        if not self.is_trained:
+            raise ValueError("The index must be trained before searching")
+        if k < 1:
+            raise ValueError(f"k must be positive. k={k}")
+        queries = self._normalized(queries)
+        n_queries = len(queries)
+        ids = np.full((n_queries, k), -1, dtype=np.int64)
+        similarities = np.full((n_queries, k), -np.inf, dtype=self.dtype)
+        if self.n_lists is None:
+            probes = np.zeros((n_queries, 1), dtype=int)
+        else:
+            probes = self._nearest_lists(queries, self.centroids, min(n_probe, self.n_lists))
+        #Every list is scanned once for all queries probing it
+        lists = probes.ravel()
+        order = np.argsort(lists, kind='stable')
+        query_rows = order // probes.shape[1]
+        bounds = np.searchsorted(lists[order], np.arange(len(self._counts) + 1))
+        for l in np.flatnonzero(np.diff(bounds)):
+            rows = query_rows[bounds[l]:bounds[l + 1]]
+            vectors = self._vectors[l]
+            list_ids = self._ids[l]
+            for start in range(0, self._counts[l], BLOCK_ROWS):
+                stop = min(start + BLOCK_ROWS, self._counts[l])
+                block = queries[rows] @ vectors[start:stop].T
+                _merge_top_k(ids, similarities, rows, block, list_ids[start:stop])
+        return ids, similarities
+
+    def save(self, path):
+        """Writes the index to a new directory.
+        Args:
+            path (str): Directory of the index.
+        """
+        os.makedirs(path)
+        info = {'num_components': self.num_components, 'n_lists': self.n_lists,
+            'dtype': self.dtype.str, 'next_id': self._next_id}
+        with open(os.path.join(path, 'index.json'), 'w') as f:
+            json.dump(info, f)
+        #The lists one after another, in the order of the centroids
+        offsets = np.concatenate([[0], np.cumsum(self._counts)])
+        np.save(os.path.join(path, 'offsets.npy'), offsets)
+        vectors = np.lib.format.open_memmap(os.path.join(path, 'vectors.npy'), mode='w+',
+            dtype=self.dtype, shape=(int(offsets[-1]), int(self.num_components)))
+        ids = np.empty(offsets[-1], dtype=np.int64)
+        for l, count in enumerate(self._counts):
+            vectors[offsets[l]:offsets[l + 1]] = self._vectors[l][:count]
+            ids[offsets[l]:offsets[l + 1]] = self._ids[l][:count]
+        vectors.flush()
+        del vectors
+        np.save(os.path.join(path, 'ids.npy'), ids)
+        if self.centroids is not None:
+            np.save(os.path.join(path, 'centroids.npy'), self.centroids)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Reads an index written by save.
+        Args:
+            path (str): Directory of the index.
+            mmap (bool): Whether to memory-map the vectors.
+        Returns:
+            EnvironmentIndex: The index.
+        """
+        with open(os.path.join(path, 'index.json')) as f:
+            info = json.load(f)
+        index = cls(info['num_components'], info['n_lists'], info['dtype'])
+        index._next_id = info['next_id']
+        if index.n_lists is not None:
+            index.centroids = np.load(os.path.join(path, 'centroids.npy'))
+        offsets = np.load(os.path.join(path, 'offsets.npy'))
+        vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r' if mmap else None)
+        ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode='r' if mmap else None)
+        for l in range(len(offsets) - 1):
+            #Views of the files until vectors are added to the list
+            index._vectors[l] = vectors[offsets[l]:offsets[l + 1]]
+            index._ids[l] = ids[offsets[l]:offsets[l + 1]]
+        index._counts = np.diff(offsets)
+        return index
+
+    def _append(self, l, vectors, ids):
+        #Appends to list l, growing its buffers with some headroom
+        count = self._counts[l]
+        needed = count + len(vectors)
+        if needed > len(self._vectors[l]) or not self._vectors[l].flags.writeable:
+            size = max(needed, int(1.5*len(self._vectors[l])))
+            grown = np.empty((size, self.num_components), dtype=self.dtype)
+            grown[:count] = self._vectors[l][:count]
+            grown_ids = np.empty(size, dtype=np.int64)
+            grown_ids[:count] = self._ids[l][:count]
+            self._vectors[l] = grown
+            self._ids[l] = grown_ids
+        self._vectors[l][count:needed] = vectors
+        self._ids[l][count:needed] = ids
+        self._counts[l] = needed
+
+    def _normalized(self, x):
+        x = np.array(x, dtype=self.dtype)
+        if x.ndim != 2 or x.shape[1] != self.num_components:
+            raise ValueError(f"Descriptors must have shape (n, {self.num_components}). Shape: {x.shape}")
+        norms = np.sqrt((x*x).sum(axis=1))
+        x /= np.where(norms > 0.0, norms, 1.0)[:, None]
+        return x
+
+    @staticmethod
+    def _nearest_lists(x, centroids, n_probe):
+        #Indices of the n_probe most similar centroids of every row
+        similarities = x @ centroids.T
+        if n_probe == 1:
+            return np.argmax(similarities, axis=1)[:, None]
+        if n_probe >= similarities.shape[1]:
+            return np.argsort(-similarities, axis=1)
+        top = np.argpartition(-similarities, n_probe - 1, axis=1)[:, :n_probe]
+        order = np.argsort(-np.take_along_axis(similarities, top, axis=1), axis=1)
+        return np.take_along_axis(top, order, axis=1)
+
+def _merge_top_k(ids, similarities, rows, block, block_ids):
+    #Merges the similarities of a block of stored vectors into the current
+    #top k of the query rows
+    k = ids.shape[1]
+    if block.shape[1] > k:
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        block = np.take_along_axis(block, top, axis=1)
+        block_ids = block_ids[top]
+    else:
+        block_ids = np.broadcast_to(block_ids, block.shape)
+    candidates = np.concatenate([similarities[rows], block], axis=1)
+    candidate_ids = np.concatenate([ids[rows], block_ids], axis=1)
+    order = np.argsort(-candidates, axis=1, kind='stable')[:, :k]
+    similarities[rows] = np.take_along_axis(candidates, order, axis=1)
+    ids[rows] = np.take_along_axis(candidate_ids, order, axis=1)
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+Similarity kernels between descriptors.
+
+The local kernel between two environments is the polynomial SOAP kernel
+(q.q')^zeta of the normalised descriptors. The kernels are computed over
+blocks of rows of the first set, so the descriptors can be a memmap, e.g.
+the descriptors of a DescriptorStore, and reductions such as the row sums
+or the k nearest neighbours never store the full matrix. Row blocks run
+in a thread pool, numpy releases the GIL in the matrix products.
+
+Structure kernels take the descriptors and offsets of many structures,
+as returned by calculate_turbosoap_descriptors, or a DescriptorStore.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from turbosoap_dscribe.store import DescriptorStore
+
+#Rows of the first set per block. The block of the kernel matrix is
+#BLOCK_ROWS times the size of the second set.
+BLOCK_ROWS = 1024
+
+def polynomial_kernel(a, b, zeta=2, normalize=True, dtype=float, block_rows=BLOCK_ROWS, n_threads=1, out=None):
+    """Calculates the kernel matrix between two sets of environments.
+    Args:
+        a (np.ndarray): Descriptors, shape (n, num_components), or a
+            DescriptorStore.
+        b (np.ndarray): Descriptors, shape (m, num_components), or a
+            DescriptorStore, e.g. the sparse set.
+        zeta (float): Exponent of the kernel.
+        normalize (bool): Whether to normalise the descriptors to unit
+            length first.
+        dtype (np.dtype): Data type of the calculation, float64 or float32.
+        block_rows (int): Rows of a calculated at once.
+        n_threads (int): Number of threads running the blocks.
+        out (np.ndarray): Array of shape (n, m) to write the kernel into,
+            e.g. a memmap.
+    Returns:
+        np.ndarray: Kernel matrix, shape (n, m).
+    """
+    a, b = _get_descriptors(a), _get_descriptors(b)
+    if out is None:
+        out = np.empty((len(a), len(b)), dtype=dtype)
+    elif out.shape != (len(a), len(b)):
+        raise ValueError(f"out must have shape {(len(a), len(b))}. out.shape={out.shape}")
+    for start, stop, block in _iter_blocks(a, b, zeta, normalize, dtype, block_rows, n_threads):
+        out[start:stop] = block
+    return out
+
+def kernel_row_sums(a, b, zeta=2, normalize=True, dtype=float, block_rows=BLOCK_ROWS, n_threads=1):
+    """Calculates the sums over b of the kernel of every environment of a.
+
+    Takes the arguments of polynomial_kernel.
+    Returns:
+        np.ndarray: Row sums of the kernel matrix, shape (n,).
+    """
+    a, b = _get_descriptors(a), _get_descriptors(b)
+    sums = np.empty(len(a), dtype=dtype)
+    for start, stop, block in _iter_blocks(a, b, zeta, normalize, dtype, block_rows, n_threads):
+        sums[start:stop] = block.sum(axis=1)
+    return sums
+
+def kernel_top_k(a, b, k, zeta=2, normalize=True, dtype=float, block_rows=BLOCK_ROWS, n_threads=1):
+    """Finds the k environments of b most similar to every environment of a.
+
+    Takes the arguments of polynomial_kernel.
+    Returns:
+        indices (np.ndarray): Indices into b, shape (n, k), most similar
+            first.
+        values (np.ndarray): Kernel values, shape (n, k).
+    """
+    a, b = _get_descriptors(a), _get_descriptors(b)
+    if k < 1 or k > len(b):
+        raise ValueError(f"k must be between 1 and {len(b)}. k={k}")
+    indices = np.empty((len(a), k), dtype=int)
+    values = np.empty((len(a), k), dtype=dtype)
+    for start, stop, block in _iter_blocks(a, b, zeta, normalize, dtype, block_rows, n_threads):
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_values = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_values, axis=1, kind='stable')
+        indices[start:stop] = np.take_along_axis(top, order, axis=1)
+        values[start:stop] = np.take_along_axis(top_values, order, axis=1)
+    return indices, values
+
+def farthest_point_sampling(x, n, zeta=2, start=0, dtype=float, block_rows=BLOCK_ROWS, n_threads=1):
+    """Selects sparse points greedily, each farthest from the ones before.
+
+    The distance is the kernel induced distance
+    d(i, j)^2 = k(i, i) + k(j, j) - 2 k(i, j) of the normalised polynomial
+    kernel. Every step calculates one kernel column in blocks.
+    Args:
+        x (np.ndarray): Descriptors, shape (n_points, num_components), or
+            a DescriptorStore.
+        n (int): Number of points to select.
+        zeta (float): Exponent of the kernel.
+        start (int): Index of the first point.
+    Returns:
+        np.ndarray: Indices of the selected points in selection order.
+    """
+    x = _get_descriptors(x)
+    if n < 1 or n > len(x):
+        raise ValueError(f"n must be between 1 and {len(x)}. n={n}")
+    selected = [start]
+    distances = np.full(len(x), np.inf)
+    for _ in range(n - 1):
+        #k(i, i) = 1 for normalised descriptors
+        column = kernel_row_sums(x, x[selected[-1:]], zeta, True, dtype, block_rows, n_threads)
+        np.minimum(distances, 2.0 - 2.0*column, out=distances)
+        distances[selected[-1]] = -np.inf
+        selected.append(int(np.argmax(distances)))
+    return np.array(selected)
+
+def cur_selection(x, n, n_components=None, block_rows=BLOCK_ROWS):
+    """Selects the n points with the largest statistical leverage scores.
+
+    The scores are the squared norms of the rows of the first n_components
+    left singular vectors of x. Only the covariance matrix is stored, x is
+    read in blocks twice.
+    Args:
+        x (np.ndarray): Descriptors, shape (n_points, num_components), or
+            a DescriptorStore.
+        n (int): Number of points to select.
+        n_components (int): Number of singular vectors. Defaults to n.
+    Returns:
+        np.ndarray: Indices of the selected points, highest score first.
+    """
+    x = _get_descriptors(x)
+    if n < 1 or n > len(x):
+        raise ValueError(f"n must be between 1 and {len(x)}. n={n}")
+    if n_components is None:
+        n_components = n
+    n_components = min(n_components, x.shape[1])
+    covariance = np.zeros((x.shape[1], x.shape[1]))
+    for start in range(0, len(x), block_rows):
+        block = np.asarray(x[start:start + block_rows], dtype=float)
+        covariance += block.T @ block
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    eigenvalues = eigenvalues[::-1][:n_components]
+    eigenvectors = eigenvectors[:, ::-1][:, :n_components]
+    #Directions without variance do not contribute
+    keep = eigenvalues > eigenvalues[0]*1e-12
+    projection = eigenvectors[:, keep]/np.sqrt(eigenvalues[keep])
+    scores = np.empty(len(x))
+    for start in range(0, len(x), block_rows):
+        u = np.asarray(x[start:start + block_rows], dtype=float) @ projection
+        scores[start:start + block_rows] = (u*u).sum(axis=1)
+    return np.argsort(-scores, kind='stable')[:n]
+
+def average_kernel(a, b, offsets_a=None, offsets_b=None, zeta=1, normalize=True, dtype=float,
+    block_rows=BLOCK_ROWS, n_threads=1):
+    """Calculates the average structure kernel.
+
+    K(A, B) is the mean of the local kernels between the environments of
+    the structures A and B, normalised so that K(A, A) = 1.
+    Args:
+        a (np.ndarray): Stacked descriptors of the first structures, or a
+            DescriptorStore.
+        b (np.ndarray): Stacked descriptors of the second structures, or a
+            DescriptorStore.
+        offsets_a (np.ndarray): Rows offsets_a[i]:offsets_a[i+1] of a are
+            the i:th structure. Not needed for a store.
+        offsets_b (np.ndarray): Offsets of b.
+        zeta (float): Exponent of the local kernel.
+    Returns:
+        np.ndarray: Kernel matrix, shape (n_structures_a, n_structures_b).
+    """
+    a, offsets_a = _get_structures(a, offsets_a)
+    b, offsets_b = _get_structures(b, offsets_b)
+    kernel = _sum_kernel(a, offsets_a, b, offsets_b, zeta, normalize, dtype, block_rows, n_threads)
+    kernel_a = _self_sum_kernel(a, offsets_a, zeta, normalize, dtype, block_rows, n_threads)
+    kernel_b = _self_sum_kernel(b, offsets_b, zeta, normalize, dtype, block_rows, n_threads)
+    return _normalize_kernel(kernel, kernel_a, kernel_b)
+
+def rematch_kernel(a, b, offsets_a=None, offsets_b=None, zeta=1, gamma=0.1, normalize=True, n_threads=1,
+    max_iterations=1000, tolerance=1e-9):
+    """Calculates the regularised entropy match (REMatch) structure kernel.
+
+    K(A, B) = sum_ij P_ij k(a_i, b_j), where P is the transport plan with
+    uniform marginals regularised by gamma times its entropy, found with
+    Sinkhorn iterations. Large gamma approaches the average kernel, small
+    gamma the best match. The result is normalised so that K(A, A) = 1.
+    Args:
+        a, b, offsets_a, offsets_b: Structures as in average_kernel.
+        zeta (float): Exponent of the local kernel.
+        gamma (float): Entropy regularisation.
+        n_threads (int): Number of threads running pairs of structures.
+        max_iterations (int): Maximum number of Sinkhorn iterations.
+        tolerance (float): Convergence threshold of the marginals.
+    Returns:
+        np.ndarray: Kernel matrix, shape (n_structures_a, n_structures_b).
+    """
+    if gamma <= 0.0:
+        raise ValueError(f"gamma must be positive. gamma={gamma}")
+    if max_iterations < 1:
+        raise ValueError(f"max_iterations must be positive. max_iterations={max_iterations}")
+    a, offsets_a = _get_structures(a, offsets_a)
+    b, offsets_b = _get_structures(b, offsets_b)
+    structures_a = [_normalized(a[i:j], normalize, float) for i, j in zip(offsets_a[:-1], offsets_a[1:])]
+    structures_b = [_normalized(b[i:j], normalize, float) for i, j in zip(offsets_b[:-1], offsets_b[1:])]
+
+    def rematch(x, y):
+        return _rematch(np.power(x @ y.T, zeta), gamma, max_iterations, tolerance)
+
+    def row(i):
+        return [rematch(structures_a[i], y) for y in structures_b]
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        kernel = np.array(list(executor.map(row, range(len(structures_a)))), dtype=float)
+        kernel_a = np.array(list(executor.map(lambda x: rematch(x, x), structures_a)))
+        kernel_b = np.array(list(executor.map(lambda y: rematch(y, y), structures_b)))
+    return _normalize_kernel(kernel.reshape(len(structures_a), len(structures_b)), kernel_a, kernel_b)
+
+def _normalize_kernel(kernel, kernel_a, kernel_b):
+    #K(A, B)/sqrt(K(A, A) K(B, B)), zero for empty structures
+    norms = np.sqrt(np.outer(kernel_a, kernel_b))
+    return np.divide(kernel, norms, out=np.zeros_like(kernel), where=norms > 0.0)
+
+def _rematch(local, gamma, max_iterations, tolerance):
+    #Sinkhorn iterations in the log domain, which stays stable for small gamma
+    n, m = local.shape
+    if n == 0 or m == 0:
+        return 0.0
+    log_k = (local - local.max())/gamma
+    log_u = np.zeros(n)
+    log_v = np.zeros(m)
+    log_a = np.full(n, -np.log(n))
+    log_b = np.full(m, -np.log(m))
+    for _ in range(max_iterations):
+        log_u = log_a - _logsumexp(log_k + log_v[None, :], axis=1)
+        log_v = log_b - _logsumexp(log_k + log_u[:, None], axis=0)
+        plan = np.exp(log_k + log_u[:, None] + log_v[None, :])
+        if np.abs(plan.sum(axis=1) - 1.0/n).max() < tolerance:
+            break
+    return float((plan*local).sum())
+
+def _logsumexp(x, axis):
+    top = x.max(axis=axis, keepdims=True)
+    return np.log(np.exp(x - top).sum(axis=axis)) + np.squeeze(top, axis=axis)
+
+def _sum_kernel(a, offsets_a, b, offsets_b, zeta, normalize, dtype, block_rows, n_threads):
+    #Sums of the local kernels over the environments of pairs of structures
+    kernel = np.zeros((len(offsets_a) - 1, len(offsets_b) - 1))
+    structure_a = np.repeat(np.arange(len(offsets_a) - 1), np.diff(offsets_a))
+    #Structures without environments are left out of the reduction and
+    #keep a zero kernel
+    columns = np.flatnonzero(np.diff(offsets_b) > 0)
+    if len(columns) == 0:
+        return kernel
+    for start, stop, block in _iter_blocks(a, b, zeta, normalize, dtype, block_rows, n_threads):
+        block = np.add.reduceat(block, offsets_b[columns], axis=1)
+        #Structures of the rows of the block are consecutive
+        rows = structure_a[start:stop]
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        kernel[np.ix_(rows[starts], columns)] += np.add.reduceat(block, starts, axis=0)
+    counts = np.outer(np.diff(offsets_a), np.diff(offsets_b))
+    return kernel/np.maximum(counts, 1)
+
+def _self_sum_kernel(x, offsets, zeta, normalize, dtype, block_rows, n_threads):
+    #Diagonal of _sum_kernel(x, x), structure by structure
+    values = np.empty(len(offsets) - 1)
+    for i, (start, stop) in enumerate(zip(offsets[:-1], offsets[1:])):
+        block = polynomial_kernel(x[start:stop], x[start:stop], zeta, normalize, dtype, block_rows, n_threads)
+        values[i] = block.sum()/max((stop - start)**2, 1)
+    return values
+
+def _iter_blocks(a, b, zeta, normalize, dtype, block_rows, n_threads):
+    #Yields (start, stop, kernel block) of the rows of a in order
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float64, np.float32):
+        raise ValueError(f"dtype must be float64 or float32. dtype={dtype}")
+    if a.shape[1] != b.shape[1]:
+        raise ValueError(f"Descriptors have different lengths: {a.shape[1]} and {b.shape[1]}")
+    b = _normalized(b, normalize, dtype)
+
+    def block(start):
+        x = _normalized(a[start:start + block_rows], normalize, dtype)
+        k = x @ b.T
+        if zeta != 1:
+            np.power(k, zeta, out=k)
+        return start, min(start + block_rows, len(a)), k
+
+    starts = range(0, len(a), block_rows)
+    if n_threads == 1:
+        for start in starts:
+            yield block(start)
+    else:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            #At most two blocks per thread are pending at a time
+            pending = []
+            for start in starts:
+                pending.append(executor.submit(block, start))
+                if len(pending) >= 2*n_threads:
+                    yield pending.pop(0).result()
+            for future in pending:
+                yield future.result()
+
+def _normalized(x, normalize, dtype):
+    x = np.array(x, dtype=dtype)
+    if normalize:
+        norms = np.sqrt((x*x).sum(axis=1))
+        #Zero descriptors stay zero
+        x /= np.where(norms > 0.0, norms, 1.0)[:, None]
+    return x
+
+def _get_descriptors(x):
+    if isinstance(x, DescriptorStore):
+        return x.descriptors
+    return x
+
+def _get_structures(x, offsets):
+    if isinstance(x, DescriptorStore):
+        return x.descriptors, np.asarray(x.offsets)
+    if offsets is None:
+        raise ValueError("Offsets are needed for stacked descriptors")
+    return x, np.asarray(offsets)
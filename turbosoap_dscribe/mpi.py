@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Distributed descriptors with MPI.
+
+Needs mpi4py. Many structures are distributed over the ranks whole, one
+large structure is split into contiguous chunks of sites. The structures
+are balanced by atom count, the chunks by their expected number of
+neighbour pairs. Every rank computes its share with the serial code, the
+neighbour lists of a chunk included. The results are gathered to the root
+rank, or written by every rank straight into a DescriptorStore on a shared
+file system.
+
+Run e.g. with
+
+    mpirun -n 4 python script.py
+
+Every function must be called on all ranks of the communicator. The
+returned report holds the per-rank compute times and atom counts and the
+imbalance max(time)/mean(time) - 1.
+"""
+
+import heapq
+import os
+import time
+
+import numpy as np
+
+from turbosoap_dscribe import (calculate_turbosoap_descriptor, get_turbosoap_pairs,
+    calculate_turbosoap_from_pairs)
+from turbosoap_dscribe.store import DescriptorStore, NPY_HEADER_SIZE, get_structure_hash
+
+def calculate_turbosoap_descriptors_mpi(config, systems, periodic,
+    atomic_numbers_to_indices, atomic_numbers_to_rcuts, comm=None, out=None, scatter=True, root=0):
+    """Calculates the TurboSOAP descriptors of many structures on all ranks.
+    Args:
+        config (dict): Output of prepare_turbosoap_configuration.
+        systems (sequence): ase.Atoms structures. With scatter, only needed
+            on the root rank. Otherwise every rank must have the same
+            sequence, e.g. read from the same file, and nothing is sent.
+        periodic (bool): Whether to use periodic boundary conditions.
+        atomic_numbers_to_indices (dict): Species index of each atomic number.
+        atomic_numbers_to_rcuts (dict): Cutoff of each atomic number.
+        comm (mpi4py.MPI.Comm): Communicator. Defaults to COMM_WORLD.
+        out (str): If given, a DescriptorStore is created at this path and
+            every rank writes its rows into it.
+        scatter (bool): Whether the root rank sends the structures.
+        root (int): Rank which holds the structures and gets the results.
+    Returns:
+        soap (np.ndarray): On the root rank and without out, the stacked
+            descriptors in input order. None otherwise.
+        offsets (np.ndarray): Row offsets of the structures.
+        report (dict): Timing report, see the module documentation.
+    """
+    comm = _get_comm(comm)
+    rank = comm.Get_rank()
+    if scatter:
+        counts = comm.bcast([len(s) for s in systems] if rank == root else None, root=root)
+    else:
+        counts = [len(s) for s in systems]
+    assignment = balance_by_atoms(counts, comm.Get_size())
+    offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+
+    if scatter:
+        if rank == root:
+            parts = [[systems[i] for i in indices] for indices in assignment]
+        else:
+            parts = None
+        local_systems = comm.scatter(parts, root=root)
+    else:
+        local_systems = [systems[i] for i in assignment[rank]]
+
+    t0 = time.perf_counter()
+    local = [calculate_turbosoap_descriptor(config, system, periodic,
+        atomic_numbers_to_indices, atomic_numbers_to_rcuts) for system in local_systems]
+    elapsed = time.perf_counter() - t0
+    report = _get_report(comm, elapsed, sum(len(s) for s in local_systems))
+
+    if out is not None:
+        keys = [get_structure_hash(system) for system in local_systems]
+        keys = comm.gather(keys, root=root)
+        if rank == root:
+            key_list = [None]*len(counts)
+            for indices, rank_keys in zip(assignment, keys):
+                for i, key in zip(indices, rank_keys):
+                    key_list[i] = key
+        _write_store(comm, out, config, counts, key_list if rank == root else None,
+            [(offsets[i], soap_m) for i, soap_m in zip(assignment[rank], local)], root)
+        return None, offsets, report
+
+    gathered = comm.gather(local, root=root)
+    if rank != root:
+        return None, offsets, report
+    soap = np.empty((offsets[-1], config['num_components']))
+    for indices, blocks in zip(assignment, gathered):
+        for i, soap_m in zip(indices, blocks):
+            soap[offsets[i]:offsets[i+1]] = soap_m
+    return soap, offsets, report
+
+def calculate_turbosoap_descriptor_mpi(config, system, periodic,
+    atomic_numbers_to_indices, atomic_numbers_to_rcuts, comm=None, out=None, root=0):
+    """Calculates the TurboSOAP descriptor of one large structure on all ranks.
+
+    Every rank builds the neighbour lists and runs the kernel only for a
+    contiguous range of sites. The ranges have about the same sum of
+    rcut**3 over their atoms, proportional to the expected number of
+    pairs at uniform density. The neighbour search of a rank is cheapest
+    when its atoms are close together, e.g. for spatially sorted atoms.
+    Args:
+        config (dict): Output of prepare_turbosoap_configuration.
+        system (ase.Atoms): The structure. Only needed on the root rank.
+        periodic (bool): Whether to use periodic boundary conditions.
+        atomic_numbers_to_indices (dict): Species index of each atomic number.
+        atomic_numbers_to_rcuts (dict): Cutoff of each atomic number.
+        comm (mpi4py.MPI.Comm): Communicator. Defaults to COMM_WORLD.
+        out (str): If given, a DescriptorStore is created at this path and
+            every rank writes its rows into it.
+        root (int): Rank which holds the structure and gets the result.
+    Returns:
+        soap_m (np.ndarray): On the root rank and without out, the
+            descriptors, shape (n_sites, num_components). None otherwise.
+        report (dict): Timing report, see the module documentation.
+    """
+    comm = _get_comm(comm)
+    rank = comm.Get_rank()
+    system = comm.bcast(system if rank == root else None, root=root)
+
+    rcuts = np.array([atomic_numbers_to_rcuts[n] for n in system.numbers], dtype=float)
+    weights = np.concatenate([[0.0], np.cumsum(rcuts**3)])
+    #Site ranges of about equal expected numbers of pairs, possibly empty
+    targets = np.linspace(0.0, weights[-1], comm.Get_size() + 1)[1:-1]
+    bounds = np.concatenate([[0], np.searchsorted(weights[1:], targets, side='right'), [len(system)]])
+    start, stop = bounds[rank], bounds[rank + 1]
+
+    t0 = time.perf_counter()
+    local_pairs = get_turbosoap_pairs(system, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts,
+        centers=np.arange(start, stop))
+    soap_m = calculate_turbosoap_from_pairs(config, local_pairs)
+    elapsed = time.perf_counter() - t0
+    report = _get_report(comm, elapsed, stop - start)
+
+    if out is not None:
+        _write_store(comm, out, config, [len(system)],
+            [get_structure_hash(system)] if rank == root else None, [(start, soap_m)], root)
+        return None, report
+    gathered = comm.gather(soap_m, root=root)
+    if rank != root:
+        return None, report
+    return np.concatenate(gathered), report
+
+def balance_by_atoms(counts, n_ranks):
+    """Distributes structures over ranks, largest first to the least loaded.
+    Args:
+        counts (iterable): Number of atoms of each structure.
+        n_ranks (int): Number of ranks.
+    Returns:
+        list: Indices of the structures of each rank, in increasing order.
+    """
+    counts = np.asarray(counts)
+    heap = [(0, r) for r in range(n_ranks)]
+    assignment = [[] for _ in range(n_ranks)]
+    for i in np.argsort(-counts, kind='stable'):
+        load, r = heapq.heappop(heap)
+        assignment[r].append(int(i))
+        heapq.heappush(heap, (load + int(counts[i]), r))
+    return [sorted(indices) for indices in assignment]
+
+def _get_comm(comm):
+    if comm is not None:
+        return comm
+    try:
+        from mpi4py import MPI
+    except ImportError:
+        raise ImportError("turbosoap_dscribe.mpi needs mpi4py") from None
+    return MPI.COMM_WORLD
+
+def _get_report(comm, elapsed, n_atoms):
+    times = np.array(comm.allgather(elapsed))
+    atoms = np.array(comm.allgather(n_atoms))
+    mean = times.mean()
+    return {'times': times, 'atoms': atoms,
+        'imbalance': times.max()/mean - 1.0 if mean > 0.0 else 0.0}
+
+def _write_store(comm, path, config, counts, keys, blocks, root):
+    #The root rank allocates the store, then every rank writes its
+    #(first row, descriptors) blocks with MPI-IO
+    from mpi4py import MPI
+    if comm.Get_rank() == root:
+        with DescriptorStore(path, 'w', config=config) as store:
+            store.reserve(counts, keys)
+    comm.Barrier()
+    row_bytes = config['num_components']*np.dtype(float).itemsize
+    f = MPI.File.Open(comm, os.path.join(path, 'descriptors.npy'), MPI.MODE_WRONLY)
+    try:
+        for row, soap_m in blocks:
+            f.Write_at(NPY_HEADER_SIZE + int(row)*row_bytes, np.ascontiguousarray(soap_m, dtype=float))
+    finally:
+        f.Close()
+    comm.Barrier()
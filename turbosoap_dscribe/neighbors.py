@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Neighbour list construction for TurboSOAP.
+
+The lists are returned in the CSR-like layout used by soap.f90: n_neigh
+holds the number of entries of each central atom, the central atom
+included, and the flat neighbour array holds for each central atom first
+the atom itself and then its neighbours in increasing index order.
+"""
+
+import numpy as np
+
+#Number of central atoms queried at once. Bounds the size of the
+#temporary pair arrays for very large systems.
+CHUNK_SIZE = 8192
+
+#Below this number of atom pairs all distances are computed directly,
+#which is much cheaper than building k-d trees for small molecules.
+DENSE_PAIRS = 4096
+
+def get_neighbor_list(positions, rcuts, chunk_size=CHUNK_SIZE, centers=None):
+    """Builds neighbour lists with a separate cutoff for every central atom.
+
+    Central atoms are grouped by cutoff and each group is queried against
+    a k-d tree of all atoms with its own radius, so species with short
+    cutoffs do not pay for the largest one. Within a group the central
+    atoms are processed in spatially sorted chunks, which bounds the
+    temporary memory to chunk_size atoms worth of pairs.
+    Args:
+        positions (np.ndarray): Cartesian positions, shape (n_atoms, 3).
+        rcuts (np.ndarray): Cutoff of each central atom.
+        chunk_size (int): Number of central atoms queried at once.
+        centers (np.ndarray): Indices of the central atoms. Defaults to
+            all atoms in order.
+    Returns:
+        n_neigh (np.ndarray): Number of entries for each central atom,
+            the central atom included.
+        neighbors (np.ndarray): Flat neighbour indices. Each block of
+            n_neigh entries starts with the central atom itself.
+    """
+    positions = np.asarray(positions, dtype=float)
+    rcuts = np.asarray(rcuts, dtype=float)
+    assert len(rcuts) == len(positions)
+    return _get_csr_pairs(positions, positions, rcuts, chunk_size, centers)
+
+def get_periodic_neighbor_list(positions, cell, pbc, rcuts, chunk_size=CHUNK_SIZE, centers=None):
+    """Builds neighbour lists under periodic boundary conditions.
+
+    Periodic images are generated from lattice translations only where they
+    can fall within the largest cutoff of some atom, so only the original
+    atoms are central atoms. Works for triclinic cells and for cutoffs
+    larger than half of the cell, in which case an atom can see several
+    images of the same neighbour, itself included.
+    Args:
+        positions (np.ndarray): Cartesian positions, shape (n_atoms, 3).
+        cell (np.ndarray): Lattice vectors as rows, shape (3, 3).
+        pbc (iterable): Periodicity along each lattice vector.
+        rcuts (np.ndarray): Cutoff of each central atom.
+        chunk_size (int): Number of central atoms queried at once.
+        centers (np.ndarray): Indices of the central atoms. Defaults to
+            all atoms in order. Only images near them are generated.
+    Returns:
+        n_neigh (np.ndarray): Number of entries for each central atom,
+            the central atom included.
+        neighbors (np.ndarray): Flat indices of the original atoms of
+            which the neighbours are images.
+        shifts (np.ndarray): Cartesian lattice translation of every
+            neighbour, shape (n_atom_pairs, 3). The neighbour is at
+            positions[neighbors] + shifts.
+    """
+    positions = np.asarray(positions, dtype=float)
+    cell = np.asarray(cell, dtype=float)
+    rcuts = np.asarray(rcuts, dtype=float)
+    n_atoms = len(positions)
+    assert len(rcuts) == n_atoms
+    pbc = np.asarray(pbc, dtype=bool)
+    if n_atoms == 0 or not pbc.any() or (centers is not None and len(centers) == 0):
+        n_neigh, neighbors = get_neighbor_list(positions, rcuts, chunk_size, centers)
+        return n_neigh, neighbors, np.zeros((len(neighbors), 3))
+
+    #Distance between lattice planes is 1/|b| for the reciprocal vector b,
+    #so a cutoff spans rcut*|b| in fractional coordinates.
+    inv_cell = np.linalg.inv(_complete_cell(cell, pbc))
+    scaled = positions @ inv_cell
+    if centers is None:
+        reach = np.max(rcuts) * np.linalg.norm(inv_cell, axis=0)
+        lower = scaled.min(axis=0) - reach
+        upper = scaled.max(axis=0) + reach
+    else:
+        #Images are only needed around the central atoms
+        reach = np.max(rcuts[centers]) * np.linalg.norm(inv_cell, axis=0)
+        lower = scaled[centers].min(axis=0) - reach
+        upper = scaled[centers].max(axis=0) + reach
+    #Translations which can bring any atom into the window. The positions
+    #need not be wrapped into the cell.
+    first = np.where(pbc, np.floor(lower - scaled.max(axis=0)), 0).astype(int)
+    last = np.where(pbc, np.ceil(upper - scaled.min(axis=0)), 0).astype(int)
+    #Slightly conservative window, the k-d tree does the exact check
+    margin = 1e-8*(upper - lower)
+    lower -= margin
+    upper += margin
+
+    ranges = [np.append(np.arange(0, m + 1), np.arange(n, 0)) for n, m in zip(first, last)]
+    image_atoms = [np.arange(n_atoms)]
+    image_shifts = [np.zeros((n_atoms, 3))]
+    for m0 in ranges[0]:
+        for m1 in ranges[1]:
+            for m2 in ranges[2]:
+                if m0 == 0 and m1 == 0 and m2 == 0:
+                    continue
+                translation = np.array([m0, m1, m2])
+                shifted = scaled + translation
+                inside = np.all((shifted >= lower) & (shifted <= upper), axis=1)
+                if inside.any():
+                    image_atoms.append(np.flatnonzero(inside))
+                    image_shifts.append(np.tile(np.dot(translation, cell), (inside.sum(), 1)))
+    image_atoms = np.concatenate(image_atoms)
+    image_shifts = np.concatenate(image_shifts)
+    image_positions = positions[image_atoms] + image_shifts
+
+    #The original atoms come first so central atom i is image i
+    n_neigh, images = _get_csr_pairs(positions, image_positions, rcuts, chunk_size, centers)
+    return n_neigh, image_atoms[images], image_shifts[images]
+
+def _complete_cell(cell, pbc):
+    #Non-periodic directions may have zero lattice vectors. Replace them by
+    #unit vectors orthogonal to the others so that the cell can be inverted.
+    missing = np.linalg.norm(cell, axis=1) == 0.0
+    if not missing.any():
+        return cell
+    if (missing & pbc).any():
+        raise ValueError(f"Periodic lattice vectors cannot be zero. Cell: {cell.tolist()}")
+    n_defined = 3 - missing.sum()
+    _, _, vt = np.linalg.svd(cell[~missing])
+    cell = cell.copy()
+    cell[missing] = vt[n_defined:]
+    return cell
+
+def _get_csr_pairs(positions, points, rcuts, chunk_size, centers=None):
+    #Finds for every central atom positions[centers[i]] the points within
+    #rcuts[centers[i]] and returns the CSR lists of point indices. Point j
+    #is assumed to be atom j itself for j < len(positions), so the central
+    #atom is excluded.
+    if centers is not None:
+        #Only the points that can be within the cutoff of some central
+        #atom enter the search, so the cost follows the number of centers
+        positions = positions[centers]
+        rcuts = rcuts[centers]
+        if len(centers) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        reach = rcuts.max()
+        near = np.flatnonzero(np.all((points >= positions.min(axis=0) - reach)
+            & (points <= positions.max(axis=0) + reach), axis=1))
+        #Every central atom is near itself, so it has a local index
+        local = np.searchsorted(near, centers)
+        n_neigh, neighbors = _get_csr_pairs_of(positions, points[near], rcuts, chunk_size, local)
+        neighbors = near[neighbors]
+        return n_neigh, neighbors
+    return _get_csr_pairs_of(positions, points, rcuts, chunk_size, np.arange(len(positions)))
+
+def _get_csr_pairs_of(positions, points, rcuts, chunk_size, self_points):
+    #_get_csr_pairs for central atoms at positions, which are the points
+    #self_points
+    n_sites = len(positions)
+    if n_sites*len(points) <= DENSE_PAIRS:
+        return _get_dense_csr_pairs(positions, points, rcuts, self_points)
+    from scipy.spatial import cKDTree
+    tree = cKDTree(points)
+    counts = np.zeros(n_sites, dtype=int)
+    blocks = []
+    for rcut in np.unique(rcuts):
+        sites = np.flatnonzero(rcuts == rcut)
+        #Spatially coherent chunks keep the dual tree traversal efficient
+        cells = np.floor((positions[sites] - positions.min(axis=0))/rcut).astype(int)
+        sites = sites[np.lexsort(cells.T)]
+        for start in range(0, len(sites), chunk_size):
+            chunk = sites[start:start + chunk_size]
+            pairs = cKDTree(positions[chunk]).sparse_distance_matrix(
+                tree, rcut, output_type='ndarray')
+            row = chunk[pairs['i']]
+            col = pairs['j']
+            keep = col != self_points[row]
+            row = row[keep]
+            col = col[keep]
+            order = np.lexsort((col, row))
+            row = row[order]
+            col = col[order]
+            counts += np.bincount(row, minlength=n_sites)
+            blocks.append((row, col))
+
+    n_neigh = counts + 1
+    first = np.cumsum(n_neigh) - n_neigh
+    neighbors = np.empty(n_neigh.sum(), dtype=int)
+    neighbors[first] = self_points
+    for row, col in blocks:
+        #Rank of each pair within its (sorted) row of the block
+        rank = np.arange(len(row)) - np.searchsorted(row, row)
+        neighbors[first[row] + 1 + rank] = col
+    return n_neigh, neighbors
+
+def _get_dense_csr_pairs(positions, points, rcuts, self_points):
+    #_get_csr_pairs_of from the full distance matrix
+    n_sites = len(positions)
+    d = positions[:, None, :] - points[None, :, :]
+    d = d*d
+    within = d[:, :, 0] + d[:, :, 1] + d[:, :, 2] <= (rcuts*rcuts)[:, None]
+    within[np.arange(n_sites), self_points] = False
+    #Row major order gives the neighbours of each row in increasing order
+    row, col = np.nonzero(within)
+    n_neigh = np.bincount(row, minlength=n_sites) + 1
+    neighbors = np.empty(len(row) + n_sites, dtype=int)
+    neighbors[np.cumsum(n_neigh) - n_neigh] = self_points
+    #Every row before the current one adds one slot for its central atom
+    neighbors[np.arange(len(row)) + row + 1] = col
+    return n_neigh, neighbors
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk descriptor store.
+
+A store is a directory with
+    descriptors.npy: all descriptor rows, structure after structure,
+    offsets.npy: rows offsets[i]:offsets[i+1] belong to the i:th structure,
+    keys.npy, key_order.npy: structure hashes and their sorted order,
+    metadata.json: the descriptor configuration and user metadata.
+The arrays are standard .npy files, so the descriptors open as a memory
+map in constant time and slices are read without loading the rest.
+"""
+
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+#Fixed size of the .npy header. Large enough for any 2D shape, so the
+#header can be rewritten in place when the store grows.
+NPY_HEADER_SIZE = 128
+
+def get_structure_hash(system):
+    """Hashes the atomic numbers, positions, cell and periodicity.
+    Args:
+        system (ase.Atoms): The structure.
+    Returns:
+        str: Hexadecimal SHA-1 digest.
+    """
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(system.numbers, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(system.positions, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(system.cell, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(system.pbc, dtype=bool).tobytes())
+    return h.hexdigest()
+
+class DescriptorStore:
+    """Memory-mapped descriptor store indexed by structure.
+
+    Opened with mode 'r' the store is read-only and the descriptors are a
+    memory map. Modes 'w' (create or truncate) and 'a' (append) allow
+    adding structures. The index and the header of the descriptor file are
+    written by close(), also when used as a context manager.
+    """
+    def __init__(self, path, mode='r', config=None, metadata=None, dtype=float):
+        """
+        Args:
+            path (str): Directory of the store.
+            mode (str): 'r', 'w' or 'a'.
+            config (dict): Output of prepare_turbosoap_configuration.
+                Required when creating a store.
+            metadata (dict): Additional JSON serializable information.
+            dtype (np.dtype): Data type of the stored descriptors.
+        """
+        if mode not in ('r', 'w', 'a'):
+            raise ValueError(f"Mode must be 'r', 'w' or 'a'. mode={mode}")
+        self.path = path
+        self.mode = mode
+        self._file = None
+        if mode == 'w' or (mode == 'a' and not os.path.exists(self._filename('metadata.json'))):
+            if config is None:
+                raise ValueError("A configuration is needed to create a descriptor store")
+            os.makedirs(path, exist_ok=True)
+            self.config = config
+            self.metadata = metadata if metadata is not None else {}
+            self.dtype = np.dtype(dtype)
+            self.num_components = int(config['num_components'])
+            self._offsets = [0]
+            self._keys = []
+            self._file = open(self._filename('descriptors.npy'), 'wb')
+            self._file.write(_npy_header((0, self.num_components), self.dtype))
+            self._write_index()
+            return
+
+        with open(self._filename('metadata.json')) as f:
+            info = json.load(f)
+        self.config = _decode(info['config'])
+        self.metadata = info['metadata']
+        self.dtype = np.dtype(info['dtype'])
+        self.num_components = info['num_components']
+        if mode == 'r':
+            self.descriptors = np.load(self._filename('descriptors.npy'), mmap_mode='r')
+            self.offsets = np.load(self._filename('offsets.npy'), mmap_mode='r')
+            self.keys = np.load(self._filename('keys.npy'), mmap_mode='r')
+            self._key_order = np.load(self._filename('key_order.npy'), mmap_mode='r')
+        else:
+            self._offsets = np.load(self._filename('offsets.npy')).tolist()
+            self._keys = np.load(self._filename('keys.npy')).tolist()
+            self._file = open(self._filename('descriptors.npy'), 'r+b')
+            self._file.seek(NPY_HEADER_SIZE + self._offsets[-1]*self.num_components*self.dtype.itemsize)
+            self._file.truncate()
+
+    def _filename(self, name):
+        return os.path.join(self.path, name)
+
+    def append(self, soap_m, system=None, key=None):
+        """Adds the descriptors of one structure.
+        Args:
+            soap_m (np.ndarray): Descriptors, shape (n_sites, num_components).
+            system (ase.Atoms): The structure, used for the default key.
+            key (str): Key of the structure. Defaults to get_structure_hash.
+        """
+        if self._file is None:
+            raise ValueError("Descriptor store is not open for writing")
+        if soap_m.ndim != 2 or soap_m.shape[1] != self.num_components:
+            raise ValueError(f"Descriptors must have shape (n_sites, {self.num_components}). Shape: {soap_m.shape}")
+        if key is None:
+            if system is None:
+                raise ValueError("Either the structure or its key is needed")
+            key = get_structure_hash(system)
+        if isinstance(key, str):
+            key = key.encode()
+        self._file.write(np.ascontiguousarray(soap_m, dtype=self.dtype).data)
+        self._offsets.append(self._offsets[-1] + len(soap_m))
+        self._keys.append(key)
+
+    def reserve(self, counts, keys):
+        """Adds structures whose descriptors are written later in place.
+
+        The descriptor file is extended with space for the new rows, which
+        can then be filled concurrently, e.g. by several processes writing
+        their own rows at NPY_HEADER_SIZE + row*row_bytes.
+        Args:
+            counts (iterable): Number of sites of each new structure.
+            keys (iterable): Key of each new structure.
+        Returns:
+            np.ndarray: Row offsets of the new structures, one more than
+            the number of structures.
+        """
+        if self._file is None:
+            raise ValueError("Descriptor store is not open for writing")
+        keys = [key.encode() if isinstance(key, str) else key for key in keys]
+        counts = np.asarray(counts, dtype=np.int64)
+        if len(counts) != len(keys):
+            raise ValueError(f"Got {len(counts)} counts and {len(keys)} keys")
+        offsets = self._offsets[-1] + np.concatenate([[0], np.cumsum(counts)])
+        self._offsets.extend(offsets[1:].tolist())
+        self._keys.extend(keys)
+        self._file.truncate(NPY_HEADER_SIZE + offsets[-1]*self.num_components*self.dtype.itemsize)
+        self._file.seek(0, os.SEEK_END)
+        return offsets
+
+    def close(self):
+        """Writes the index and the header. Does nothing in read mode."""
+        if self._file is None:
+            return
+        self._file.seek(0)
+        self._file.write(_npy_header((self._offsets[-1], self.num_components), self.dtype))
+        self._file.close()
+        self._file = None
+        self._write_index()
+
+    def _write_index(self):
+        keys = np.array(self._keys, dtype=bytes)
+        np.save(self._filename('offsets.npy'), np.array(self._offsets, dtype=np.int64))
+        np.save(self._filename('keys.npy'), keys)
+        np.save(self._filename('key_order.npy'), np.argsort(keys, kind='stable'))
+        info = {'config': _encode(self.config), 'metadata': self.metadata,
+            'dtype': self.dtype.str, 'num_components': self.num_components}
+        with open(self._filename('metadata.json'), 'w') as f:
+            json.dump(info, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets) - 1 if self.mode == 'r' else len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        """Descriptors of the i:th structure as a view of the memory map."""
+        self._check_readable()
+        return self.descriptors[self.offsets[i]:self.offsets[i+1]]
+
+    def index(self, key):
+        """Position of the first structure with the given key."""
+        self._check_readable()
+        key = key.encode() if isinstance(key, str) else key
+        i = np.searchsorted(self.keys, key, sorter=self._key_order)
+        if i == len(self._key_order) or self.keys[self._key_order[i]] != key:
+            raise KeyError(key)
+        return int(self._key_order[i])
+
+    def get(self, system=None, key=None):
+        """Descriptors of a structure given the structure or its key."""
+        if key is None:
+            key = get_structure_hash(system)
+        return self[self.index(key)]
+
+    def __contains__(self, key):
+        try:
+            self.index(key)
+        except KeyError:
+            return False
+        return True
+
+    def _check_readable(self):
+        if self.mode != 'r':
+            raise ValueError("Descriptor store must be opened with mode 'r' to read it")
+
+def _npy_header(shape, dtype):
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (np.dtype(dtype).str, tuple(shape))
+    #magic, version, header length, padded header terminated by a newline
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+def _encode(config):
+    #JSON representation of a configuration, keeping the array types
+    encoded = {}
+    for k, v in config.items():
+        if isinstance(v, np.ndarray):
+            v = {'array': v.tolist(), 'dtype': v.dtype.str}
+        elif isinstance(v, np.generic):
+            v = v.item()
+        encoded[k] = v
+    return encoded
+
+def _decode(encoded):
+    config = {}
+    for k, v in encoded.items():
+        if isinstance(v, dict) and set(v) == {'array', 'dtype'}:
+            v = np.array(v['array'], dtype=v['dtype'])
+        config[k] = v
+    return config
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming descriptors for long trajectories.
+
+Frames are read lazily and only the descriptors of the current frame are
+held in memory, so the memory use does not grow with the trajectory length.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from turbosoap_dscribe import get_turbosoap_pairs, calculate_turbosoap_from_pairs
+from turbosoap_dscribe.store import DescriptorStore
+
+def iter_turbosoap_descriptors(config, frames, periodic,
+    atomic_numbers_to_indices, atomic_numbers_to_rcuts, prefetch=True):
+    """Yields the TurboSOAP descriptors of each frame.
+
+    With prefetch the next frame is read and its neighbour lists are built
+    in a background thread while the kernel runs on the current frame. The
+    overlap is complete only when the Fortran extension releases the GIL,
+    otherwise mostly the file reading is hidden.
+    Args:
+        config (dict): Output of prepare_turbosoap_configuration.
+        frames (iterable): ase.Atoms frames, e.g. from ase.io.iread.
+        periodic (bool): Whether to use periodic boundary conditions.
+        atomic_numbers_to_indices (dict): Species index of each atomic number.
+        atomic_numbers_to_rcuts (dict): Cutoff of each atomic number.
+        prefetch (bool): Whether to prepare the next frame in the background.
+    Yields:
+        np.ndarray: Descriptors of a frame, shape (n_sites, num_components).
+    """
+    for system, soap_m in _iter_frames(config, frames, periodic,
+        atomic_numbers_to_indices, atomic_numbers_to_rcuts, prefetch):
+        yield soap_m
+
+def _iter_frames(config, frames, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts, prefetch):
+    #Yields the frames together with their descriptors
+    frames = iter(frames)
+    def prepare_next():
+        for system in frames:
+            return system, get_turbosoap_pairs(system, periodic,
+                atomic_numbers_to_indices, atomic_numbers_to_rcuts)
+        return None
+
+    if not prefetch:
+        prepared = prepare_next()
+        while prepared is not None:
+            system, pairs = prepared
+            yield system, calculate_turbosoap_from_pairs(config, pairs)
+            prepared = prepare_next()
+        return
+
+    #A single worker so that the frame iterator is never used concurrently
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(prepare_next)
+        while True:
+            prepared = future.result()
+            if prepared is None:
+                return
+            future = executor.submit(prepare_next)
+            system, pairs = prepared
+            yield system, calculate_turbosoap_from_pairs(config, pairs)
+
+def featurize_trajectory(filename, config, periodic, atomic_numbers_to_indices,
+    atomic_numbers_to_rcuts, index=':', out=None, prefetch=True, **kwargs):
+    """Calculates the descriptors of a trajectory file frame by frame.
+    Args:
+        filename (str): Trajectory file, any format ase.io.iread can read.
+        config (dict): Output of prepare_turbosoap_configuration.
+        periodic (bool): Whether to use periodic boundary conditions.
+        atomic_numbers_to_indices (dict): Species index of each atomic number.
+        atomic_numbers_to_rcuts (dict): Cutoff of each atomic number.
+        index (str or slice): Frames to read, passed to ase.io.iread.
+        out (str, file or DescriptorStore): If given, the descriptors are
+            written as they are produced. A file receives raw C-ordered
+            float64 rows of num_components values, which can be read back
+            with np.memmap(out, dtype=float, mode='r').reshape(-1, num_components).
+            A store open for writing receives each frame keyed by its hash.
+        prefetch (bool): Whether to prepare the next frame in the background.
+        **kwargs: Passed to ase.io.iread.
+    Returns:
+        generator or np.ndarray: Without out, a generator of the per-frame
+        descriptors. With out, the row offsets of the frames in the file,
+        rows offsets[i]:offsets[i+1] belong to the i:th frame.
+    """
+    import ase.io
+    frames = ase.io.iread(filename, index=index, **kwargs)
+    if out is None:
+        return iter_turbosoap_descriptors(config, frames, periodic,
+            atomic_numbers_to_indices, atomic_numbers_to_rcuts, prefetch=prefetch)
+
+    if isinstance(out, DescriptorStore):
+        counts = [0]
+        for system, soap_m in _iter_frames(config, frames, periodic,
+            atomic_numbers_to_indices, atomic_numbers_to_rcuts, prefetch):
+            out.append(soap_m, system=system)
+            counts.append(len(soap_m))
+        return np.cumsum(counts)
+
+    blocks = iter_turbosoap_descriptors(config, frames, periodic,
+        atomic_numbers_to_indices, atomic_numbers_to_rcuts, prefetch=prefetch)
+
+    if hasattr(out, 'write'):
+        return _write_blocks(blocks, out)
+    with open(out, 'wb') as f:
+        return _write_blocks(blocks, f)
+
+def _write_blocks(blocks, f):
+    counts = [0]
+    for soap_m in blocks:
+        f.write(np.ascontiguousarray(soap_m).data)
+        counts.append(len(soap_m))
+    return np.cumsum(counts)
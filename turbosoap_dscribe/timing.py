@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Per-stage timings of the descriptor calculation.
+
+    with collect_timings() as timings:
+        calculate_turbosoap_descriptor(...)
+    print(timings.summary())
+
+The stages are
+    'neighbors': neighbour lists, periodic images included,
+    'pairs': spherical coordinates and species masks of the pairs,
+    'kernel': the Fortran get_soap, summed over chunks and threads,
+    'post': compressing and converting the kernel output, only when
+        the kernel cannot write the output in place.
+Every stage accumulates the number of calls, the time, the number of
+sites and atom pairs and the bytes of the arrays it allocated. The same
+Timings can be passed to several collect_timings blocks to aggregate
+over them. Without an active collect_timings the hooks only check an
+empty list.
+"""
+
+from contextlib import contextmanager
+import threading
+import time
+
+#Active collectors, all of them receive every stage
+_collectors = []
+
+class Timings:
+    """Accumulated per-stage timings and counts.
+
+    stages maps a stage name to a dict with 'calls', 'time' (seconds),
+    'n_sites', 'n_atom_pairs' and 'nbytes'.
+    """
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, elapsed, n_sites=0, n_atom_pairs=0, nbytes=0):
+        """Adds one call of a stage."""
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = {'calls': 0, 'time': 0.0, 'n_sites': 0, 'n_atom_pairs': 0, 'nbytes': 0}
+                self.stages[name] = stats
+            stats['calls'] += 1
+            stats['time'] += elapsed
+            stats['n_sites'] += n_sites
+            stats['n_atom_pairs'] += n_atom_pairs
+            stats['nbytes'] += nbytes
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+
+    def summary(self):
+        """The timings as a text table."""
+        total = sum(stats['time'] for stats in self.stages.values())
+        lines = [f"{'stage':<10} {'calls':>7} {'time [s]':>10} {'share':>6} "
+            f"{'n_sites':>10} {'n_atom_pairs':>13} {'MiB':>9}"]
+        for name, stats in self.stages.items():
+            share = stats['time']/total if total > 0.0 else 0.0
+            lines.append(f"{name:<10} {stats['calls']:>7} {stats['time']:>10.4f} {share:>6.1%} "
+                f"{stats['n_sites']:>10} {stats['n_atom_pairs']:>13} {stats['nbytes']/2**20:>9.1f}")
+        return "\n".join(lines)
+
+class _Stage:
+    __slots__ = ('name', 'counts', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = {}
+
+    def update(self, **counts):
+        self.counts.update(counts)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        for timings in _collectors:
+            timings.add(self.name, elapsed, **self.counts)
+        return False
+
+class _NullStage:
+    __slots__ = ()
+
+    def update(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+def timed_stage(name):
+    """Context manager which times a stage for the active collectors.
+
+    The stage object has update(n_sites=..., n_atom_pairs=..., nbytes=...)
+    to record its counts.
+    """
+    if not _collectors:
+        return _NULL_STAGE
+    return _Stage(name)
+
+@contextmanager
+def collect_timings(timings=None):
+    """Collects the stage timings of all calculations within the block.
+    Args:
+        timings (Timings): Accumulate into these timings. A new object by
+            default.
+    Yields:
+        Timings: The timings, filled in as the stages finish.
+    """
+    if timings is None:
+        timings = Timings()
+    _collectors.append(timings)
+    try:
+        yield timings
+    finally:
+        _collectors.remove(timings)
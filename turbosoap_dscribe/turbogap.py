@@ -1,11 +1,39 @@
+"""
+Cross-validation against the TurboGAP binary.
+
+Every TurboGAP run happens in its own temporary directory, so runs do not
+collide and many structures can be checked concurrently. Each structure
+is a separate TurboGAP process, so its start-up cost is paid once per
+structure. turbogap_cmd can point to any local stand-in which reads the
+same input files and writes soap.dat, e.g. a particular TurboGAP build.
+"""
 import os
-import ase.io
-from ase.data import chemical_symbols
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from turbosoap_dscribe import calculate_turbosoap_descriptor
 
 TURBOGAP_CMD = "turbogap"
 
 def write_turbogap_input_files(filename, system_filename, system, desc, atomic_numbers_to_indices, idx=None):
-    ase.io.write(system_filename, system)
+    """Writes the TurboGAP input file and the structure it reads.
+    Args:
+        filename (str): Path of the input file.
+        system_filename (str): Path of the structure, relative to the
+            directory of the input file.
+        system (ase.Atoms): The structure.
+        desc (dict): Output of prepare_turbosoap_configuration.
+        atomic_numbers_to_indices (dict): Species index of each atomic number.
+        idx (int): Only calculate the descriptor of this atom, counted
+            from 0.
+    """
+    #ase is only needed here, importing it with the module is slow
+    import ase.io
+    from ase.data import chemical_symbols
+    ase.io.write(os.path.join(os.path.dirname(filename), system_filename), system)
 
     def write_iterable(f, name, iterable):
         f.write(f"{name} = ")
@@ -17,7 +45,7 @@ def write_turbogap_input_files(filename, system_filename, system, desc, atomic_n
     for k,v in atomic_numbers_to_indices.items():
         species[v] = chemical_symbols[k]
 
-    with open(filename, 'w') as f: 
+    with open(filename, 'w') as f:
         f.write(f"input_file = {system_filename}\n")
         f.write(f"num_species = {desc['num_species']}\n")
         write_iterable(f, "species", species )
@@ -30,6 +58,7 @@ def write_turbogap_input_files(filename, system_filename, system, desc, atomic_n
         write_iterable(f, "atom_sigma_r_scaling", desc['atom_sigma_r_scaling'])
         write_iterable(f, "atom_sigma_t_scaling", desc['atom_sigma_t_scaling'])
         write_iterable(f, "amplitude_scaling", desc['amplitude_scaling'])
+        write_iterable(f, "radial_enhancement", desc['radial_enhancement'])
         write_iterable(f, "global_scaling", desc['global_scaling'])
         write_iterable(f, "n_max", desc['nmax'])
         f.write(f"l_max = {desc['lmax']}\n")
@@ -40,11 +69,93 @@ def write_turbogap_input_files(filename, system_filename, system, desc, atomic_n
 
         f.write(f"ase_format = .true.\nscaling_mode = {desc['scaling_mode']}\nbasis = {desc['basis']}\ntiming = .true.\n")
 
-def run_turbogap(system, soap, idx=None, turbogap_cmd=TURBOGAP_CMD):
-    write_turbogap_input_files("input", "input.xyz", system, soap, idx=idx)
-    subprocess.run([turbogap_cmd], shell=True, check=True)
-    result = np.loadtxt("soap.dat", skiprows=1)
-    os.remove("input")
-    os.remove("soap.dat")
-    os.remove("input.xyz")
-    return result
\ No newline at end of file
+def run_turbogap(system, soap, idx=None, turbogap_cmd=TURBOGAP_CMD, atomic_numbers_to_indices=None):
+    """Calculates the descriptors with TurboGAP in a temporary directory.
+    Args:
+        system (ase.Atoms): The structure.
+        soap (dict): Output of prepare_turbosoap_configuration.
+        idx (int): Only calculate the descriptor of this atom, counted
+            from 0.
+        turbogap_cmd (str or list): The TurboGAP executable, or a command
+            line as a list. Not run through a shell.
+        atomic_numbers_to_indices (dict): Species index of each atomic
+            number. Defaults to the atomic numbers of the structure in
+            increasing order.
+    Returns:
+        np.ndarray: Descriptors, shape (n_sites, num_kernel_components).
+    """
+    if atomic_numbers_to_indices is None:
+        atomic_numbers_to_indices = {int(z): i for i, z in enumerate(np.unique(system.numbers))}
+    return _run_turbogap(system, soap, atomic_numbers_to_indices, idx, turbogap_cmd)[0]
+
+def _run_turbogap(system, soap, atomic_numbers_to_indices, idx, turbogap_cmd):
+    #run_turbogap which also returns the structure as TurboGAP read it,
+    #with the positions rounded by the structure file
+    import ase.io
+    if isinstance(turbogap_cmd, str):
+        turbogap_cmd = [turbogap_cmd]
+    with tempfile.TemporaryDirectory(prefix="turbogap") as directory:
+        write_turbogap_input_files(os.path.join(directory, "input"), "input.xyz", system, soap,
+            atomic_numbers_to_indices, idx=idx)
+        written = ase.io.read(os.path.join(directory, "input.xyz"))
+        result = subprocess.run(list(turbogap_cmd), cwd=directory, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(turbogap_cmd)} failed with exit code {result.returncode}:\n"
+                f"{result.stderr.decode(errors='replace')}")
+        return read_soap_dat(os.path.join(directory, "soap.dat"), len(system) if idx is None else 1), written
+
+def read_soap_dat(filename, n_sites):
+    """Reads the descriptors written by TurboGAP.
+    Args:
+        filename (str): Path of soap.dat.
+        n_sites (int): Number of descriptors in the file.
+    Returns:
+        np.ndarray: Descriptors, shape (n_sites, num_kernel_components).
+    """
+    with open(filename, 'rb') as f:
+        f.readline() #header
+        #One split of the whole file instead of parsing line by line
+        values = np.array(f.read().split(), dtype=float)
+    return values.reshape(n_sites, -1)
+
+def compare_with_turbogap(config, systems, periodic, atomic_numbers_to_indices, atomic_numbers_to_rcuts,
+    idx=None, turbogap_cmd=TURBOGAP_CMD, n_jobs=None):
+    """Compares the descriptors of many structures with TurboGAP.
+
+    The TurboGAP runs of the structures go concurrently, one process per
+    structure, each in its own temporary directory. The in-process
+    descriptors are calculated one structure at a time in the calling
+    thread as the runs finish, for the structure read back from the file
+    given to TurboGAP, so both see the same rounded positions.
+    Args:
+        config (dict): Output of prepare_turbosoap_configuration, without
+            compression.
+        systems (iterable): ase.Atoms structures.
+        periodic (bool): Whether to use periodic boundary conditions in
+            the in-process calculation. Should match how TurboGAP treats
+            the structures.
+        atomic_numbers_to_indices (dict): Species index of each atomic number.
+        atomic_numbers_to_rcuts (dict): Cutoff of each atomic number.
+        idx (int): Only compare the descriptor of this atom, counted from 0.
+        turbogap_cmd (str or list): The TurboGAP executable or stand-in.
+        n_jobs (int): Number of TurboGAP processes run at once. Defaults
+            to the number of CPUs.
+    Returns:
+        np.ndarray: Largest absolute difference of each structure.
+    """
+    if config['compression_indices'] is not None:
+        raise ValueError("TurboGAP writes uncompressed descriptors, use a configuration without compression")
+
+    def run(system):
+        return _run_turbogap(system, config, atomic_numbers_to_indices, idx, turbogap_cmd)
+
+    errors = []
+    #The threads only wait for the TurboGAP processes
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count()) as executor:
+        for reference, written in executor.map(run, systems):
+            soap_m = calculate_turbosoap_descriptor(config, written, periodic, atomic_numbers_to_indices,
+                atomic_numbers_to_rcuts, centers=idx)
+            if reference.shape != soap_m.shape:
+                raise ValueError(f"TurboGAP descriptors have shape {reference.shape}, expected {soap_m.shape}")
+            errors.append(np.abs(reference - soap_m).max(initial=0.0))
+    return np.array(errors)